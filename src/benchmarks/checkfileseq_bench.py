@@ -0,0 +1,274 @@
+#!/usr/local/bin/python2.7
+# encoding: utf-8
+'''
+checkfileseq_bench.py -- benchmark suite for FileSequenceChecker
+
+Generates a synthetic tree of file sequence directories in a temporary
+directory and times the stages of a scan separately:
+
+  - C{processdir}: a complete recursive scan of the tree
+  - C{splitfilename}: splitting every file name of the tree
+  - C{compare}: finding the gaps in the already split and grouped
+    files of each directory, i.e. L{FileSequenceChecker._compare_files()}
+    and the L{checkfileseq.findgaps()} calls it makes
+  - C{findgaps}: finding the gaps in one long in-memory sequence of
+    C{--long-frames} frames, such as a timelapse or simulation cache,
+    once per available backend (see L{checkfileseq.BACKENDS})
+  - C{memory}: the bytes per file kept alive for the split and grouped
+    files of the tree, as the L{checkfileseq.FileList}s a scan keeps 
+    (C{filelist}), as one L{checkfileseq.FileParts} record per file 
+    sharing the strings of their file sequence (C{fileparts}) and as 
+    the separate name parts dicts used before (C{dicts})
+
+Every timed stage runs several times and the best time is reported,
+together with the time per file. The results are printed as JSON so they can be
+stored and compared between releases.
+
+The naming styles match the C{normal_order}, C{reverse_order} and
+C{mixed_order} directories of the unit test data: C{normal} puts the
+sequence number after the name, C{reverse} puts it before the name and
+C{mixed} alternates both per sequence.
+
+Run from the C{src} directory:
+
+    python benchmarks/checkfileseq_bench.py [--dirs NUM] [--frames NUM]
+        [--sequences NUM] [--gaps RATIO] [--style normal|reverse|mixed]
+        [--repeat NUM] [--backend auto|python|numpy] [--long-frames NUM] [-o FILE]
+'''
+
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import platform
+import tempfile
+
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import checkfileseq
+from checkfileseq import FileSequenceChecker
+
+NAMESTYLES = {
+    'normal': [
+        u"beauty.%04d.exr",
+        u"Write30 %d.png",
+        u"André-%03d.png",
+        u"résumé.v01.%02d.png",
+        u"line.%03d.bmp",
+    ],
+    'reverse': [
+        u"%d Write30.png",
+        u"r%03d_Write30.png",
+        u"v%d_Write.png",
+    ],
+}
+NAMESTYLES['mixed'] = [style for pair in map(None, NAMESTYLES['normal'], NAMESTYLES['reverse'])
+                             for style in pair if style is not None]
+
+def generate_tree(root, dirs, sequences, frames, gaps, style, seed=0):
+    '''
+    Create C{dirs} directories below C{root}, each containing C{sequences}
+    file sequences of C{frames} empty files, from which a ratio of C{gaps}
+    randomly chosen files is left out.
+
+    The directories are nested two levels deep (C{root/shotNNN/passNN})
+    so that recursion is exercised.
+
+    @return: the number of files created
+    @rtype: C{int}
+    '''
+    rand = random.Random(seed)
+    styles = NAMESTYLES[style]
+    numfiles = 0
+    for d in xrange(dirs):
+        path = os.path.join(root, u"shot%03d" % (d // 10), u"pass%02d" % (d % 10))
+        os.makedirs(path)
+        for s in xrange(sequences):
+            namestyle = styles[s % len(styles)]
+            if s >= len(styles):
+                # keep sequences distinct when there are more than styles
+                namestyle = u"s%02d_%s" % (s, namestyle)
+            for frame in xrange(1, frames + 1):
+                if rand.random() < gaps:
+                    continue
+                open(os.path.join(path, namestyle % frame), 'w').close()
+                numfiles += 1
+    return numfiles
+
+def best_of(repeat, func, *args):
+    ''' Call C{func} C{repeat} times and return the fastest time and all times in s. '''
+    times = []
+    for _i in xrange(repeat):
+        start = time.time()
+        func(*args)
+        times.append(time.time() - start)
+    return min(times), times
+
+def result(times, numfiles):
+    ''' Build the JSON result entry of one stage. '''
+    best, alltimes = times
+    return {
+        'best': best,
+        'times': alltimes,
+        'us_per_file': best * 1e6 / max(numfiles, 1),
+    }
+
+def bench_processdir(root, workers, backend):
+    fsc = FileSequenceChecker(recursive=True, workers=workers, backend=backend)
+    fsc.processdir(root)
+
+def bench_splitfilename(fsc, filenames):
+    splitfilename = fsc.splitfilename
+    for filename in filenames:
+        splitfilename(filename)
+
+def bench_compare(fsc, dircontents):
+    for bdir, files in dircontents:
+        fsc._compare_files(bdir, files)
+
+def bench_findgaps(frames, backend):
+    checkfileseq.findgaps(frames, 0, 0, 1, backend)
+
+def deep_sizeof(obj, seen=None):
+    '''
+    Return the size in bytes of C{obj} and all objects it references 
+    through containers, L{checkfileseq.FileList}s and their parts, 
+    counting objects that are referenced more than once only once.
+    '''
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, checkfileseq.FileParts):
+            stack.extend(value for _key, value in obj.iteritems())
+        elif isinstance(obj, checkfileseq.FileList):
+            stack.extend([obj.__dict__, obj.sequences])
+        elif isinstance(obj, checkfileseq._FrameRun):
+            stack.extend([obj.template, obj.padding, obj.frames])
+        elif isinstance(obj, checkfileseq.FrameSet):
+            stack.extend([obj.offset, obj._bits])
+    return size
+
+def memory(fsc, root, numfiles):
+    ''' Build the JSON result entry of the memory stage. '''
+    # a density no file sequence reaches keeps all files as records
+    perfile = FileSequenceChecker(recursive=True)
+    perfile.MINDENSITY = float('inf')
+    filelists = []
+    fileparts = []
+    dicts = []
+    for rootdir, files in fsc._walk(root):
+        filelists.append(fsc._prepare_files(rootdir, files))
+        fileparts.append(perfile._prepare_files(rootdir, files))
+        dicts.append([nameparts.todict() for nameparts in map(fsc.splitfilename, files) if nameparts])
+    numfiles = max(numfiles, 1)
+    return {
+        'filelist': deep_sizeof(filelists) / float(numfiles),
+        'fileparts': deep_sizeof(fileparts) / float(numfiles),
+        'dicts': deep_sizeof(dicts) / float(numfiles),
+    }
+
+def generate_frames(frames, gaps, seed=0):
+    ''' Return the sorted sequence numbers of one sequence of C{frames} frames with a ratio of C{gaps} left out. '''
+    rand = random.Random(seed)
+    return [frame for frame in xrange(1, frames + 1) if rand.random() >= gaps]
+
+def main():
+    parser = ArgumentParser(description="benchmark suite for FileSequenceChecker on a synthetic tree")
+    parser.add_argument("--dirs", dest="dirs", type=int, default=50,
+                        help="number of directories [default: %(default)s]", metavar="NUM")
+    parser.add_argument("--sequences", dest="sequences", type=int, default=4,
+                        help="number of file sequences per directory [default: %(default)s]", metavar="NUM")
+    parser.add_argument("--frames", dest="frames", type=int, default=500,
+                        help="number of frames per file sequence [default: %(default)s]", metavar="NUM")
+    parser.add_argument("--gaps", dest="gaps", type=float, default=0.01,
+                        help="ratio of missing frames [default: %(default)s]", metavar="RATIO")
+    parser.add_argument("--style", dest="style", choices=sorted(NAMESTYLES), default='mixed',
+                        help="naming style of the file sequences [default: %(default)s]")
+    parser.add_argument("--repeat", dest="repeat", type=int, default=3,
+                        help="number of runs per stage, the best one is reported [default: %(default)s]", metavar="NUM")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int,
+                        help="number of workers for processdir [default: %(default)s]", metavar="NUM")
+    parser.add_argument("--backend", dest="backend", choices=checkfileseq.BACKENDS, default='auto',
+                        help="backend for finding gaps in processdir and compare [default: %(default)s]")
+    parser.add_argument("--long-frames", dest="longframes", type=int, default=500000,
+                        help="number of frames of the long sequence for the findgaps stage [default: %(default)s]", metavar="NUM")
+    parser.add_argument("--seed", dest="seed", type=int, default=0,
+                        help="random seed for leaving out frames [default: %(default)s]", metavar="NUM")
+    parser.add_argument("-o", "--output", dest="output",
+                        help="write the JSON results to FILE instead of stdout", metavar="FILE")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="checkfileseq_bench_")
+    try:
+        numfiles = generate_tree(root, args.dirs, args.sequences, args.frames,
+                                 args.gaps, args.style, args.seed)
+
+        fsc = FileSequenceChecker(recursive=True, backend=args.backend)
+        filenames = []
+        dircontents = []
+        for rootdir, files in fsc._walk(root):
+            filenames.extend(files)
+            dircontents.append((rootdir, fsc._prepare_files(rootdir, files)))
+
+        results = {
+            'processdir': result(best_of(args.repeat, bench_processdir, root, args.jobs, args.backend), numfiles),
+            'splitfilename': result(best_of(args.repeat, bench_splitfilename, fsc, filenames), numfiles),
+            'compare': result(best_of(args.repeat, bench_compare, fsc, dircontents), numfiles),
+            'memory': memory(fsc, root, numfiles),
+        }
+        longframes = generate_frames(args.longframes, args.gaps, args.seed)
+        backends = ['python']
+        if checkfileseq.numpy is not None:
+            backends.append('numpy')
+        results['findgaps'] = dict((backend, result(best_of(args.repeat, bench_findgaps, longframes, backend), 
+                                                    len(longframes)))
+                                   for backend in backends)
+    finally:
+        shutil.rmtree(root)
+
+    report = {
+        'version': checkfileseq.__version__,
+        'updated': checkfileseq.__updated__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'params': {
+            'dirs': args.dirs,
+            'sequences': args.sequences,
+            'frames': args.frames,
+            'gaps': args.gaps,
+            'style': args.style,
+            'repeat': args.repeat,
+            'jobs': args.jobs,
+            'backend': args.backend,
+            'longframes': args.longframes,
+            'seed': args.seed,
+            'files': numfiles,
+        },
+        'results': results,
+    }
+    if args.output:
+        outfile = open(args.output, 'w')
+        json.dump(report, outfile, indent=2, sort_keys=True)
+        outfile.close()
+    else:
+        print json.dumps(report, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/local/bin/python2.7
+# encoding: utf-8
+'''
+grouping_bench.py -- microbenchmark for grouping and sorting a directory's files
+
+Builds the split file name parts of a directory with a few big file 
+sequences (100000 frames by default) in random order and compares 
+sorting them twice with C{cmp} functions, the way it was done before, 
+with grouping them by file sequence via L{FileSequenceChecker._group_files()}.
+Both results are verified to be identical.
+
+Run from the C{src} directory:
+
+    python benchmarks/grouping_bench.py [-n NUM]
+'''
+
+import os
+import random
+import sys
+import time
+
+from argparse import ArgumentParser
+from operator import itemgetter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from checkfileseq import FileParts, FileSequenceChecker
+
+SEQUENCES = [
+    (u"beauty.", u".exr"), 
+    (u"depth.", u".exr"), 
+    (u"shot_010_comp_v003.", u".dpx"), 
+    (u"Write30 ", u".png")
+]
+
+def synthetic_parts(num):
+    ''' Build C{num} file name parts spread over L{SEQUENCES}, in random order. '''
+    parts = []
+    numseqs = len(SEQUENCES)
+    for i in xrange(num):
+        filename, fileext = SEQUENCES[i % numseqs]
+        parts.append(FileParts(filename, u"%04d" % (i // numseqs), fileext, 'normal', u''))
+    random.seed(num)
+    random.shuffle(parts)
+    return parts
+
+def cmp_sort(parts):
+    ''' Sort C{parts} by sequence number then file name, using C{cmp} functions. '''
+    def seqnum_compare(x, y):
+        return int(x, 10) - int(y, 10)
+    def filename_compare(x, y):
+        return cmp(x, y)
+    parts = sorted(parts, key=itemgetter('seqnum'), cmp=seqnum_compare)
+    return sorted(parts, key=itemgetter('filename'), cmp=filename_compare)
+
+def timed(func, parts):
+    ''' Apply C{func} to C{parts}, return result and time taken. '''
+    start = time.time()
+    result = func(parts)
+    return result, time.time() - start
+
+def main():
+    parser = ArgumentParser(description="microbenchmark for grouping and sorting file sequences")
+    parser.add_argument("-n", "--num", dest="num", type=int, default=100000, 
+                        help="number of files in the directory [default: %(default)s]", metavar="NUM")
+    args = parser.parse_args()
+    parts = synthetic_parts(args.num)
+    fsc = FileSequenceChecker()
+    sortedparts, sorttime = timed(cmp_sort, parts)
+    groupedparts, grouptime = timed(fsc._group_files, parts)
+    if sortedparts != groupedparts:
+        print >> sys.stderr, "E: sorting and grouping disagree!"
+        return 1
+    print "%i files in %i sequences" % (args.num, len(SEQUENCES))
+    print "cmp sorts: %8.3f s  %6.3f us/file" % (sorttime, sorttime * 1e6 / args.num)
+    print "grouping:  %8.3f s  %6.3f us/file" % (grouptime, grouptime * 1e6 / args.num)
+    print "speedup:   %8.1fx" % (sorttime / grouptime)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+#!/usr/local/bin/python2.7
+# encoding: utf-8
+'''
+splitfilename_bench.py -- microbenchmark for FileSequenceChecker.splitfilename()
+
+Splits a number of synthetic file names (one million by default) with the
+default split patterns and reports the cost per file name, once using the
+combined matcher of L{FileSequenceChecker.splitfilename()} and once trying
+each pattern of C{SPLITPAT} in turn, the way splitting was done before.
+Both results are verified to be identical.
+
+The same is done for a custom split pattern, comparing the pattern compiled 
+and analysed by C{setsplitpattern()} with analysing and matching the raw 
+pattern string for each file name.
+
+Run from the C{src} directory:
+
+    python benchmarks/splitfilename_bench.py [-n NUM]
+'''
+
+import os
+import re
+import sys
+import time
+
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from checkfileseq import FileSequenceChecker
+
+NAMESTYLES = [
+    u"shot_%04d.exr",
+    u"Name20.%02d.png",
+    u"%d Write30.png",
+    u"v%d_Write.png",
+    u"r%03d_Write30.png",
+    u"André-%03d.png",
+    u"résumé.v01.%02d.png",
+    u"Version 1.0 - Write Icon 01.r%d.png",
+    u"-N0name%03d-png",
+    u"line.%03d.bmp",
+    u"thumbs.db",
+    u"notes.mp3"
+]
+
+def synthetic_names(num):
+    ''' Generate C{num} file names cycling through L{NAMESTYLES}. '''
+    names = []
+    numstyles = len(NAMESTYLES)
+    for i in xrange(num):
+        style = NAMESTYLES[i % numstyles]
+        if '%' in style:
+            names.append(style % (i // numstyles))
+        else:
+            names.append(style)
+    return names
+
+def cascade_split(filename):
+    ''' Split C{filename} by trying each default split pattern in turn. '''
+    _filename, _fileext = os.path.splitext(filename)
+    if len(_filename) == 0:
+        _filename = _fileext
+        _fileext = ""
+    if not re.search(ur'\d+', _filename):
+        if not re.search(ur'\d+', _fileext):
+            return None
+        else:
+            _filename = "%s%s" % (_filename, _fileext)
+            _fileext = ""
+    for d in FileSequenceChecker.SPLITPAT:
+        match = re.match(d['pattern'], _filename)
+        if match:
+            result = {
+                'filename': match.group('filename'), 
+                'seqnum': match.group('seqnum'), 
+                'fileext': _fileext,
+                'order': d['order']
+            }
+            if match.groupdict().has_key('filename2'):
+                result['filename2'] = match.group('filename2')
+            return result
+    return None
+
+CUSTOMPAT = ur'^(?P<filename>.+?)(?P<seqnum>\d+)$'
+CUSTOMTEMPLATE = ur'%(filename)s%(seqnum)s'
+
+def uncached_custom_split(filename):
+    ''' Split C{filename} with C{CUSTOMPAT}, analysing the raw pattern each time. '''
+    _filename, _fileext = os.path.splitext(filename)
+    if len(_filename) == 0:
+        _filename = _fileext
+        _fileext = ""
+    if not re.search(ur'\d+', _filename):
+        if not re.search(ur'\d+', _fileext):
+            return None
+        else:
+            _filename = "%s%s" % (_filename, _fileext)
+            _fileext = ""
+    d = {}
+    for i, m in enumerate(re.finditer(ur'(filename|seqnum)', CUSTOMPAT)):
+        d[i] = m.group(0)
+    if d[0] == 'filename' and d[1] == 'seqnum':
+        order = 'normal'
+    else:
+        order = 'reverse'
+    match = re.match(CUSTOMPAT, _filename)
+    if match and len(match.group('filename')) > 0 and len(match.group('seqnum')) > 0:
+        return {
+            'filename': match.group('filename'), 
+            'seqnum': match.group('seqnum'), 
+            'fileext': _fileext, 
+            'order': order
+        }
+    return None
+
+def timed(func, names):
+    ''' Apply C{func} to all C{names}, return results and time taken. '''
+    start = time.time()
+    results = [func(name) for name in names]
+    return results, time.time() - start
+
+def main():
+    parser = ArgumentParser(description="microbenchmark for splitting file names")
+    parser.add_argument("-n", "--num", dest="num", type=int, default=1000000, 
+                        help="number of synthetic file names [default: %(default)s]", metavar="NUM")
+    args = parser.parse_args()
+    names = synthetic_names(args.num)
+    fsc = FileSequenceChecker()
+    combined, combinedtime = timed(fsc.splitfilename, names)
+    cascade, cascadetime = timed(cascade_split, names)
+    if combined != cascade:
+        print >> sys.stderr, "E: combined matcher and cascade disagree!"
+        return 1
+    del combined, cascade
+    fsc.setsplitpattern(CUSTOMPAT, CUSTOMTEMPLATE)
+    custom, customtime = timed(fsc.splitfilename, names)
+    uncached, uncachedtime = timed(uncached_custom_split, names)
+    if custom != uncached:
+        print >> sys.stderr, "E: compiled and uncached custom pattern disagree!"
+        return 1
+    print "%i file names" % args.num
+    print "default patterns, cascade:  %8.3f s  %6.3f us/file" % (cascadetime, cascadetime * 1e6 / args.num)
+    print "default patterns, combined: %8.3f s  %6.3f us/file" % (combinedtime, combinedtime * 1e6 / args.num)
+    print "custom pattern, uncached:   %8.3f s  %6.3f us/file" % (uncachedtime, uncachedtime * 1e6 / args.num)
+    print "custom pattern, compiled:   %8.3f s  %6.3f us/file" % (customtime, customtime * 1e6 / args.num)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
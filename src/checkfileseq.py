@@ -33,17 +33,51 @@ import sys
 import os
 import re
 import time
+import marshal
+import hashlib
+import select
+import struct
+import zlib
+import binascii
+import fnmatch
+import json
+import csv
 
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from argparse import ArgumentParser
 from argparse import RawDescriptionHelpFormatter
 from operator import itemgetter
+from collections import namedtuple, deque
+from itertools import groupby, islice
+from fractions import gcd
 
-__all__ = ['FileSequenceChecker', 'CLIError']
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir # IGNORE:F0401
+    except ImportError:
+        scandir = None
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ['FileList', 'FileParts', 'FileSequenceChecker', 'findgaps', 'FrameSet', 'GapRange', 'MissingFiles', 'ScanCache', 'ScanStats', 'ScanResult', 'SequenceWatcher', 'CLIError']
 __version__ = 0.2
 __date__ = '2010-11-06'
 __updated__ = '2010-12-29'
 __docformat__ = "epytext"
 
+# clock for measuring durations, Python 2 has no monotonic clock 
+# in the time module so this falls back to the wall clock there
+_monotonic = getattr(time, 'monotonic', time.time)
+
 DEBUG = 0
 TESTRUN = 0
 PROFILE = 0 or (os.environ.has_key('BMProfileLevel') and os.environ['BMProfileLevel'] > 0)
@@ -58,6 +92,1072 @@ class CLIError(Exception):
     def __unicode__(self):
         return self.msg
 
+class FileParts(object):
+    '''
+    The parts of one file name of a file sequence, as split by 
+    L{FileSequenceChecker.splitfilename()}.
+    
+    Uses C{__slots__} instead of an instance C{dict}, since one record 
+    per file is kept for the whole scan. Behaves like the name parts 
+    C{dict} it replaces: the parts can be read with C{nameparts['seqnum']}, 
+    C{get()} and C{in}, are iterated as keys and compare equal to a 
+    C{dict} with the same items. Parts that are not set, like 
+    C{filename2} for patterns without such a group, are missing keys.
+    
+    >>> nameparts = FileParts(u'shot.', u'0042', u'.exr', 'normal')
+    >>> nameparts['seqnum'], nameparts.get('filename2', u''), 'size' in nameparts
+    (u'0042', u'', False)
+    >>> nameparts == {'filename': u'shot.', 'seqnum': u'0042', 'fileext': u'.exr', 'order': 'normal'}
+    True
+    
+    @ivar filename: file name part before the sequence number, 
+                    or after it for C{reverse} order
+    @type filename: C{unicode}
+    @ivar seqnum: the sequence number as found in the file name
+    @type seqnum: C{unicode}
+    @ivar fileext: file extension (incl. dot)
+    @type fileext: C{unicode}
+    @ivar order: C{normal} or C{reverse}, see L{splitfilename()}
+    @type order: C{str}
+    @ivar filename2: the other file name part, for split patterns 
+                     with a C{filename2} group
+    @type filename2: C{unicode}
+    @ivar size: file size in bytes, with L{setsizecheck()}
+    @type size: C{int} or C{None}
+    '''
+    __slots__ = ('filename', 'seqnum', 'fileext', 'order', 'filename2', 'size')
+    
+    def __init__(self, filename, seqnum, fileext, order, filename2=None):
+        self.filename = filename
+        self.seqnum = seqnum
+        self.fileext = fileext
+        self.order = order
+        if filename2 is not None:
+            self.filename2 = filename2
+    
+    @classmethod
+    def fromdict(cls, nameparts):
+        ''' Create a record from a name parts C{dict}, e.g. as returned by L{todict()}. '''
+        result = cls.__new__(cls)
+        result.__setstate__(nameparts)
+        return result
+    
+    def todict(self):
+        ''' Return the parts as C{dict}, e.g. for C{marshal} or C{json}. '''
+        return dict(self.iteritems())
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+    
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+    
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+    
+    def __contains__(self, key):
+        return hasattr(self, key)
+    
+    def keys(self):
+        return [key for key in self.__slots__ if hasattr(self, key)]
+    
+    def iteritems(self):
+        for key in self.__slots__:
+            if hasattr(self, key):
+                yield key, getattr(self, key)
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self):
+        return len(self.keys())
+    
+    def __getstate__(self):
+        return self.todict()
+    
+    def __setstate__(self, state):
+        for key, value in state.iteritems():
+            setattr(self, key, value)
+    
+    def __eq__(self, other):
+        if isinstance(other, (FileParts, dict)):
+            return len(self) == len(other) and all(key in other and other[key] == value 
+                                                   for key, value in self.iteritems())
+        return NotImplemented
+    
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return "FileParts(%s)" % ", ".join("%s=%r" % item for item in self.iteritems())
+
+class GapRange(namedtuple('GapRange', 'prefix padding suffix fileext start stop step')):
+    '''
+    A range of consecutive missing files from one file sequence.
+    
+    Stores just the parts needed to construct the missing file names,
+    so that a gap of any size costs the same amount of memory. The file 
+    names are constructed on demand by L{filenames()}.
+    
+    @ivar prefix: file name part before the sequence number
+    @type prefix: C{unicode}
+    @ivar padding: minimum width of the sequence number, zero-padded
+    @type padding: C{int}
+    @ivar suffix: file name part after the sequence number
+    @type suffix: C{unicode}
+    @ivar fileext: file extension (incl. dot)
+    @type fileext: C{unicode}
+    @ivar start: first missing sequence number
+    @type start: C{int}
+    @ivar stop: sequence number after the last missing one 
+                (exclusive, like with C{xrange})
+    @type stop: C{int}
+    @ivar step: difference between consecutive sequence numbers, 
+                for sequences with only every Nth frame (default 1)
+    @type step: C{int}
+    '''
+    __slots__ = ()
+    
+    def __new__(cls, prefix, padding, suffix, fileext, start, stop, step=1):
+        return super(GapRange, cls).__new__(cls, prefix, padding, suffix, fileext, start, stop, step)
+    
+    @property
+    def size(self):
+        ''' The number of missing files in this range. '''
+        if self.stop <= self.start:
+            return 0
+        return (self.stop - self.start + self.step - 1) // self.step
+    
+    @property
+    def last(self):
+        ''' The last missing sequence number. '''
+        return self.start + (self.size - 1) * self.step
+    
+    def filename(self, seqnum):
+        ''' Construct the file name for sequence number C{seqnum}. '''
+        return u"%s%0.*d%s%s" % (self.prefix, self.padding, seqnum, self.suffix, self.fileext)
+    
+    @property
+    def sequence(self):
+        ''' 
+        The file sequence this range belongs to, with the sequence
+        number replaced by one C{#} per digit, e.g. C{shot.####.exr}.
+        '''
+        return u"%s%s%s%s" % (self.prefix, u"#" * self.padding, self.suffix, self.fileext)
+    
+    @property
+    def rangestring(self):
+        '''
+        The missing sequence numbers as compact, zero-padded range,
+        e.g. C{0101-0250}, or just C{0101} for a single missing file. 
+        Ranges with a step other than 1 get it appended, e.g. C{0101-0249x2}.
+        '''
+        if self.size == 1:
+            return u"%0.*d" % (self.padding, self.start)
+        if self.step != 1:
+            return u"%0.*d-%0.*dx%i" % (self.padding, self.start, self.padding, self.last, self.step)
+        return u"%0.*d-%0.*d" % (self.padding, self.start, self.padding, self.last)
+    
+    def filenames(self):
+        ''' Generate the missing file names of this range in order. '''
+        for i in xrange(self.start, self.stop, self.step):
+            yield self.filename(i)
+
+class MissingFiles(object):
+    '''
+    The missing files of one directory, stored as list of L{GapRange}s.
+    
+    Behaves like a read-only C{list} of missing file names: it can be
+    iterated, indexed, sliced and compared to lists. Slices are lists. File names are only 
+    constructed while iterating, C{len()} is computed from the ranges.
+    
+    @ivar gaps: the gap ranges, in the order they were detected.
+    @type gaps: C{list} of L{GapRange}
+    '''
+    
+    def __init__(self, gaps=None):
+        super(MissingFiles, self).__init__()
+        if gaps is None:
+            gaps = []
+        self.gaps = gaps
+        
+    def append(self, gap):
+        ''' Add a L{GapRange}. '''
+        self.gaps.append(gap)
+        
+    def __iter__(self):
+        for gap in self.gaps:
+            for filename in gap.filenames():
+                yield filename
+    
+    def __len__(self):
+        numfiles = 0
+        for gap in self.gaps:
+            numfiles += gap.size
+        return numfiles
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step > 0:
+                # only constructs the file names up to stop
+                return list(islice(self, start, stop, step))
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if index >= 0:
+            for gap in self.gaps:
+                if index < gap.size:
+                    return gap.filename(gap.start + index * gap.step)
+                index -= gap.size
+        raise IndexError("missing files index out of range")
+    
+    def __eq__(self, other):
+        if isinstance(other, MissingFiles):
+            return self.gaps == other.gaps or list(self) == list(other)
+        elif isinstance(other, (list, tuple)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+    
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return repr(list(self))
+
+_NOTFULL = re.compile('[^\xff]')  # bitmap bytes with missing frames
+_NOTEMPTY = re.compile('[^\x00]') # bitmap bytes with present frames
+_MISSINGRUN = re.compile('0+')  # runs of missing frames in FrameSet._bitstring()
+_POPCOUNT = str(bytearray(bin(i).count('1') for i in xrange(256))) # number of present frames per bitmap byte
+
+class FrameSet(object):
+    '''
+    A set of frame numbers, stored as a bitmap.
+    
+    Bit C{i} stands for frame C{offset + i}, so a set takes one bit per 
+    frame of its span, no matter how many frames are present. Gaps are 
+    found by skipping whole bytes of present or missing frames at once, 
+    which makes them fast to enumerate for long, dense file sequences 
+    like timelapses and simulation caches.
+    
+        >>> frames = FrameSet([1, 2, 3, 7, 8, 20])
+        >>> len(frames), frames.first, frames.last
+        (6, 1, 20)
+        >>> frames.gaps()
+        [(4, 7), (9, 20)]
+        >>> frames.missing(1, 25)
+        [(4, 7), (9, 20), (21, 26)]
+        >>> (frames | FrameSet([4, 5, 6])).gaps()
+        [(9, 20)]
+    
+    @ivar offset: frame number of the first bit, a multiple of 8.
+    @type offset: C{int}
+    '''
+    __slots__ = ('offset', '_bits')
+    
+    def __init__(self, frames=()):
+        '''
+        @param frames: frame numbers, in any order.
+        @type frames: iterable of C{int}
+        '''
+        super(FrameSet, self).__init__()
+        frames = list(frames)
+        self.offset = 0
+        self._bits = bytearray()
+        if frames:
+            self._grow(min(frames), max(frames))
+            bits = self._bits
+            offset = self.offset
+            for frame in frames:
+                i = frame - offset
+                bits[i >> 3] |= 1 << (i & 7)
+                
+    def _grow(self, lo, hi):
+        ''' Extend the bitmap to cover the frames C{lo} through C{hi}. '''
+        if not self._bits:
+            self.offset = lo & ~7
+            self._bits = bytearray((hi - self.offset) // 8 + 1)
+            return
+        if lo < self.offset:
+            offset = lo & ~7
+            self._bits[0:0] = bytearray((self.offset - offset) // 8)
+            self.offset = offset
+        size = (hi - self.offset) // 8 + 1
+        if size > len(self._bits):
+            self._bits.extend(bytearray(size - len(self._bits)))
+            
+    def add(self, frame):
+        ''' Add a frame number. '''
+        self._grow(frame, frame)
+        i = frame - self.offset
+        self._bits[i >> 3] |= 1 << (i & 7)
+        
+    def update(self, other):
+        ''' Add all frames of another L{FrameSet}. '''
+        if not other._bits:
+            return
+        if not self._bits:
+            self.offset = other.offset
+            self._bits = bytearray(other._bits)
+            return
+        offset = min(self.offset, other.offset)
+        stop = max(self.offset + 8 * len(self._bits), other.offset + 8 * len(other._bits))
+        # OR-ing the bitmaps as long ints keeps the loop over the bytes in C
+        value = _bits_to_int(self._bits) << (self.offset - offset) | \
+                _bits_to_int(other._bits) << (other.offset - offset)
+        self.offset = offset
+        self._bits = _int_to_bits(value, (stop - offset) // 8)
+        
+    def __or__(self, other):
+        result = FrameSet()
+        result.update(self)
+        result.update(other)
+        return result
+    
+    def __contains__(self, frame):
+        i = frame - self.offset
+        return 0 <= i < 8 * len(self._bits) and bool(self._bits[i >> 3] >> (i & 7) & 1)
+    
+    def __len__(self):
+        return sum(bytearray(str(self._bits).translate(_POPCOUNT)))
+    
+    def __iter__(self):
+        bits = self._bits
+        for match in _NOTEMPTY.finditer(bits):
+            index = match.start()
+            byte = bits[index]
+            for bit in xrange(8):
+                if byte >> bit & 1:
+                    yield self.offset + 8 * index + bit
+                    
+    def __eq__(self, other):
+        if isinstance(other, FrameSet):
+            return list(self) == list(other)
+        return NotImplemented
+    
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return "FrameSet(%r)" % list(self)
+    
+    @property
+    def first(self):
+        ''' The lowest frame number, C{None} if empty. '''
+        stop = self.offset + 8 * len(self._bits)
+        frame = self._find(self.offset, stop, 1)
+        if frame == stop:
+            return None
+        return frame
+    
+    @property
+    def last(self):
+        ''' The highest frame number, C{None} if empty. '''
+        index = len(self._bits.rstrip('\x00')) - 1
+        if index < 0:
+            return None
+        return self.offset + 8 * index + self._bits[index].bit_length() - 1
+    
+    def _find(self, pos, stop, present):
+        '''
+        Find the first frame from C{pos} on that is C{present} 
+        (C{1}) or missing (C{0}), or C{stop} if there is none before.
+        '''
+        bits = self._bits
+        offset = self.offset
+        end = offset + 8 * len(bits)
+        if pos < offset:
+            if not present:
+                return min(pos, stop)
+            pos = offset
+        if present:
+            skip, boring = _NOTEMPTY, 0x00
+        else:
+            skip, boring = _NOTFULL, 0xff
+        while pos < stop:
+            if pos >= end:
+                if present:
+                    return stop
+                return pos
+            i = pos - offset
+            byte = bits[i >> 3]
+            if byte == boring:
+                # skip all following bytes without the frames looked for
+                match = skip.search(bits, (i >> 3) + 1, min(len(bits), (stop - offset + 7) >> 3))
+                if match is None:
+                    pos = offset + 8 * ((stop - offset + 7) >> 3)
+                    if present or pos < end:
+                        return stop
+                    pos = end
+                    continue
+                pos = offset + 8 * match.start()
+                continue
+            if (byte >> (i & 7) & 1) == present:
+                return pos
+            pos += 1
+        return stop
+    
+    def _missing_runs(self, lo, hi):
+        ''' Return the ranges of missing frames from C{lo} up to C{hi} (exclusive). '''
+        runs = []
+        pos = lo
+        while pos < hi:
+            start = self._find(pos, hi, 0)
+            if start >= hi:
+                break
+            pos = self._find(start, hi, 1)
+            runs.append((start, pos))
+        return runs
+    
+    def gaps(self, start=0, end=0, step=1):
+        '''
+        Find the gaps between the present frames. 
+        
+        Gives the same results as L{findgaps()} does for the sorted 
+        frame numbers, see there for the parameters.
+        
+        @rtype: C{list}
+        '''
+        if step != 1:
+            return findgaps(list(self), start, end, step)
+        stop = self.offset + 8 * len(self._bits)
+        lo = self._find(start, stop, 1)
+        if lo == stop:
+            return []
+        hi = self.last
+        if end:
+            hi = min(hi, end + 1)
+        return self._missing_runs(lo, hi)
+    
+    def missing(self, first, last, step=1):
+        '''
+        Find the frames missing from the frame range C{first} through 
+        C{last} with only every C{step}th frame, e.g. an expected range 
+        (see L{FileSequenceChecker.setexpectations()}).
+        
+        @return: list of C{(start, stop)} tuples of missing frame numbers, 
+                 with C{stop} exclusive like with C{xrange}.
+        @rtype: C{list}
+        '''
+        if step == 1:
+            return self._missing_runs(first, last + 1)
+        if last < first:
+            return []
+        # one character per frame on the step grid, sampled from 
+        # the bitmap by a strided slice, with frames outside of it 
+        # missing, then searched for runs of missing frames
+        count = (last - first) // step + 1
+        below = 0
+        if first < self.offset:
+            below = min(count, (self.offset - first + step - 1) // step)
+        grid = '0' * below
+        if below < count:
+            grid += self._bitstring()[first + below * step - self.offset:last + 1 - self.offset:step]
+        grid += '0' * (count - len(grid))
+        runs = []
+        for match in _MISSINGRUN.finditer(grid):
+            stop = last + 1
+            if match.end() < count:
+                stop = first + match.end() * step
+            runs.append((first + match.start() * step, stop))
+        return runs
+    
+    def _bitstring(self):
+        ''' Return the bitmap as C{str} of one C{'0'} or C{'1'} per frame from C{offset} on. '''
+        if not self._bits:
+            return ''
+        return bin(_bits_to_int(self._bits))[:1:-1].ljust(8 * len(self._bits), '0')
+    
+    def tostring(self):
+        ''' Serialize to a C{str}, e.g. for the L{ScanCache}. '''
+        return struct.pack('<q', self.offset) + str(self._bits)
+    
+    @classmethod
+    def fromstring(cls, data):
+        ''' Create a L{FrameSet} from a C{str} made by L{tostring()}. '''
+        frameset = cls()
+        frameset.offset = struct.unpack('<q', data[:8])[0]
+        frameset._bits = bytearray(data[8:])
+        return frameset
+    
+def _bits_to_int(bits):
+    ''' Convert a L{FrameSet} bitmap to a C{long}, frame C{offset} being bit 0. '''
+    if not bits:
+        return 0L
+    return long(binascii.hexlify(str(bits[::-1])), 16)
+
+def _int_to_bits(value, size):
+    ''' Convert a C{long} made by L{_bits_to_int()} back to a bitmap of C{size} bytes. '''
+    return bytearray(binascii.unhexlify(('%x' % value).zfill(2 * size)))[::-1]
+
+class _FrameRun(object):
+    '''
+    A regular file sequence of a L{FileList}: files that only differ in 
+    their sequence number, all padded to C{padding}, without duplicates. 
+    
+    Stored as the L{FileParts} of one of the files and a L{FrameSet}, 
+    so it takes one bit per frame of its span. Behaves like the sorted 
+    C{list} of the L{FileParts} of its files, which are created on demand.
+    
+    @ivar template: file name parts of one of the files
+    @type template: L{FileParts}
+    @ivar padding: width the sequence numbers are zero-padded to
+    @type padding: C{int}
+    @ivar frames: the sequence numbers
+    @type frames: L{FrameSet}
+    '''
+    __slots__ = ('template', 'padding', 'frames')
+    
+    def __init__(self, template, padding, frames):
+        self.template = template
+        self.padding = padding
+        self.frames = frames
+        
+    def fileparts(self, frame):
+        ''' Create the L{FileParts} of the file with sequence number C{frame}. '''
+        template = self.template
+        return FileParts(template.filename, u"%0*d" % (self.padding, frame), template.fileext, 
+                         template.order, template.get('filename2'))
+    
+    def __iter__(self):
+        for frame in self.frames:
+            yield self.fileparts(frame)
+            
+    def __len__(self):
+        return len(self.frames)
+    
+    def __getitem__(self, index):
+        if index == 0 and self.frames:
+            return self.fileparts(self.frames.first)
+        elif index == -1 and self.frames:
+            return self.fileparts(self.frames.last)
+        return list(self)[index]
+    
+    def __getstate__(self):
+        return self.template, self.padding, self.frames.tostring()
+    
+    def __setstate__(self, state):
+        self.template, self.padding, frames = state
+        self.frames = FrameSet.fromstring(frames)
+
+class FileList(object):
+    '''
+    The split and grouped files of one directory, sorted by file 
+    sequence and sequence number (see L{FileSequenceChecker._prepare_files()}).
+    
+    Regular file sequences, whose files only differ in their consistently 
+    padded sequence numbers, are stored as a L{FrameSet} with the name 
+    parts they share, unless they are too sparse (see 
+    L{FileSequenceChecker.MINDENSITY}). Only the other file sequences 
+    keep a L{FileParts} record per file. 
+    
+    Behaves like a read-only C{list} of the L{FileParts} of all files: 
+    it can be iterated, indexed and compared to lists. The records of 
+    regular file sequences are created while iterating.
+    
+    @ivar sequences: the file sequences in order, each a C{list} of 
+                     L{FileParts} or, if regular, a L{_FrameRun}.
+    @type sequences: C{list}
+    '''
+    
+    def __init__(self, sequences=None):
+        super(FileList, self).__init__()
+        if sequences is None:
+            sequences = []
+        self.sequences = sequences
+        
+    def __iter__(self):
+        for sequence in self.sequences:
+            for nameparts in sequence:
+                yield nameparts
+    
+    def __len__(self):
+        numfiles = 0
+        for sequence in self.sequences:
+            numfiles += len(sequence)
+        return numfiles
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if index >= 0:
+            for sequence in self.sequences:
+                if index < len(sequence):
+                    if isinstance(sequence, _FrameRun):
+                        return next(islice(sequence, index, None))
+                    return sequence[index]
+                index -= len(sequence)
+        raise IndexError("file list index out of range")
+    
+    def __eq__(self, other):
+        if isinstance(other, (FileList, list, tuple)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+    
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return repr(list(self))
+
+class _Splitter(object):
+    '''
+    Matches file names against a list of split patterns in one go.
+    
+    The patterns are combined into a single pre-compiled alternation, 
+    with each pattern wrapped in a group named after its position in 
+    the list (C{_0}, C{_1}, ...) and its own named groups suffixed 
+    accordingly (e.g. C{seqnum_1}). Since regex alternatives are tried 
+    from left to right, the first pattern that matches wins, just as 
+    when trying each pattern in turn with C{re.match}.
+    
+    If the patterns can't be combined (because they use different 
+    flags or numbered backreferences) they are tried in turn instead.
+    A single pattern, like a custom pattern set by the user, is used 
+    as is.
+    '''
+    
+    def __init__(self, patterns, template=None):
+        '''
+        @param patterns: split pattern dicts with a C{pattern} and an 
+                         C{order} key, like L{FileSequenceChecker.SPLITPAT}.
+        @type patterns: C{list}
+        @param template: format string for a custom split pattern.
+        @type template: C{unicode}
+        '''
+        super(_Splitter, self).__init__()
+        self.patterns = []      # (compiled pattern, order) tuples
+        self.alternatives = {}  # wrapper group name -> (order, {group name: combined group name})
+        self.groupnames = set() # names of the groups in all patterns
+        self.template = template
+        self.regex = None       # the combined pattern
+        alternatives = []
+        flags = None
+        combinable = True
+        for i, d in enumerate(patterns):
+            pattern = d['pattern']
+            if isinstance(pattern, basestring):
+                pattern = re.compile(pattern)
+            self.patterns.append((pattern, d['order']))
+            if flags is None:
+                flags = pattern.flags
+            if pattern.flags != flags or re.search(ur'\\[1-9]', pattern.pattern):
+                combinable = False
+            groupnames = {}
+            for name in pattern.groupindex:
+                groupnames[name] = u"%s_%i" % (name, i)
+            self.groupnames.update(groupnames)
+            source = re.sub(ur'\(\?P([<=])(\w+)([>)])', 
+                            lambda m, i=i: u"(?P%s%s_%i%s" % (m.group(1), m.group(2), i, m.group(3)), 
+                            pattern.pattern)
+            # the newline ends a trailing comment in verbose patterns 
+            alternatives.append(u"(?P<_%i>%s\n)" % (i, source))
+            self.alternatives[u"_%i" % i] = (d['order'], groupnames)
+        if combinable and len(alternatives) > 1:
+            if not flags & re.VERBOSE:
+                alternatives = [alt[:-2] + u")" for alt in alternatives]
+            self.regex = re.compile(u"|".join(alternatives), flags)
+        
+    def match(self, name):
+        '''
+        Match C{name} against the split patterns.
+        
+        @param name: file name without extension
+        @type name: C{unicode}
+        @return: the order and a dict with the named groups of the first 
+                 matching pattern, or C{None} if no pattern matches.
+        @rtype: C{tuple} or C{None}
+        '''
+        if self.regex is not None:
+            match = self.regex.match(name)
+            if match is None:
+                return None
+            order, groupnames = self.alternatives[match.lastgroup]
+            groups = {}
+            for groupname, combinedname in groupnames.iteritems():
+                groups[groupname] = match.group(combinedname)
+            return order, groups
+        for pattern, order in self.patterns:
+            match = pattern.match(name)
+            if match:
+                return order, match.groupdict()
+        return None
+
+class _PathFilter(object):
+    '''
+    A compiled include or exclude pattern.
+    
+    Patterns containing a path separator are searched in the whole 
+    path, all other patterns only in the file or directory name, 
+    which is shorter and doesn't need to be joined to its directory 
+    path first.
+    
+    @ivar pattern: the pattern as given
+    @type pattern: C{unicode}
+    @ivar regex: the compiled pattern
+    @ivar namesonly: match against names instead of paths
+    @type namesonly: C{bool}
+    '''
+    
+    def __init__(self, pattern):
+        '''
+        @raise ValueError: if C{pattern} isn't a valid regex pattern.
+        '''
+        super(_PathFilter, self).__init__()
+        try:
+            self.regex = re.compile(pattern)
+        except re.error, e:
+            raise ValueError("E: invalid pattern %s (%s)" % (pattern, e))
+        self.pattern = pattern
+        self.namesonly = u'/' not in pattern and (os.sep == u'/' or os.sep * 2 not in pattern)
+        
+    def __repr__(self):
+        return "_PathFilter(%r)" % self.pattern
+    
+    def matchfile(self, root, name):
+        ''' Return C{True} if the file C{name} in directory C{root} matches. '''
+        if self.namesonly:
+            return self.regex.search(name) is not None
+        return self.regex.search(os.path.join(root, name)) is not None
+    
+    def matchdir(self, path):
+        '''
+        Return C{True} if the directory at C{path} matches. 
+        The path is matched with a trailing separator, so 
+        that e.g. C{/cache/} matches any directory named 
+        C{cache}.
+        '''
+        if self.namesonly:
+            return self.regex.search(os.path.basename(path)) is not None
+        return self.regex.search(os.path.join(path, u'')) is not None
+
+_FRAMERANGE = re.compile(ur'^(\d+)(?:-(\d+)(?:x(\d+))?)?$') # first[-last[xstep]]
+
+def _parse_framerange(text):
+    '''
+    Parse a frame range like C{1001-1100}, C{1001-1100x2} 
+    (every 2nd frame) or C{1001} (a single frame).
+    
+    @return: C{(first, last, step)} tuple
+    @rtype: C{tuple}
+    @raise ValueError: if C{text} isn't a valid frame range.
+    '''
+    match = _FRAMERANGE.match(text.strip())
+    if not match:
+        raise ValueError("E: invalid frame range %s: must be FIRST-LAST[xSTEP]" % text)
+    first = int(match.group(1), 10)
+    last = int(match.group(2) or match.group(1), 10)
+    step = int(match.group(3) or u'1', 10)
+    if last < first or step < 1:
+        raise ValueError("E: invalid frame range %s: last is before first or step is 0" % text)
+    return first, last, step
+
+def _expectation_key(pattern):
+    '''
+    Normalize the sequence pattern of an expectation: patterns 
+    with a directory part are made absolute, bare patterns apply 
+    to sequences of that name in any directory.
+    '''
+    if os.path.dirname(pattern):
+        return os.path.abspath(pattern)
+    return pattern
+
+def _read_expectations(stream):
+    '''
+    Read an expectations file: one C{pattern range} pair per line, 
+    e.g. C{shots/sh010/beauty.####.exr 1001-1100}. See 
+    L{FileSequenceChecker.setexpectations()}.
+    
+    @return: dict of C{(first, last, step)} tuples keyed by pattern
+    @rtype: C{dict}
+    @raise ValueError: if a line isn't a valid expectation.
+    '''
+    expectations = {}
+    for lineno, line in enumerate(stream, 1):
+        line = line.decode('utf-8').strip()
+        if not line:
+            continue
+        try:
+            pattern, framerange = line.rsplit(None, 1)
+            expectations[_expectation_key(pattern)] = _parse_framerange(framerange)
+        except ValueError:
+            raise ValueError("E: line %i of expectations file is not a PATTERN FIRST-LAST[xSTEP] pair: %s" % 
+                             (lineno, line))
+    return expectations
+
+_DIGIT = re.compile(ur'\d') # file names without digits can't be part of a file sequence
+
+class ScanCache(object):
+    '''
+    An on-disk cache of per-directory scan results, stored in an SQLite 
+    database.
+    
+    For each directory the cache keeps the names of its sub directories,
+    its prepared contents and its missing files, together with the 
+    directory's modification time and inode and a key describing the 
+    L{FileSequenceChecker} settings that produced them. As long as 
+    files are only added, removed or renamed in a directory its 
+    modification time changes, so an entry with matching modification 
+    time, inode and settings can be used instead of listing and 
+    processing the directory again.
+    
+    @ivar path: file path of the database.
+    @type path: C{unicode}
+    @ivar hits: number of successful lookups.
+    @type hits: C{int}
+    @ivar misses: number of failed lookups.
+    @type misses: C{int}
+    '''
+    
+    VERSION = 2 #: version of the format entries are stored in
+    
+    
+    MINAGE = 2.0 #: directories modified less than this many seconds ago aren't stored
+    
+    def __init__(self, path):
+        '''
+        @param path: file path of the database. Will be created if 
+                     it doesn't exist.
+        @type path: C{unicode}
+        @raise ValueError: if SQLite isn't available.
+        '''
+        super(ScanCache, self).__init__()
+        if sqlite3 is None:
+            raise ValueError("E: scan cache needs the sqlite3 module")
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS dirs "
+                         "(path TEXT PRIMARY KEY, mtime REAL, inode INTEGER, config TEXT, data BLOB)")
+        
+    def __repr__(self):
+        return "ScanCache(%r)" % self.path
+        
+    def get(self, path, mtime, inode, config):
+        '''
+        Look up the entry for a directory.
+        
+        @param path: absolute path of the directory
+        @type path: C{unicode}
+        @param mtime: current modification time of the directory
+        @type mtime: C{float}
+        @param inode: current inode number of the directory
+        @type inode: C{int}
+        @param config: key describing the settings used for scanning
+        @type config: C{str}
+        @return: the data stored by L{put()} or C{None} if there's no 
+                 entry or it is out of date.
+        '''
+        row = self._db.execute("SELECT data FROM dirs WHERE path = ? AND mtime = ? AND inode = ? AND config = ?", 
+                               (path, mtime, inode, config)).fetchone()
+        if row is not None:
+            try:
+                data = marshal.loads(str(row[0]))
+            except (EOFError, ValueError, TypeError):
+                data = None
+            if data is not None:
+                self.hits += 1
+                return data
+        self.misses += 1
+        return None
+    
+    def put(self, path, mtime, inode, config, data):
+        '''
+        Store the entry for a directory, replacing any previous entry.
+        
+        Directories modified less than L{MINAGE} seconds ago are skipped,
+        since files added within the resolution of their modification 
+        time would go unnoticed.
+        
+        @param data: marshallable scan results.
+        @see: L{get()} for the other parameters.
+        '''
+        if time.time() - mtime < self.MINAGE:
+            return
+        self._db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?)", 
+                         (path, mtime, inode, config, buffer(marshal.dumps(data))))
+        
+    def commit(self):
+        ''' Write pending changes to disk. '''
+        self._db.commit()
+        
+    def close(self):
+        ''' Write pending changes to disk and close the database. '''
+        self._db.commit()
+        self._db.close()
+
+class ScanStats(object):
+    '''
+    Timings and counts of one run of L{FileSequenceChecker.processdir()}, 
+    L{FileSequenceChecker.iter_missing()} or L{FileSequenceChecker.iter_sequences()}
+    (see L{FileSequenceChecker.setstats()}).
+    
+    Phases are timed per directory, not per file, so that collecting 
+    stats adds only a few clock reads per directory. When sub directories 
+    are processed in parallel the phase times are summed over all 
+    workers and can add up to more than the elapsed time.
+    
+    @ivar times: time in s spent in each of the L{PHASES}.
+    @type times: C{dict}
+    @ivar counts: number of each of the L{COUNTS}.
+    @type counts: C{dict}
+    @ivar elapsed: time in s the whole run took.
+    @type elapsed: C{float}
+    '''
+    
+    PHASES = ('walk', 'filter', 'split', 'group', 'gaps', 'output') #: timed phases, in processing order
+    
+    COUNTS = ('dirs', 'files', 'excluded', 'unsplittable', 'sequences') #: counted items
+    
+    def __init__(self):
+        super(ScanStats, self).__init__()
+        self.times = dict.fromkeys(self.PHASES, 0.0)
+        self.counts = dict.fromkeys(self.COUNTS, 0)
+        self.elapsed = 0.0
+        
+    def update(self, other):
+        ''' Add the times and counts of another L{ScanStats}, e.g. from a worker process. '''
+        for phase, seconds in other.times.iteritems():
+            self.times[phase] += seconds
+        for item, count in other.counts.iteritems():
+            self.counts[item] += count
+            
+    @property
+    def throughput(self):
+        ''' Number of files processed per s, C{0.0} if nothing was timed. '''
+        if self.elapsed <= 0:
+            return 0.0
+        return self.counts['files'] / self.elapsed
+    
+    def report(self):
+        '''
+        Format the stats as a table of phase timings 
+        followed by the counts and throughput.
+        
+        @rtype: C{str}
+        '''
+        lines = ["%-10s %10s %7s" % ("Phase", "Time (s)", "Share")]
+        for phase in self.PHASES:
+            seconds = self.times[phase]
+            share = self.elapsed > 0 and 100.0 * seconds / self.elapsed or 0.0
+            lines.append("%-10s %10.4f %6.1f%%" % (phase, seconds, share))
+        lines.append("%-10s %10.4f" % ("elapsed", self.elapsed))
+        lines.append(", ".join("%s: %i" % (item, self.counts[item]) for item in self.COUNTS))
+        lines.append("throughput: %0.1f files/s" % self.throughput)
+        return "\n".join(lines)
+
+class ScanResult(dict):
+    '''
+    The results of one call of L{FileSequenceChecker.processdir()}.
+    
+    A dict of L{MissingFiles} keyed by the path to the directory 
+    containing them, holding everything else found by the call in its 
+    attributes. Each call returns a new C{ScanResult}, so a checker can 
+    be reused for any number of calls without results piling up in it.
+    
+    @ivar dircontents: sorted file name parts lists of all processed 
+                       directories, keyed by directory path.
+    @type dircontents: C{dict}
+    @ivar duplicates: lists of duplicate files, keyed like the missing files.
+    @type duplicates: C{dict}
+    @ivar badpadding: lists of inconsistently padded files, keyed like the missing files.
+    @type badpadding: C{dict}
+    @ivar badsizes: lists of C{(file name, size, median size)} of files 
+                    with a bad size, keyed like the missing files.
+    @type badsizes: C{dict}
+    @ivar exectime: time in s the call took, C{-1} while it is running.
+    @type exectime: C{float}
+    @ivar syscallcount: number of file system calls the call issued.
+    @type syscallcount: C{int}
+    @ivar stats: timings and counts if collecting stats, otherwise C{None}.
+    @type stats: L{ScanStats}
+    '''
+    
+    def __init__(self):
+        super(ScanResult, self).__init__()
+        self.dircontents = {}
+        self.duplicates = {}
+        self.badpadding = {}
+        self.badsizes = {}
+        self.exectime = -1
+        self.syscallcount = 0
+        self.stats = None
+        
+    @property
+    def totaldirs(self):
+        ''' Number of directories with missing files. '''
+        return len(self)
+    
+    @property
+    def totalfiles(self):
+        ''' Number of missing files. '''
+        numfiles = 0
+        for files in self.itervalues():
+            numfiles += len(files)
+        return numfiles
+    
+    @property
+    def totalprocessed(self):
+        ''' Number of files processed. '''
+        numprocessed = 0
+        for files in self.dircontents.itervalues():
+            numprocessed += len(files)
+        return numprocessed
+    
+    def framesets(self):
+        '''
+        Collect the frame numbers of each file sequence in a L{FrameSet}. 
+        File sequences with the same pattern in different directories, 
+        e.g. of a render split into several directories, are merged.
+        
+        @return: dict of L{FrameSet}s keyed by sequence pattern 
+                 (see L{GapRange.sequence}).
+        @rtype: C{dict}
+        '''
+        framesets = {}
+        for files in self.dircontents.itervalues():
+            for sequence in _iter_sequences(files):
+                pattern = _sequence_pattern(sequence[0], _sequence_padding(sequence))
+                if isinstance(sequence, _FrameRun):
+                    # a copy, since it may be merged with others
+                    frames = FrameSet() | sequence.frames
+                else:
+                    frames = FrameSet(int(nameparts['seqnum'], 10) for nameparts in sequence)
+                if pattern in framesets:
+                    framesets[pattern].update(frames)
+                else:
+                    framesets[pattern] = frames
+        return framesets
+
 class FileSequenceChecker(object):
     '''
     FileSequenceChecker
@@ -73,13 +1173,14 @@ class FileSequenceChecker(object):
         1. Generate a directory contents dict by splitting each file name 
            into a name and sequence number part when generating lists 
            for each file sequence present in the dir. 
-           We sort these lists in a natural way, first by sequence number, 
-           then by file name. This step is also responsible for including 
+           We group these lists by file sequence in one pass and sort
+           each group by the integer value of its sequence numbers, 
+           ordering the groups by file name. This step is also responsible for including 
            or excluding files based on criteria such as command line args 
            (C{--include/--exclude}) and/or L{FILEEXCLUDES}. 
            
-           For each directory a file name list is saved, containing dicts
-           with 5 keys:
+           For each directory a L{FileList} is saved, behaving like a list of 
+           L{FileParts} records with 5 parts:
            
                1. file name (C{filename}), 
                2. sequence number (C{seqnum}), 
@@ -114,6 +1215,10 @@ class FileSequenceChecker(object):
            a per directory basis. Each list is then added to a dictionary, keyed 
            by path to the directory that's currently processed.
            
+           Missing files aren't stored one by one but as L{GapRange}s, so 
+           memory use depends on the number of gaps, not the number of 
+           missing files. 
+           
         3. L{self.processdir()} returns this dictionary, or an empty dictionary 
            if no there are no missing files, so that the caller can further do her
            own processing.
@@ -172,8 +1277,9 @@ class FileSequenceChecker(object):
     A L{FileSequenceChecker} instance is key subscriptable.
     If the instance's C{missing} attribute (a dict with the 
     pathnames for dirs with missing files as keys) has an
-    entry for a given path it will return a list of file
-    names for all missing files under that path. E.g.:
+    entry for a given path it will return a list-like 
+    L{MissingFiles} object with the file names for all missing 
+    files under that path. E.g.:
         
         >>> print fsc[somedir]
         [u'2 Write30.png', u'4 Write30.png', u'5 Write30.png']
@@ -184,15 +1290,44 @@ class FileSequenceChecker(object):
         >>> print fsc.totalfiles
         3
     
+    These refer to the results of the last call of L{self.processdir()} 
+    only. Each call starts from scratch and returns a new L{ScanResult}, 
+    which also has C{totalfiles}, etc., so one instance can be reused 
+    for any number of scans:
+    
+        >>> missing.totalfiles
+        3
+    
     If you want to know how many dirs there were with missing 
     files:
     
         >>> print fsc.totaldirs
         1
     
+    Files sharing a sequence number with another file of their file 
+    sequence (e.g. C{shot.1.exr} and C{shot.0001.exr}) and files not 
+    padded like the rest of it are collected in C{fsc.duplicates} and 
+    C{fsc.badpadding}, dicts keyed like the missing files. After 
+    L{self.setsizecheck()} empty files and files deviating from the 
+    median size of their file sequence are collected in C{fsc.badsizes}:
+    
+        >>> print fsc.duplicates, fsc.badpadding, fsc.badsizes
+        {} {} {}
+    
+    For big trees L{self.iter_missing()} hands out the missing files 
+    while the tree is still being processed, one L{GapRange} at a time:
+    
+        >>> for containingdir, sequence, gap in fsc.iter_missing(somedir):
+        ...     print u"%s: %s missing %i-%i" % (containingdir, sequence, gap.start, gap.last)
+        unittests/data/reverse_order: # Write30.png missing 2-2
+        unittests/data/reverse_order: # Write30.png missing 4-5
+    
     You can get the amount of time in fractional seconds that
     L{self.processdir()} took by calling C{fsc.lastexectime} and 
-    it will return it as a C{float} value.
+    it will return it as a C{float} value. Likewise C{fsc.lastsyscallcount}
+    tells how many directory listings and C{stat} calls were needed.
+    For a breakdown by processing phase turn on L{self.setstats()}, 
+    which collects a L{ScanStats} in C{fsc.laststats}.
     
         
     Implementation Notes
@@ -243,8 +1378,27 @@ class FileSequenceChecker(object):
     @ivar fullpaths: index missing file lists by absolute paths instead 
                      of relative paths
     @type fullpaths: C{bool}
+    @ivar workers: number of worker threads/processes used for scanning 
+                   sub directories in parallel. C{None}, C{0} or C{1} 
+                   means serial processing.
+    @type workers: C{int}
+    @ivar backend: engine for finding the gaps in file sequences, one of 
+                   L{BACKENDS} (see L{findgaps()}).
+    @type backend: C{str}
     @ivar lastexectime: time in s the last call to L{self.processdir()} took.
     @type lastexectime: C{str}
+    @ivar lastsyscallcount: number of file system calls (directory listings 
+                            and C{stat}s) the last call to L{self.processdir()} 
+                            issued.
+    @type lastsyscallcount: C{int}
+    @ivar laststats: timings and counts of the last call to 
+                     L{self.processdir()} if enabled with 
+                     L{self.setstats()}, otherwise C{None}.
+    @type laststats: L{ScanStats}
+    @ivar lastresult: the L{ScanResult} returned by the last call to 
+                      L{self.processdir()}, which C{fsc[dir]}, 
+                      C{totalfiles}, etc. refer to.
+    @type lastresult: L{ScanResult}
     '''
 
     SPLITPAT = [ #: default split patterns
@@ -307,18 +1461,31 @@ class FileSequenceChecker(object):
         # sorry, don't know too much about those special system files there
         FILEEXCLUDES = []
         
+    STATTHREADS = 16 #: number of threads stat'ing files when checking sizes
+    STATBATCH = 64   #: number of files per batch of stat calls
+    MINDENSITY = 1.0 / 256 #: file sequences with less files per frame of their span are kept file by file, see FileList
+    
     __all__ = [
         "setfileexcludes", 
         "setincludepattern", 
         "setexcludepattern", 
+        "setdirexcludepattern", 
         "setsplitpattern", 
+        "setscancache", 
+        "setshard", 
+        "setexpectations", 
+        "setstep", 
+        "setsizecheck", 
+        "setstats", 
         "splitfilename",
         "processdir",
+        "iter_missing",
+        "iter_sequences",
         "FILEEXCLUDES",
         "SPLITPAT"
     ]
     
-    def __init__(self, start=None, end=None, recursive=False, fullpaths=False):
+    def __init__(self, start=None, end=None, recursive=False, fullpaths=False, workers=None, backend='auto'):
         super(FileSequenceChecker, self).__init__()
         if isinstance(start, basestring):
             try:
@@ -341,27 +1508,50 @@ class FileSequenceChecker(object):
             raise ValueError("E: 'recursive' must be of type bool/int")
         if not isinstance(fullpaths, (bool, int)):
             raise ValueError("E: 'fullpaths' must be of type bool/int")
+        if workers is not None and (not isinstance(workers, int) or workers < 0):
+            raise ValueError("E: 'workers' must be None or a positive int")
+        if backend not in BACKENDS:
+            raise ValueError("E: 'backend' must be one of %s" % ", ".join(BACKENDS))
         
         # public 
         self.start = start                  #: only process files with sequence number values greater than this number
         self.end = end                      #: only process files with sequence number values less than or equal to this number 
         self.recursive = bool(recursive)    #: process sub directories
         self.fullpaths = bool(fullpaths)    #: index missing file lists by absolute paths instead of relative paths
+        self.workers = workers              #: number of worker threads/processes for parallel scanning (None = serial)
+        self.backend = backend              #: engine for finding gaps: 'auto', 'python' or 'numpy'
         self.lastexectime = -1              #: how long did the last call of self.processdir take
+        self.lastsyscallcount = 0           #: how many file system calls did the last call of self.processdir issue
+        self.laststats = None               #: ScanStats of the last call of self.processdir, if collecting stats
+        self.lastresult = None              #: ScanResult of the last call of self.processdir
         
         # private
-        self._lastfilebarename = ''          # the last file name, bare, that is without the sequence number part
-        self._nextseqnum = -1                # the next sequence number to expect
-        self._seqnumwidth = -1               # used for %.*s format specifiers in place of the star
+        self._step = None                    # step of all file sequences, 'auto' to detect it per sequence, None for 1
         self._splitpat = self.SPLITPAT       # the pattern(s) to be used to split a file name into name and sequence number
+        self._splitter = _Splitter(self.SPLITPAT) # matches file names against self._splitpat if it is a list
         self._missing = {}                   # will hold a list of all the missing file names, keyed by path to the directory containing them.
+        self._duplicates = {}                # lists of files with the same sequence number as another file, keyed like self._missing
+        self._badpadding = {}                # lists of files not padded like the rest of their file sequence, keyed like self._missing
+        self._badsizes = {}                  # lists of (file name, size, median size) of flagged files, keyed like self._missing
         self._template = None                # a format string which must contain dict key-based replacement tokens for each named group of a custom splitpat. 
         self._dircontents = {}               # will contain sorted sequence file lists keyed by filepath of the containing directory.
-        self._missingfiles = []              # holds a list of all missing files per one processed directory.
-        self._fileexcludes = self.FILEEXCLUDES
+        self._fileexcludes = frozenset(self.FILEEXCLUDES) # file names to exclude
+        self._fileexcludeglobs = frozenset() # glob patterns of file names to exclude
+        self._fileexcludeglob = None         # self._fileexcludeglobs compiled into one regex
         self._excludepat = None              # file names with paths matching this pattern will be excluded from being processed. overrides self._includepat. 
         self._includepat = None              # only file names with paths matching this pattern will be included in processing
+        self._direxcludepat = None           # directories with paths matching this pattern won't be descended into
+        self._excludefilter = None           # self._excludepat compiled as _PathFilter
+        self._includefilter = None           # self._includepat compiled as _PathFilter
+        self._direxcludefilter = None        # self._direxcludepat compiled as _PathFilter
         self._strictmatching = False         # if True uses re.match instead of re.search internally
+        self._cache = None                   # a ScanCache with results of previous scans
+        self._shard = None                   # (index, count) of the shard of the tree to process, see setshard()
+        self._expectations = {}              # (first, last, step) frame ranges keyed by sequence pattern, see setexpectations()
+        self._sizetolerance = None           # relative deviation from the median size to flag files at, None to not check sizes
+        self._statpool = None                # (pid, ThreadPool) for stat'ing files when checking sizes
+        self._collectstats = False           # collect ScanStats in self.laststats, see setstats()
+        self._runstart = 0.0                 # clock value at the start of the current run
         
     def __str__(self):
         if isinstance(self.start, int):
@@ -372,20 +1562,12 @@ class FileSequenceChecker(object):
             end = "end = %i " % self.end
         else:
             end = ""
-        if self._lastfilebarename != u'':
-            lastfilebarename = "lastfilebarename = %s " % self._lastfilebarename
-        else:
-            lastfilebarename = self._lastfilebarename
-        if self._nextseqnum != -1:
-            nextseqnum = "nextseqnum = %s " % str(self._nextseqnum)
-        else:
-            nextseqnum = ""
         if self._splitpat != self.SPLITPAT:
             splitpat = "splitpat = %s " % self._splitpat
         else:
             splitpat = ""
-        if self._fileexcludes != self.FILEEXCLUDES:
-            fileexcludes = "fileexcludes = %s " % self._fileexcludes
+        if self._fileexcludes != frozenset(self.FILEEXCLUDES) or self._fileexcludeglobs:
+            fileexcludes = "fileexcludes = %s " % sorted(self._fileexcludes | self._fileexcludeglobs)
         else:
             fileexcludes = ""
         if self._excludepat:
@@ -396,6 +1578,10 @@ class FileSequenceChecker(object):
             includepat = "includepat = %s " % self._includepat
         else:
             includepat = ""
+        if self._direxcludepat:
+            direxcludepat = "direxcludepat = %s " % self._direxcludepat
+        else:
+            direxcludepat = ""
         if self._missing and len(self._missing) > 0:
             numdirs = len(self._missing.keys())
             numfiles = 0
@@ -404,10 +1590,6 @@ class FileSequenceChecker(object):
             missing = "missing = %i dir(s)/%i file(s) " % (numdirs, numfiles)
         else:
             missing = ""
-        if self._seqnumwidth != -1:
-            seqnumwidth = "seqnumwidth = %i " % self._seqnumwidth
-        else:
-            seqnumwidth = ""
         if self._template:
             template = self._template
         else:
@@ -420,14 +1602,19 @@ class FileSequenceChecker(object):
             fullpaths = "fullpaths = True "
         else:
             fullpaths = ""
+        if self.workers > 1:
+            workers = "workers = %i " % self.workers
+        else:
+            workers = ""
         srepr = "%s " % super(FileSequenceChecker, self).__repr__()
-        return "%s%s%s%s%s%s%s%s%s%s%s%s%s%s" % \
+        return "%s%s%s%s%s%s%s%s%s%s%s%s%s" % \
                 (srepr, start, end, splitpat, template, fileexcludes, missing, \
-                 lastfilebarename, nextseqnum, seqnumwidth, excludepat, includepat, recursive, fullpaths)
+                 excludepat, includepat, direxcludepat, recursive, fullpaths, workers)
                 
     def __repr__(self):
-        return "FileSequenceChecker(start=%s, end=%s, recursive=%s, fullpaths=%s)" % \
-                (str(self.start), str(self.end), str(self.recursive), str(self.fullpaths)) 
+        return "FileSequenceChecker(start=%s, end=%s, recursive=%s, fullpaths=%s, workers=%s, backend=%s)" % \
+                (str(self.start), str(self.end), str(self.recursive), str(self.fullpaths), str(self.workers), 
+                 str(self.backend)) 
                 
     def __unicode__(self):
         return u'%s' % str(self)
@@ -439,12 +1626,18 @@ class FileSequenceChecker(object):
             return None
         
     def __len__(self):
+        # len() of MissingFiles sums up gap ranges, so this
+        # is linear in the number of gaps, not of missing files
         numfiles = 0
         for files in self._missing.values():
             numfiles += len(files)
         return numfiles
     
     def __getattr__(self, attr):
+        if attr.startswith('__'):
+            # don't fake special attributes (e.g. __getstate__), 
+            # so that instances can be pickled for worker processes
+            raise AttributeError(attr)
         if attr == "totaldirs":
             return len(self._missing.keys())
         elif attr == "totalfiles":
@@ -452,6 +1645,12 @@ class FileSequenceChecker(object):
             for files in self._missing.values():
                 numfiles += len(files)
             return numfiles
+        elif attr == "duplicates":
+            return self._duplicates
+        elif attr == "badpadding":
+            return self._badpadding
+        elif attr == "badsizes":
+            return self._badsizes
         elif attr == "totalprocessed":
             numprocessed = 0
             for files in self._dircontents.values():
@@ -460,37 +1659,243 @@ class FileSequenceChecker(object):
         else:
             return None
         
+    def __getstate__(self):
+        # the scan cache's database connection can't be pickled
+        # and isn't needed by worker processes anyway, neither are
+        # the results of earlier runs
+        state = self.__dict__.copy()
+        state['_cache'] = None
+        state['_statpool'] = None
+        state['lastresult'] = None
+        state['_missing'] = {}
+        state['_dircontents'] = {}
+        state['_duplicates'] = {}
+        state['_badpadding'] = {}
+        state['_badsizes'] = {}
+        return state
+    
     def setfileexcludes(self, filenames, extend=True):
         '''Set a list of file names to be excluded from being evaluated.
         
         Often these are hidden or system files, like C{.DS_Store} 
         on a Mac or C{Thumbs.db} on a Windows PC for example.
         
-        @param filenames: a list of file names
+        Names containing C{*}, C{?} or C{[} are glob patterns (see 
+        C{fnmatch}, matched case-sensitively), e.g. C{*.tmp} or C{._*}. 
+        Plain names are kept in a set and all glob patterns are 
+        compiled into one regex, so the cost per file doesn't 
+        grow with the number of excludes. 
+        
+        Only this instance is affected, L{FILEEXCLUDES} stays unchanged.
+        
+        @param filenames: a list of file names and glob patterns
         @type filenames: C{list}
-        @param extend: should the default list be extended 
+        @param extend: should the current excludes be extended 
                        or replaced?
         @type extend: C{bool}
         '''
-        if extend: 
-            self._fileexcludes.extend(filenames)
+        names = set()
+        globs = set()
+        for filename in filenames:
+            if any(c in filename for c in '*?['):
+                globs.add(filename)
+            else:
+                names.add(filename)
+        if extend:
+            names |= self._fileexcludes
+            globs |= self._fileexcludeglobs
+        self._fileexcludes = frozenset(names)
+        self._fileexcludeglobs = frozenset(globs)
+        if globs:
+            self._fileexcludeglob = re.compile(u'|'.join(u'(?:%s)' % fnmatch.translate(g) for g in sorted(globs)))
         else:
-            self._fileexcludes = filenames
+            self._fileexcludeglob = None
             
+    def setscancache(self, cache):
+        '''Use a persistent cache of scan results, so that only directories 
+        modified since the last scan need to be listed and processed again.
+        
+        @param cache: a L{ScanCache} or the file path of its database, 
+                      or C{None} to stop using a cache.
+        @type cache: L{ScanCache} or C{unicode}
+        '''
+        if isinstance(cache, basestring):
+            cache = ScanCache(cache)
+        self._cache = cache
+        
+    def setstats(self, enabled=True):
+        '''Collect per-phase timings and counts in a L{ScanStats} for 
+        each call of L{processdir()}, L{iter_missing()} or 
+        L{iter_sequences()}, available as C{laststats} afterwards.
+        
+        @param enabled: C{False} turns collecting stats off again.
+        @type enabled: C{bool}
+        '''
+        self._collectstats = bool(enabled)
+        
+    def setsizecheck(self, tolerance=0.5):
+        '''Check the sizes of the files too, flagging empty files and 
+        files whose size deviates from the median size of their file 
+        sequence by more than C{tolerance}, e.g. truncated files left 
+        behind by a crashed render. 
+        
+        The files are C{stat}ed in batches from a pool of threads and the 
+        sizes are stored in the scan cache along with the file names, 
+        except for directories with flagged files.
+        
+        @param tolerance: relative deviation from the median, e.g. C{0.5} 
+                          flags files smaller than half or bigger than one 
+                          and a half times the median size. C{None} turns 
+                          checking sizes off.
+        @type tolerance: C{float}
+        @raise ValueError: if C{tolerance} is negative.
+        '''
+        if tolerance is not None:
+            tolerance = float(tolerance)
+            if tolerance < 0:
+                raise ValueError("E: size tolerance must be positive")
+        self._sizetolerance = tolerance
+        
+    def setstep(self, step):
+        '''Set the step between the sequence numbers of file sequences 
+        with only every Nth frame, e.g. 2 for sequences rendered on twos, 
+        so that only files missing from that grid are reported instead 
+        of every other file.
+        
+        With C{'auto'} the step of each file sequence is detected as the 
+        greatest common divisor of the differences between its sequence 
+        numbers. Since a hole can't be told apart from a step without 
+        more files, sequences with less than 3 files always get a step of 
+        1. This is not the default because gaps at regular intervals make 
+        a sequence look stepped too. Expected frame ranges (see 
+        L{setexpectations()}) bring their own step.
+        
+        @param step: a positive C{int}, C{'auto'} or C{None} for a step of 1
+        @type step: C{int} or C{str}
+        @raise ValueError: if C{step} isn't a positive C{int} or C{'auto'}.
+        '''
+        if step is not None and step != 'auto' and (not isinstance(step, int) or step < 1):
+            raise ValueError("E: step must be a positive int or 'auto'")
+        self._step = step
+        
+    def setexpectations(self, expectations):
+        '''Check file sequences against known frame ranges instead of the 
+        global C{start}/C{end} range, reporting missing files before the 
+        first and after the last file present too.
+        
+        Sequences are identified by their pattern like in the output 
+        (see L{GapRange.sequence}), e.g. C{beauty.####.exr}, which applies 
+        to sequences of that name in any directory, or prefixed with a 
+        directory path, e.g. C{shots/sh010/beauty.####.exr}, which takes 
+        precedence. Relative directory paths are relative to the current 
+        directory. Frame ranges are given as C{(first, last, step)}, 
+        including C{last}. Frames off the C{step} grid or outside the 
+        range are ignored. 
+        
+        Expectations are kept in a dict, so each sequence costs one 
+        lookup regardless of the number of expectations.
+        
+        An expectations file has one pattern and frame range per line, 
+        separated by whitespace, e.g.::
+        
+            beauty.####.exr 1001-1100
+            shots/sh020/beauty.####.exr 1001-1240x2
+        
+        @param expectations: dict of C{(first, last, step)} tuples keyed 
+                             by pattern, the path of an expectations file 
+                             or C{None} to remove all expectations.
+        @type expectations: C{dict} or C{unicode}
+        @raise ValueError: if the file or a frame range isn't valid.
+        @raise IOError: if the file can't be read.
+        '''
+        if expectations is None:
+            expectations = {}
+        elif isinstance(expectations, basestring):
+            expectationsfile = open(expectations, 'rb')
+            try:
+                expectations = _read_expectations(expectationsfile)
+            finally:
+                expectationsfile.close()
+        else:
+            result = {}
+            for pattern, framerange in expectations.items():
+                framerange = tuple(framerange)
+                if len(framerange) == 2:
+                    framerange += (1,)
+                first, last, step = framerange
+                if last < first or step < 1:
+                    raise ValueError("E: invalid frame range %s for %s" % (framerange, pattern))
+                result[_expectation_key(pattern)] = framerange
+            expectations = result
+        self._expectations = expectations
+        
+    def setshard(self, shard):
+        '''Only process one of several shards of the tree, so that 
+        independent processes (e.g. on different hosts) can each 
+        process one shard. 
+        
+        The sub directories directly below the processed directories 
+        are assigned to shards by a hash of their name, which is the 
+        same on all hosts, and the files of the processed directories 
+        themselves belong to shard 0. Together the shards process 
+        each directory exactly once.
+        
+        @param shard: C{(index, count)} tuple with the 0-based shard 
+                      index and the number of shards, or C{None} to 
+                      process the whole tree.
+        @type shard: C{tuple}
+        @raise ValueError: if C{index} isn't in C{range(count)}.
+        '''
+        if shard is not None:
+            index, count = shard
+            if not isinstance(index, int) or not isinstance(count, int) or not 0 <= index < count:
+                raise ValueError("E: invalid shard %s/%s: index must be in the range 0 to count - 1" % (index, count))
+            shard = (index, count)
+        self._shard = shard
+        
     def setexcludepattern(self, pattern):
         '''Paths matching this pattern will be excluded from being evaluated,
         e.g. not included in the prepared directory contents.
         
         @note: excluding has precedence over including.
-        @param pattern: a regex pattern
+        @note: a pattern without a path separator (C{/}) is matched 
+               against the file name only, otherwise against the 
+               file's path.
+        @param pattern: a regex pattern, or C{None} to exclude nothing
         @type pattern: C{regex}
+        @raise ValueError: if C{pattern} isn't a valid regex pattern.
         '''
+        self._excludefilter = pattern and _PathFilter(pattern) or None
         self._excludepat = pattern
         
     def setincludepattern(self, pattern):
-        ''' Only paths matching this regex pattern will be evaluated. '''
+        ''' Only paths matching this regex pattern will be evaluated. 
+        
+        @note: a pattern without a path separator (C{/}) is matched 
+               against the file name only, otherwise against the 
+               file's path.
+        @raise ValueError: if C{pattern} isn't a valid regex pattern.
+        '''
+        self._includefilter = pattern and _PathFilter(pattern) or None
         self._includepat = pattern
         
+    def setdirexcludepattern(self, pattern):
+        '''Sub directories matching this pattern won't be descended into 
+        when processing recursively, skipping their whole subtree. 
+        
+        A directory's path is matched with a trailing path separator, 
+        so e.g. C{/cache/} matches all directories named C{cache}. 
+        Like for L{setexcludepattern()} a pattern without a path 
+        separator is matched against the directory name only. The 
+        directories passed to L{processdir()} are never excluded.
+        
+        @param pattern: a regex pattern, or C{None} to exclude nothing
+        @type pattern: C{regex}
+        @raise ValueError: if C{pattern} isn't a valid regex pattern.
+        '''
+        self._direxcludefilter = pattern and _PathFilter(pattern) or None
+        self._direxcludepat = pattern
+        
     def setsplitpattern(self, pattern, template=None):
         '''
         Set the regex pattern that will split the file name into name and 
@@ -518,7 +1923,11 @@ class FileSequenceChecker(object):
         @type template: C{unicode}
         @raise ValueError: if the regex pattern doesn't contain one 
                            named regex group called C{filename} and 
-                           one named group called C{seqnum}.
+                           one named group called C{seqnum}, if an 
+                           order can't be inferred from the order 
+                           of these groups or if the pattern can't 
+                           be compiled.
+        @raise TypeError: if C{pattern} is a C{dict}.
         '''
         def __verify_template(pt, tp):
             '''Utility function for verifying that the format template 
@@ -569,33 +1978,46 @@ class FileSequenceChecker(object):
                     print "Warning: pattern doesn't include a 'seqnum' group!"
                 raise ValueError("E: pattern doesn't include a 'seqnum' group!")
             return '%s' % pat
+        def __infer_order(pat):
+            '''Utility function for inferring the order from whichever 
+            group name comes first in the pattern.
+            
+            @param pat: regex pattern
+            @type pat: C{regex}
+            @raise ValueError: if an order can not be inferred.
+            @return: C{normal} or C{reverse}
+            @rtype: C{str}
+            '''
+            d = [m.group(0) for m in re.finditer(ur'(filename|seqnum)', pat)]
+            if d[0] == 'filename' and d[1] == 'seqnum':
+                return 'normal'
+            elif d[0] == 'seqnum' and d[1] == 'filename':
+                return 'reverse'
+            raise ValueError("E: order for split pattern is undefined!")
         # reset splitpat to default if arg is None
         if pattern is None:
             self._splitpat = self.SPLITPAT
+            self._splitter = _Splitter(self.SPLITPAT)
             return
         elif isinstance(pattern, (str, unicode)):
             if not template:
                 raise ValueError("E: template must not be None when supplying pattern as unicode string")
             __verify_template(pattern, template)
-            self._splitpat = __sanitize_pattern(pattern)
+            pattern = __sanitize_pattern(pattern)
+            order = __infer_order(pattern)
+            try:
+                compiled = re.compile(pattern)
+            except re.error, e:
+                raise ValueError("E: invalid split pattern (%s)" % e)
+            # analyse and compile once so that splitting 
+            # doesn't need to do it again for each file name
+            self._splitter = _Splitter([{'pattern': compiled, 'order': order}], template)
+            self._splitpat = pattern
+            self._template = template
         elif isinstance(pattern, dict):
-            tmp = {}
-            for k, v in pattern.iteritems():
-                tmp[k] = __sanitize_pattern(v)
-            self._splitpat = tmp
-        
-    def _reset(self):
-        '''Reset comparance vars to their initial state.
-        
-        Not to be called for reseting the instance
-        to complete defaults but rather from one of
-        the loops during the pre-processing and
-        processing steps.
-        '''
-        self._lastfilebarename = u''
-        self._nextseqnum = -1
-        self._seqnumwidth = -1
-        self._missingfiles = []
+            # splitfilename() has no way to use a dict of patterns, so 
+            # don't let it silently keep splitting with the old ones
+            raise TypeError("E: split pattern is not of type unicode or list.")
         
     def splitfilename(self, filename):
         '''Using self._splitpat split the filename into filename and seqnum part.
@@ -609,22 +2031,21 @@ class FileSequenceChecker(object):
         Internally the list form is the default and will see each pattern 
         used to perform a match so that more file sequence naming cases 
         can be covered – especially when multiple differently named file 
-        sequences co-exist in the same directory.
+        sequences co-exist in the same directory. The patterns of the list
+        are combined into one regex, so that each file name is scanned 
+        just once (see L{_Splitter}).
         
         @param filename: unicode string representing the file name
         @type filename: C{unicode}
-        @return: dictionary with three entries: a file name (C{filename}), 
-                 a sequence number (C{seqnum}) and an order (C{order}), 
-                 where reverse order is seqnum then filename and normal 
-                 order is filename then seqnum. 
+        @return: file name parts with a file name (C{filename}), 
+                 a sequence number (C{seqnum}), a file extension 
+                 (C{fileext}) and an order (C{order}), where reverse 
+                 order is seqnum then filename and normal order is 
+                 filename then seqnum. 
         @note: May return C{None} if no match could be made so that an 
                enclosing loop can know when to continue.
-        @rtype: C{dict} or C{None}
+        @rtype: L{FileParts} or C{None}
         @raise TypeError: if C{self._splitpat} is not of type C{unicode} or C{list}.
-        @raise ValueError: When C{self._splitpat} is of type C{unicode} 
-                           and an order can not be inferred by parsing 
-                           the pattern and looking for what the ordering 
-                           is between both named groups.
         '''
         
         _filename, _fileext = os.path.splitext(filename)
@@ -634,9 +2055,9 @@ class FileSequenceChecker(object):
         if len(_filename) == 0:
             _filename = _fileext
             _fileext = ""
-        if not re.search(ur'\d+', _filename):
+        if not _DIGIT.search(_filename):
             # Take care of cases where numbers are found only in the fileext
-            if not re.search(ur'\d+', _fileext):
+            if not _DIGIT.search(_fileext):
                 return
             else:
                 _filename = "%s%s" % (_filename, _fileext)
@@ -647,73 +2068,255 @@ class FileSequenceChecker(object):
         
         #print "filename = %s, fileext = %s" % (filename, fileext)
         
-        if isinstance(self._splitpat, unicode):
-            # infer ordering from whichever group name comes first
-            fi = re.finditer(ur'(filename|seqnum)', self._splitpat)
-            i = 0
-            d = {}
-            for m in fi:
-                d[i] = m.group(0)
-                i += 1
-            if d[0] == 'filename' and d[1] == 'seqnum':
-                order = 'normal'
-            elif d[0] == 'seqnum' and d[1] == 'filename':
-                order = 'reverse'
-            else:
-                raise ValueError("E: order for split pattern is undefined!")
-            if self._strictmatching:
-                match = re.match(self._splitpat, filename)
-            else:
-                match = re.match(self._splitpat, filename)
+        if isinstance(self._splitpat, basestring):
+            # order and compiled pattern were determined by setsplitpattern()
+            match = self._splitter.match(filename)
             if match:
-                if len(match.group('filename')) == 0:
+                order, groups = match
+                if len(groups['filename']) == 0:
                     if DEBUG: 
                         print "%s: filename group is empty. Continuing..." % filename
-                elif len(match.group('seqnum')) == 0:
+                elif len(groups['seqnum']) == 0:
                     if DEBUG: 
                         print "%s: seqnum group is empty. Continuing..." % filename
                 else:
-                    result = {
-                        'filename': match.group('filename'), 
-                        'seqnum': match.group('seqnum'), 
-                        'fileext': fileext, 
-                        'order': order
-                    }
-                    if 'filename2' in match.groupdict():
-                        result['filename2'] = match.group('filename2')
-                    return result
+                    return FileParts(groups['filename'], groups['seqnum'], fileext, order, 
+                                     groups.get('filename2'))
             return None
         elif isinstance(self._splitpat, list):
-            i = 1
-            splen = len(self._splitpat)
-            for d in self._splitpat:
-                _pattern = d['pattern']
-                _order = d['order']
+            # all patterns are tried at once by the combined matcher 
+            match = self._splitter.match(filename)
+            if match:
+                order, groups = match
                 if DEBUG: 
-                    print "Trying %s pattern %d of %d" % (_order, i, splen)
-                if self._strictmatching:
-                    match = re.match(_pattern, filename)
-                else:
-                    match = re.match(_pattern, filename)
-                if match:
-                    result = {
-                        'filename': match.group('filename'), 
-                        'seqnum': match.group('seqnum'), 
-                        'fileext': fileext,
-                        'order': _order
-                    }
-                    if match.groupdict().has_key('filename2'):
-                        result['filename2'] = match.group('filename2')
-                    if match.groupdict().has_key('filename3'):
-                        print "groupdict().has_key('filename3')"
-                    if DEBUG: 
-                        print "Using pattern no. %d" % i
-                    return result
-                i += 1
+                    print "Matched %s pattern" % order
+                return FileParts(groups['filename'], groups['seqnum'], fileext, order, 
+                                 groups.get('filename2'))
             return None
         else:
             raise TypeError("split pattern is not of type unicode or list.")
         
+    def _checkinpath(self, inpath):
+        '''
+        Convert C{inpath} to C{unicode} and verify that it 
+        points to an existing directory.
+        
+        @param inpath: a file path string
+        @type inpath: C{str} or C{unicode}
+        @return: the unicode file path
+        @rtype: C{unicode}
+        @raise ValueError: if the C{inpath} doesn't exist or 
+                           if C{inpath} is not a directory.
+        '''
+        # Paths could contain chars > 128 so try to use system's
+        # default encoding if it is not ASCII. Otherwise use UTF-8.
+        defaultencoding = sys.getdefaultencoding()
+        if not isinstance(inpath, unicode):
+            if defaultencoding == 'ascii':
+                inpath = inpath.decode('utf-8')
+            else:
+                inpath = unicode(inpath, defaultencoding)
+        self.lastsyscallcount += 1
+        if not os.path.exists(inpath):
+            raise ValueError("E: path (%s) doesn't exist!" % inpath)
+        self.lastsyscallcount += 1
+        if not os.path.isdir(inpath):
+            raise ValueError("E: inpath (%s) is not a directory!" % inpath)
+        return inpath
+    
+    def _checkinpaths(self, inpaths):
+        '''
+        Verify a directory path or list of directory paths with 
+        L{_checkinpath()} and drop paths that would be scanned twice: 
+        duplicates and, if C{self.recursive} is set, paths below 
+        another given path.
+        
+        @param inpaths: a file path string or a list of them
+        @type inpaths: C{str}, C{unicode} or C{list}
+        @return: the unicode file paths, in the given order
+        @rtype: C{list}
+        @raise ValueError: if a path doesn't exist or is not a directory.
+        '''
+        if isinstance(inpaths, basestring):
+            inpaths = [inpaths]
+        inpaths = [self._checkinpath(inpath) for inpath in inpaths]
+        realpaths = [os.path.join(os.path.realpath(inpath), u'') for inpath in inpaths]
+        result = []
+        seen = set()
+        for inpath, realpath in zip(inpaths, realpaths):
+            if realpath in seen:
+                continue
+            if self.recursive and any(realpath != other and realpath.startswith(other) 
+                                      for other in realpaths):
+                continue
+            seen.add(realpath)
+            result.append(inpath)
+        return result
+    
+    def _displaypath(self, adir):
+        ''' Return the path C{adir} is keyed by in C{self._missing}. '''
+        if self.fullpaths:
+            return os.path.join(os.path.abspath(os.curdir), adir)
+        return adir
+        
+    def _prepare_files(self, root, files, verbose=0):
+        '''
+        Filter and split the file names of one directory and return 
+        them as a list, sorted naturally-like: first by sequence number 
+        then alphabetically by file name.
+        
+        @param root: path to the directory containing C{files}
+        @type root: C{unicode}
+        @param files: file names found in C{root}
+        @type files: C{list}
+        @param verbose: print informational messages to C{stdout}.
+        @type verbose: C{int}
+        @return: sorted list of file name parts 
+                 (see L{splitfilename()}).
+        @rtype: L{FileList}
+        '''
+        stats = self.laststats
+        if stats is not None:
+            start = _monotonic()
+        kept = []
+        sortedfiles = []
+        names = []
+        checksizes = self._sizetolerance is not None
+        excludefilter = self._excludefilter
+        includefilter = self._includefilter
+        fileexcludes = self._fileexcludes
+        fileexcludeglob = self._fileexcludeglob
+        for f in files:
+            thefile = f
+            if thefile in fileexcludes:
+                continue
+            if fileexcludeglob and fileexcludeglob.match(thefile):
+                continue
+            if excludefilter and excludefilter.matchfile(root, thefile):
+                if verbose > 0: print "Excluding %s" % os.path.join(root, thefile)
+                continue
+            if includefilter and not includefilter.matchfile(root, thefile):
+                if verbose > 0: print "Not including %s" % os.path.join(root, thefile)
+                continue
+            kept.append(thefile)
+        if stats is not None:
+            filtered = _monotonic()
+            stats.times['filter'] += filtered - start
+        for thefile in kept:
+            nameparts = self.splitfilename(thefile)
+            if nameparts:
+                sortedfiles.append(nameparts)
+                if checksizes:
+                    names.append(thefile)
+                if DEBUG:
+                    print "Matched groups = %s" % nameparts
+            else:
+                if DEBUG:
+                    print("Result for splitting '%s' with given regex pattern(s) is None. Continuing..." % 
+                          thefile)
+                continue
+        if checksizes:
+            for nameparts, size in zip(sortedfiles, self._stat_sizes(root, names)):
+                nameparts['size'] = size
+        if stats is None:
+            return self._group_files(sortedfiles)
+        split = _monotonic()
+        sortedfiles = self._group_files(sortedfiles)
+        stats.times['split'] += split - filtered
+        stats.times['group'] += _monotonic() - split
+        stats.counts['files'] += len(files)
+        stats.counts['excluded'] += len(files) - len(kept)
+        stats.counts['unsplittable'] += len(kept) - len(sortedfiles)
+        return sortedfiles
+    
+    def _stat_sizes(self, root, names):
+        '''
+        Get the sizes of the files C{names} in directory C{root}, 
+        C{stat}ing them in batches from a pool of L{STATTHREADS} threads 
+        since C{stat} calls mostly wait on I/O, especially on network 
+        file systems.
+        
+        @return: list of file sizes in bytes, C{None} for 
+                 files that couldn't be C{stat}ed.
+        @rtype: C{list}
+        '''
+        self.lastsyscallcount += len(names)
+        paths = [os.path.join(root, name) for name in names]
+        if len(paths) < 2 * self.STATBATCH:
+            return map(_stat_size, paths)
+        if self._statpool is None or self._statpool[0] != os.getpid():
+            # a pool inherited by a forked worker process has no threads
+            self._statpool = (os.getpid(), ThreadPool(self.STATTHREADS))
+        return self._statpool[1].map(_stat_size, paths, self.STATBATCH)
+    
+    def _group_files(self, files):
+        '''
+        Group file name parts into file sequences and sort them.
+        
+        Files are put into buckets keyed by file sequence (see 
+        L{_sequence_key()}) in one pass, converting each sequence number 
+        to C{int} once. Then each bucket is sorted by these C{int}s and 
+        the buckets are concatenated, ordered alphabetically by file name. 
+        Files with the same sequence number keep their relative order.
+        
+        All files of a file sequence are made to share the file name 
+        and extension strings of its first file, so that only one copy 
+        of them is kept alive per file sequence. Regular file sequences 
+        are then replaced by a L{FrameSet} (see L{FileList}).
+        
+        @param files: file name parts (see L{splitfilename()}).
+        @type files: C{list} of L{FileParts}
+        @return: the file name parts, sorted by file sequence 
+                 and sequence number.
+        @rtype: L{FileList}
+        '''
+        buckets = {}
+        for nameparts in files:
+            key = _sequence_key(nameparts)
+            frames = buckets.get(key)
+            if frames is None:
+                frames = buckets[key] = []
+            else:
+                first = frames[0][1]
+                nameparts.filename = first.filename
+                nameparts.fileext = first.fileext
+                if 'filename2' in first:
+                    nameparts.filename2 = first.filename2
+            frames.append((int(nameparts['seqnum'], 10), nameparts))
+        sequences = []
+        for key in sorted(buckets):
+            frames = buckets[key]
+            frames.sort(key=itemgetter(0))
+            sequences.append(_frame_run([nameparts for _iseqnum, nameparts in frames], 
+                                        [iseqnum for iseqnum, _nameparts in frames], self.MINDENSITY))
+        return FileList(sequences)
+        
+    def _shard_dirs(self, dirs):
+        '''
+        Return the sub directory paths C{dirs} of a processed 
+        directory that belong to the shard set by L{setshard()}.
+        '''
+        if self._shard is None:
+            return dirs
+        index, count = self._shard
+        return [adir for adir in dirs if _shard_of(os.path.basename(adir), count) == index]
+    
+    def _prune_dirs(self, dirs, verbose=0):
+        '''
+        Return the sub directory paths C{dirs} without those 
+        matching the directory exclude pattern.
+        '''
+        direxcludefilter = self._direxcludefilter
+        if not direxcludefilter:
+            return dirs
+        result = []
+        for adir in dirs:
+            if direxcludefilter.matchdir(adir):
+                if verbose > 0: print "Excluding directory %s" % adir
+                continue
+            result.append(adir)
+        return result
+        
     def _prepare_dir_contents(self, inpath, verbose=0):
         '''
         Prepare C{self._dircontents} to contain directory contents in 
@@ -735,289 +2338,1627 @@ class FileSequenceChecker(object):
         @raise ValueError: if the C{inpath} doesn't exist or 
                            if C{inpath} is not a directory.
         '''
-        # Paths could contain chars > 128 so try to use system's
-        # default encoding if it is not ASCII. Otherwise use UTF-8.
-        defaultencoding = sys.getdefaultencoding()
-        if not isinstance(inpath, unicode):
-            if defaultencoding == 'ascii':
-                inpath = inpath.decode('utf-8')
-            else:
-                inpath = unicode(inpath, defaultencoding)
-        if not os.path.exists(inpath):
-            raise ValueError("E: path (%s) doesn't exist!" % inpath)
-        if os.path.isdir(inpath):
-            for root, _dirs, files in os.walk(inpath):
-                sortedfiles = []
-                for f in files:
-                    thefile = f
-                    filepath = os.path.join(root, thefile)
-                    if not os.path.exists(filepath):
-                        raise ValueError("E: path (%s) doesn't exist!" % filepath)
-                    if thefile in self._fileexcludes:
-                        continue
-                    if self._excludepat and re.search(self._excludepat, filepath):
-                        if verbose > 0: print "Excluding %s" % filepath
-                        continue
-                    if self._includepat and not re.search(self._includepat, filepath):
-                        if verbose > 0: print "Not including %s" % filepath
-                        continue
-                    nameparts = self.splitfilename(thefile)
-                    if nameparts:
-                        sortedfiles.append(nameparts)
-                        if DEBUG:
-                            print "Matched groups = %s" % nameparts
-                    else:
-                        if DEBUG:
-                            print("Result for splitting '%s' with given regex pattern(s) is None. Continuing..." % 
-                                  thefile)
-                        self._reset()
-                        continue
-                def seqnum_compare(x, y):
-                    ''' Compare int value of two sequence numbers. '''
-                    return int(x, 10) - int(y, 10)
-                def filename_compare(x, y):
-                    ''' Compare two file names alphabetically. '''
-                    return cmp(x, y)
-                sortedfiles = sorted(sortedfiles, key=itemgetter('seqnum'), cmp=seqnum_compare) # sort by seqnum
-                sortedfiles = sorted(sortedfiles, key=itemgetter('filename'), cmp=filename_compare) # sort by filename
-                self._dircontents[root] = sortedfiles
+        inpath = self._checkinpath(inpath)
+        for root, files in self._walk(inpath):
+            self._dircontents[root] = self._prepare_files(root, files, verbose)
+            
+    def _walk(self, inpath):
+        '''
+        Generate the file names of C{inpath} and, if C{self.recursive}
+        is set, of all its sub directories, top-down.
+        
+        @param inpath: a unicode file path string
+        @type inpath: C{unicode}
+        @return: generator of directory path, list of file names pairs.
+        @rtype: C{generator}
+        '''
+        stack = [inpath]
+        while stack:
+            root, dirs, files, syscalls = _list_dir(stack.pop())
+            self.lastsyscallcount += syscalls
+            yield root, files
+            if not self.recursive:
+                return
+            stack.extend(reversed(self._prune_dirs(dirs)))
+            
+    def _scan(self, inpath, verbose=0):
+        '''
+        Prepare and compare the contents of C{inpath} directory by directory.
+        
+        Each directory is yielded as soon as it is done, nothing is
+        stored in C{self._dircontents} or C{self._missing}.
+        
+        @param inpath: a unicode file path string or a list of them, 
+                       see L{_checkinpaths()}.
+        @type inpath: C{unicode} or C{list}
+        @param verbose: print informational messages.
+        @type verbose: C{int}
+        @return: generator of tuples with the directory path, the path 
+                 missing files are keyed by, sorted file list and 
+                 L{MissingFiles} (or C{None}) for each directory.
+        @rtype: C{generator}
+        @raise ValueError: if the C{inpath} doesn't exist or 
+                           if C{inpath} is not a directory.
+        '''
+        if self.recursive and self.workers > 1:
+            for result in self._scan_parallel(inpath, verbose):
+                yield result
+            return
+        stack = self._checkinpaths(inpath)
+        roots = set(stack)
+        stack.reverse()
+        stats = self.laststats
+        try:
+            while stack:
+                path = stack.pop()
+                # with sharding the files of the given directories belong to shard 0
+                ownfiles = path not in roots or self._shard is None or self._shard[0] == 0
+                if stats is not None:
+                    start = _monotonic()
+                    stats.counts['dirs'] += 1
+                cached = dirstat = None
+                if self._cache is not None:
+                    dirstat = _stat_dir(path)[1]
+                    self.lastsyscallcount += 1
+                    cached = self._cache_lookup(path, dirstat)
+                if cached is not None:
+                    dirs, files, missingfiles = cached
+                    if stats is not None:
+                        stats.times['walk'] += _monotonic() - start
+                        stats.counts['files'] += len(files)
+                else:
+                    root, dirs, files, syscalls = _list_dir(path)
+                    self.lastsyscallcount += syscalls
+                    if stats is not None:
+                        stats.times['walk'] += _monotonic() - start
+                    if ownfiles:
+                        files = self._prepare_files(root, files, verbose)
+                        missingfiles = self._compare_files(self._displaypath(root), files, verbose)
+                        self._cache_store(path, dirstat, dirs, files, missingfiles)
+                if ownfiles:
+                    yield path, self._displaypath(path), files, missingfiles
                 if not self.recursive:
-                    return
+                    continue
+                if path in roots:
+                    dirs = self._shard_dirs(dirs)
+                stack.extend(reversed(self._prune_dirs(dirs, verbose)))
+        finally:
+            if self._cache is not None:
+                self._cache.commit()
+            
+    def _cache_key(self):
+        '''
+        Return a key describing all settings the results of 
+        a scan depend on, for looking up L{ScanCache} entries.
+        
+        @rtype: C{str}
+        '''
+        if isinstance(self._splitpat, list):
+            splitpat = [(getattr(d['pattern'], 'pattern', d['pattern']), d['order']) for d in self._splitpat]
         else:
-            raise ValueError("E: inpath (%s) is not a directory!" % inpath)
+            splitpat = self._splitpat
+        # sub directory lists are stored before pruning, 
+        # so the directory exclude pattern doesn't matter
+        config = (ScanCache.VERSION, self.start, self.end, splitpat, 
+                  sorted(self._fileexcludes | self._fileexcludeglobs), self._includepat, self._excludepat, 
+                  sorted(self._expectations.items()), self._step, self._sizetolerance is not None)
+        return hashlib.md5(repr(config)).hexdigest()
+    
+    def _cache_lookup(self, path, dirstat):
+        '''
+        Look up the scan results of a directory in C{self._cache}.
+        
+        @param path: path to the directory
+        @type path: C{unicode}
+        @param dirstat: modification time and inode of the directory, 
+                        as returned by L{_stat_dir()}.
+        @type dirstat: C{tuple}
+        @return: full paths of the sub directories, sorted file list and
+                 L{MissingFiles} (or C{None}) of the directory, or 
+                 C{None} if there is no up-to-date entry.
+        @rtype: C{tuple}
+        '''
+        if self._cache is None or dirstat is None:
+            return None
+        data = self._cache.get(os.path.abspath(path), dirstat[0], dirstat[1], self._cache_key())
+        if data is None:
+            return None
+        dirnames, packedfiles, gaps = data
+        files = _unpack_files(packedfiles)
+        dirs = [os.path.join(path, dirname) for dirname in dirnames]
+        if gaps:
+            return dirs, files, MissingFiles([GapRange(*gap) for gap in gaps])
+        return dirs, files, None
+    
+    def _cache_store(self, path, dirstat, dirs, files, missingfiles):
+        '''
+        Store the scan results of a directory in C{self._cache}.
+        
+        @see: L{_cache_lookup()} for the parameters.
+        '''
+        if self._cache is None or dirstat is None:
+            return
+        if self._sizetolerance is not None and \
+           any(_find_bad_sizes(files, self._sizetolerance).values()):
+            # files with a bad size may still be being written, 
+            # which doesn't change the directory's modification time
+            return
+        dirnames = [os.path.basename(adir) for adir in dirs]
+        gaps = []
+        if missingfiles:
+            gaps = [tuple(gap) for gap in missingfiles.gaps]
+        self._cache.put(os.path.abspath(path), dirstat[0], dirstat[1], self._cache_key(), 
+                        (dirnames, _pack_files(files), gaps))
+            
+    def _compare_files(self, bdir, files, verbose=0):
+        '''
+        Compare each file of a directory's sorted file list with its 
+        successor within the same file sequence, collecting missing files.
         
-    def _compare_file(self, dir, curfilenameparts, nextfilenameparts, verbose=0): # IGNORE:W0622
-        '''
-        Compare one file with the next file in the sequence.
-        
-        This method is called during processing of the loop which 
-        iterates over all file sequences.
-        
-        Compares C{self._lastfilebarename} and C{self._nextseqnum} to the 
-        current C{filebarename} and C{iseqnum} (int converted from seqnum) 
-        and if C{self._nextseqnum} is smaller than C{iseqnum + 1}, calulcates 
-        the range of the missing files and appends it as C{list} of C{unicode}
-        to the C{self._missing} dictionary.
-        
-        @param dir: the path to the currently processed directory.
-        @type dir: C{unicode}
-        @param curfilenameparts: file name, sequence number, file 
-                                 extension and order of the I{current}
-                                 file.
-        @type curfilenameparts: C{dict}
-        @param nextfilenameparts: file name, sequence number, file 
-                                  extension and order of the I{next}
-                                  file.
-        @type nextfilenameparts: C{dict}
+        @param bdir: the path the missing files will be keyed by.
+        @type bdir: C{unicode}
+        @param files: sorted file list as returned by L{_prepare_files()}
+        @type files: C{list}
         @param verbose: include verbose output.
         @type verbose: C{int}
-        @note: I{current} and I{next} are not neccessarily referring
-               to files from the same file sequence they may also be
-               from different file sequences, signaling the current
-               file will be the last of its sequence.
-        @return: 
-            False if enclosing caller loop should break.
-            True if enclosing caller loop should continue.
-        @rtype: C{bool}
-        '''
-        if curfilenameparts is None:
-            if DEBUG or TESTRUN: 
-                print "Warning: curfilenameparts is None"
-            return True        
-        if nextfilenameparts is None:
-            if DEBUG or TESTRUN: 
-                print "Warning: nextfilenameparts is None"
-            return True
-        filebarename = curfilenameparts['filename']
-        if 'filename2' in curfilenameparts:
-            filename2 = curfilenameparts['filename2']
+        @return: the missing files of the directory or C{None} 
+                 if nothing is missing.
+        @rtype: L{MissingFiles}
+        '''
+        stats = self.laststats
+        if stats is not None:
+            start = _monotonic()
+        numsequences = 0
+        gaps = []
+        for sequence in _iter_sequences(files):
+            numsequences += 1
+            if verbose > 0:
+                for nameparts in sequence:
+                    print "Processing '%s'" % os.path.join(bdir, _joinfilename(nameparts))
+            padding = _sequence_padding(sequence)
+            if self._expectations:
+                expectation = self._expectation(bdir, sequence, padding)
+                if expectation is not None:
+                    gaps.extend(self._compare_expected(sequence, expectation, padding, verbose))
+                    continue
+            gaps.extend(self._compare_sequence(sequence, padding, verbose))
+        if stats is not None:
+            stats.times['gaps'] += _monotonic() - start
+            stats.counts['sequences'] += numsequences
+        if gaps:
+            return MissingFiles(gaps)
+        return None
+    
+    def _compare_sequence(self, sequence, padding, verbose=0):
+        '''
+        Find the missing files of one file sequence within 
+        C{self.start} and C{self.end} with L{findgaps()}.
+        
+        @param sequence: sorted file name parts of one file sequence
+        @type sequence: C{list}
+        @param padding: padding of the missing file names, 
+                        see L{_sequence_padding()}
+        @type padding: C{int}
+        @return: the L{GapRange}s of missing files
+        @rtype: C{list}
+        '''
+        start = self.start if isinstance(self.start, int) else 0
+        end = self.end if isinstance(self.end, int) else 0
+        if isinstance(sequence, _FrameRun):
+            frames = sequence.frames
         else:
-            filename2 = ''
-        seqnum = curfilenameparts['seqnum']
-        fileext = curfilenameparts['fileext']
-        order = curfilenameparts['order']
-        nextfilebarename = nextfilenameparts['filename']
-        _nextseqnum = nextfilenameparts['seqnum']
-        _nextfileext = nextfilenameparts['fileext']
-        _nextorder = nextfilenameparts['order']
-        try:
-            # Try converting all the numerical strings that we absolutely need as numbers
-            iseqnum = int(seqnum, 10)
-            if isinstance(self.start, int):
-                start = self.start
-            else:
-                start = 0
-            if isinstance(self.end, int):
-                end = self.end
-            else:
-                end = 0
-        except TypeError, e:
-            if DEBUG or verbose > 0: 
-                print e
-            self._reset()
-            return True
-        except ValueError, e:
-            raise e
-        if start and iseqnum < start:
-            if DEBUG or verbose > 0: 
-                print "sequence number (%i) < start (%i). Continuing..." % (iseqnum, start)
-            return True      
-        if order == 'reverse':
-            filename = "%s%s%s" % (filename2, seqnum, filebarename)
+            frames = [int(nameparts['seqnum'], 10) for nameparts in sequence]
+        if self._step == 'auto':
+            step = _detect_step(frames)
         else:
-            filename = "%s%s%s" % (filebarename, seqnum, filename2) 
-        fullfilename = "%s%s" % (filename, fileext) # (filebarename, seqnum, fileext)
-        filepath = os.path.join(dir, fullfilename) 
-        if verbose > 0:
-            print "Processing '%s'" % filepath
-        if self._seqnumwidth < 0:
-            self._seqnumwidth = len(seqnum)
-        if DEBUG:
-            print "filename = %s" % filename
-            print "filename2 = %s" % filename2
-            print "filebarename = %s" % filebarename
-            print "seqnum = %s" % seqnum
-            print "iseqnum = %i" % iseqnum
-            print "order = %s" % order
-            print "nextfilenameparts = %s" % nextfilenameparts                 
-        if self._lastfilebarename == '':
-            # lastfilebarename is empty, which means we are at the beginning 
-            # of a new file sequence. Increment iseqnum into nextseqnum and 
-            # continue interating.
-            self._lastfilebarename = filebarename
-            self._nextseqnum = iseqnum + 1
-            if end and self._nextseqnum > end:
-                if DEBUG or verbose > 0: 
-                    print("next sequence number (%i) would be > end (%i). Stopping iteration..." % 
-                          (self._nextseqnum, end))
-                self._reset()
-            return True
-        if self._lastfilebarename == filebarename:
-            # Test if the lastfilebarename is not empty 
-            # to see if we need to continue checking 
-            # this particular file sequence. If the current
-            # filebarename doesn't match the lastfilebarename
-            # the file sequence has no sucessor so reset
-            # comparance variables and continue. 
-            if self._nextseqnum > 0 and iseqnum != self._nextseqnum:
-                for i in xrange(self._nextseqnum, iseqnum):
-                    # Calculate the missing sequence from the diff of iseqnum and self._nextseqnum
-                    # iseqnum was just converted to int from seqnum of the last encountered filename
-                    # and self._nextseqnum has the next number stored that the last round expected 
-                    # to find next so self._nextseqnum, even though named with "next" in it will be 
-                    # a lower number
-                    if end and i > end:
-                        # When nextseqnum is greater than end we still need
-                        # to produce a missing file list up to end. That's why
-                        # we break inside the loop so that we can reset down
-                        # below when returning True to the enclosing iteration
-                        # loop that will then start processing the next file
-                        # sequence (if there is one).
-                        break
-                    if order == 'reverse':
-                        partsdict = dict(
-                            filename2=filename2,
-                            seqnum="%0.*d" % (self._seqnumwidth, i), 
-                            filebarename=filebarename, 
-                            fileext=fileext
-                        )
-                        missingfilename = "%(filename2)s%(seqnum)s%(filebarename)s%(fileext)s" % partsdict
-                    else:
-                        partsdict = dict(
-                            filename2=filename2,
-                            seqnum="%0.*d" % (self._seqnumwidth, i), 
-                            filebarename=filebarename, 
-                            fileext=fileext
-                        )
-                        missingfilename = "%(filebarename)s%(seqnum)s%(filename2)s%(fileext)s" % partsdict
-                    if DEBUG or verbose > 0: 
-                        print "Missing %s" % missingfilename
-                    if dir in self._missing:
-                        self._missing[dir].append(missingfilename)
-                    else:
-                        self._missing[dir] = []
-                        self._missing[dir].append(missingfilename)
-                if end and iseqnum > end:
-                    if DEBUG or verbose > 0: 
-                        print("sequence number (%i) in next existing file name > end (%i). Stopping iteration..." % 
-                              (iseqnum, end))
-                    # If self.end is reached for a file sequence reset state and return True 
-                    # so that we may continue afresh with the next file sequence from the directory.
-                    self._reset()
-                    return True
-                # Since we just handled a missing range, adjust the nextseqnum 
-                # to start after the end of the missing range
-                self._nextseqnum = iseqnum + 1
-            else:
-                # No missing sequence found. 
-                # Continue iterating over the current file sequence 
-                # based on file bare name.
-                self._nextseqnum += 1
-            if nextfilebarename != filebarename:
-                # Next file(bare)name is not the same as the current,
-                # indicating that a new file sequence is beginning.
-                self._reset()
-            return True
+            step = self._step or 1
+        if isinstance(frames, FrameSet):
+            ranges = frames.gaps(start, end, step)
+        else:
+            ranges = findgaps(frames, start, end, step, self.backend)
+        if not ranges:
+            return []
+        first = sequence[0]
+        prefix, suffix = _affixes(first)
+        gaps = [GapRange(prefix, padding, suffix, first['fileext'], gapstart, gapstop, step) 
+                for gapstart, gapstop in ranges]
+        if DEBUG or verbose > 0: 
+            for gap in gaps:
+                for missingfilename in gap.filenames():
+                    print "Missing %s" % missingfilename
+        return gaps
+        
+    def _expectation(self, bdir, sequence, padding):
+        '''
+        Look up the expected frame range of a file sequence, 
+        see L{setexpectations()}. 
+        
+        The sequence pattern is looked up with C{padding} first. 
+        Since sequence numbers without leading zeros don't tell their 
+        padding, the widths of the sequence numbers present are tried 
+        next, widest first, e.g. C{beauty.####.exr} for C{beauty.1.exr} 
+        next to C{beauty.1001.exr}.
+        
+        @return: C{(first, last, step)} tuple or C{None}
+        @rtype: C{tuple}
+        '''
+        if isinstance(sequence, _FrameRun):
+            # all widths from the lowest to the highest sequence number
+            widths = range(len(sequence[-1]['seqnum']), len(sequence[0]['seqnum']) - 1, -1)
         else:
-            self._reset()
-        return True
+            widths = sorted(set(len(nameparts['seqnum']) for nameparts in sequence), reverse=True)
+        for width in [padding] + widths:
+            pattern = _sequence_pattern(sequence[0], width)
+            expectation = self._expectations.get(os.path.abspath(os.path.join(bdir, pattern)))
+            if expectation is None:
+                expectation = self._expectations.get(pattern)
+            if expectation is not None:
+                return expectation
+        return None
+    
+    def _compare_expected(self, sequence, expectation, padding, verbose=0):
+        '''
+        Find the missing files of a file sequence with an expected 
+        frame range.
+        
+        @param sequence: sorted file name parts of one file sequence
+        @type sequence: C{list}
+        @param expectation: C{(first, last, step)} frame range
+        @type expectation: C{tuple}
+        @param padding: padding of the missing file names, 
+                        see L{_sequence_padding()}
+        @type padding: C{int}
+        @return: the L{GapRange}s of missing files
+        @rtype: C{list}
+        '''
+        first, last, step = expectation
+        nameparts = sequence[0]
+        prefix, suffix = _affixes(nameparts)
+        fileext = nameparts['fileext']
+        if isinstance(sequence, _FrameRun):
+            frames = sequence.frames
+        else:
+            frames = (int(nameparts['seqnum'], 10) for nameparts in sequence)
+        # only frames within the range count, which also bounds the size of the bitmap
+        frames = FrameSet(iseqnum for iseqnum in frames if first <= iseqnum <= last)
+        gaps = [GapRange(prefix, padding, suffix, fileext, start, stop, step) 
+                for start, stop in frames.missing(first, last, step)]
+        if DEBUG or verbose > 0: 
+            for gap in gaps:
+                for missingfilename in gap.filenames():
+                    print "Missing %s" % missingfilename
+        return gaps
     
     def processdir(self, inpath, strict=False, verbose=0):
         ''' Main entry method: process the contents of a directory.
         
-        @param inpath: the file path to a directory to process.
-        @type inpath: C{unicode}
+        Several directories can be processed in one pass by passing 
+        a list of paths. Their results are merged; paths given twice 
+        or, when recursive, contained in another given path are only 
+        scanned once.
+        
+        @param inpath: the file path to a directory to process, 
+                       or a list of them.
+        @type inpath: C{unicode} or C{list}
         @param strict: use re.match instead of re.search for splitting the file name
         @type strict: C{bool}
         @param verbose: print informational messages.
         @type verbose: C{int}
         @return: dictionary with missing files. Contains as keys,
                  paths to directories with missing files. 
-                 Each path key contains as its value a list of 
-                 missing unicode file names. If there are no
-                 missing files, returns an empty dictionary.
-        @rtype: C{dict}
+                 Each path key contains as its value a L{MissingFiles}
+                 list of missing unicode file names. If there are no
+                 missing files, returns an empty dictionary. The 
+                 dictionary is a new L{ScanResult} for each call, also 
+                 holding the other results of the call.
+        @rtype: L{ScanResult}
         @raise ValueError: if the directory at C{inpath} doesn't 
                            exist.
         '''
+        result = ScanResult()
+        self.lastresult = result
+        # results of previous calls are only kept by their ScanResults
+        self._missing = result
+        self._dircontents = result.dircontents
+        self._duplicates = result.duplicates
+        self._badpadding = result.badpadding
+        self._badsizes = result.badsizes
+        self._start_run()
+        if not strict:
+            self._strictmatching = False
+        for root, bdir, files, missingfiles in self._scan(inpath, verbose):
+            self._dircontents[root] = files
+            if missingfiles:
+                self._missing[bdir] = missingfiles
+            for _padding, duplicates, badpadding in _find_anomalies(files).values():
+                if duplicates:
+                    self._duplicates.setdefault(bdir, []).extend(duplicates)
+                if badpadding:
+                    self._badpadding.setdefault(bdir, []).extend(badpadding)
+            if self._sizetolerance is not None:
+                for badsizes in _find_bad_sizes(files, self._sizetolerance).values():
+                    if badsizes:
+                        self._badsizes.setdefault(bdir, []).extend(badsizes)
+        if len(self._dircontents) == 0:
+            if DEBUG or verbose > 0: 
+                print "Nothing missing."
+        self._end_run()
+        result.exectime = self.lastexectime
+        result.syscallcount = self.lastsyscallcount
+        result.stats = self.laststats
+        return result
+
+
+    def _start_run(self):
+        ''' Reset the measurements of the last run (see L{_end_run()}). '''
         self.lastexectime = -1
-        start = float(time.time())
+        self.lastsyscallcount = 0
+        self.laststats = None
+        if self._collectstats:
+            self.laststats = ScanStats()
+        self._runstart = _monotonic()
+        
+    def _end_run(self):
+        ''' Record the time the run started with L{_start_run()} took. '''
+        self.lastexectime = float(_monotonic() - self._runstart)
+        if self.laststats is not None:
+            self.laststats.elapsed = self.lastexectime
+            
+    def iter_missing(self, inpath, strict=False, verbose=0):
+        ''' Streaming variant of L{processdir()}.
+        
+        Generates the missing files directory by directory, as soon as 
+        each directory is processed. Neither the directory contents nor 
+        the missing files are kept, so memory use stays bounded by the 
+        size of the largest directory regardless of the size of the tree.
+        Consequently C{fsc[dir]}, C{totalfiles}, etc. aren't updated.
+        
+        @param inpath: the file path to a directory to process, 
+                       or a list of them (see L{processdir()}).
+        @type inpath: C{unicode} or C{list}
+        @param strict: use re.match instead of re.search for splitting the file name
+        @type strict: C{bool}
+        @param verbose: print informational messages.
+        @type verbose: C{int}
+        @return: generator of C{(dir, sequence, gap)} tuples, where C{dir} 
+                 is the path to the directory, C{sequence} describes the 
+                 file sequence (see L{GapRange.sequence}) and C{gap} is the 
+                 L{GapRange} of missing files.
+        @rtype: C{generator}
+        @raise ValueError: if the directory at C{inpath} doesn't 
+                           exist.
+        '''
+        self._start_run()
+        if not strict:
+            self._strictmatching = False
+        for _root, bdir, _files, missingfiles in self._scan(inpath, verbose):
+            if missingfiles:
+                for gap in missingfiles.gaps:
+                    yield bdir, gap.sequence, gap
+        self._end_run()
+        
+    def iter_sequences(self, inpath, strict=False, verbose=0):
+        ''' Streaming variant of L{processdir()} reporting per file sequence.
+        
+        Like L{iter_missing()}, but all L{GapRange}s of a file sequence 
+        are generated together with the first and last sequence number 
+        present, so that the output is proportional to the number of 
+        gaps instead of the number of missing files. Duplicate and 
+        inconsistently padded files are reported along with them (see 
+        L{_find_anomalies()}), as well as files with a bad size if 
+        checking sizes (see L{setsizecheck()}).
+        
+        @param inpath: the file path to a directory to process, 
+                       or a list of them (see L{processdir()}).
+        @type inpath: C{unicode} or C{list}
+        @param strict: use re.match instead of re.search for splitting the file name
+        @type strict: C{bool}
+        @param verbose: print informational messages.
+        @type verbose: C{int}
+        @return: generator of C{(dir, sequence, padding, first, last, gaps, 
+                 duplicates, badpadding, badsize)} tuples for each file 
+                 sequence with missing, duplicate, inconsistently padded 
+                 or badly sized files, where C{sequence} describes the file 
+                 sequence (see L{GapRange.sequence}), C{first} and C{last} 
+                 are the lowest and highest sequence numbers present, 
+                 C{gaps} is the list of L{GapRange}s and C{duplicates}, 
+                 C{badpadding} and C{badsize} are lists of file names.
+        @rtype: C{generator}
+        @raise ValueError: if the directory at C{inpath} doesn't 
+                           exist.
+        '''
+        self._start_run()
         if not strict:
             self._strictmatching = False
-        self._prepare_dir_contents(inpath, verbose)
-        if len(self._dircontents) > 0:
-            for adir, files in self._dircontents.items():
-                if self.fullpaths:
-                    bdir = os.path.join(os.path.abspath(os.curdir), adir)
+        for _root, bdir, files, missingfiles in self._scan(inpath, verbose):
+            anomalies = _find_anomalies(files)
+            badsizes = {}
+            if self._sizetolerance is not None:
+                badsizes = _find_bad_sizes(files, self._sizetolerance)
+            if not missingfiles and not anomalies and not any(badsizes.values()):
+                continue
+            gaps = {}
+            if missingfiles:
+                for gap in missingfiles.gaps:
+                    gaps.setdefault((gap.prefix, gap.suffix, gap.fileext), []).append(gap)
+            for sequence in _iter_sequences(files):
+                key = _sequence_key(sequence[0])
+                filename, filename2, fileext, order = key
+                if order == 'reverse':
+                    prefix, suffix = filename2, filename
                 else:
-                    bdir = adir
-                if not os.path.exists(adir):
-                    # check again to be sure the path did not turn invalid since the last time we checked
-                    raise ValueError("E: directory (%s) doesn't exist!" % bdir)
-                def pairs(lst):
-                    ''' Iterate through a list in pairs. '''
-                    i = iter(lst)
-                    first = prev = i.next()
-                    item = None
-                    for item in i:
-                        yield prev, item
-                        prev = item
-                    if item:
-                        yield item, first
-                for curfile, nextfile in pairs(files):
-                    result = self._compare_file(bdir, curfile, nextfile, verbose)
-                    if result == False:
-                        break
-                    elif result == True:
-                        continue
+                    prefix, suffix = filename, filename2
+                seqgaps = gaps.pop((prefix, suffix, fileext), [])
+                padding, duplicates, badpadding = anomalies.get(key, (None, [], []))
+                badsize = [filename for filename, _size, _median in badsizes.get(key, [])]
+                if not seqgaps and padding is None and not badsize:
+                    continue
+                first = sequence[0]
+                last = sequence[-1]
+                if padding is None:
+                    if seqgaps:
+                        # without anomalies all files are padded like the gaps
+                        padding = seqgaps[0].padding
                     else:
-                        break
+                        padding = len(first['seqnum'])
+                yield (bdir, u"%s%s%s%s" % (prefix, u"#" * padding, suffix, fileext), padding, 
+                       int(first['seqnum'], 10), int(last['seqnum'], 10), seqgaps, duplicates, badpadding, 
+                       badsize)
+        self._end_run()
+        
+    def _scan_parallel(self, inpath, verbose=0):
+        '''
+        Parallel variant of L{_scan()}.
+        
+        Directory listings are fetched level by level from a pool of 
+        C{self.workers} threads, since listing is mostly waiting on I/O. 
+        As soon as a directory's listing is available its file names are 
+        handed to a pool of C{self.workers} processes which split, sort 
+        and compare them (see L{_scan_dir_worker()}). Results are yielded 
+        in the order directories were listed, with only a few directories 
+        in flight at any time, giving the same results as the serial 
+        code path.
+        
+        @param inpath: the file path to a directory to process, 
+                       or a list of them.
+        @type inpath: C{unicode} or C{list}
+        @param verbose: print informational messages.
+        @type verbose: C{int}
+        @raise ValueError: if the C{inpath} doesn't exist or 
+                           if C{inpath} is not a directory.
+        '''
+        roots = self._checkinpaths(inpath)
+        maxpending = 4 * self.workers
+        threadpool = ThreadPool(self.workers)
+        processpool = Pool(self.workers, _init_worker, (self,))
+        completed = False
+        tocache = {} # dirstat and sub dirs of dirs to store in the scan cache once processed
+        stats = self.laststats
+        def finished(result):
+            ''' Store the result of a worker in the scan cache and add up its stats. '''
+            root, bdir, files, missingfiles, syscalls, workerstats = result
+            self.lastsyscallcount += syscalls
+            if root in tocache:
+                dirstat, dirs = tocache.pop(root)
+                self._cache_store(root, dirstat, dirs, files, missingfiles)
+            if workerstats is not None:
+                stats.update(workerstats)
+            return root, bdir, files, missingfiles
+        listdir = _list_dir
+        if stats is not None:
+            def listdir(path):
+                ''' List a directory in a worker thread, timing it. '''
+                start = _monotonic()
+                result = _list_dir(path)
+                return result + (_monotonic() - start,)
+        rootset = set(roots)
+        def subdirs(path, dirs):
+            ''' Return the sub directories of C{path} to descend into. '''
+            if path in rootset:
+                dirs = self._shard_dirs(dirs)
+            return self._prune_dirs(dirs, verbose)
+        def ownfiles(path):
+            ''' With sharding the files of the given directories belong to shard 0. '''
+            return path not in rootset or self._shard is None or self._shard[0] == 0
+        try:
+            pending = deque()
+            level = roots
+            while level:
+                nextlevel = []
+                tolist = level
+                if self._cache is not None:
+                    tolist = []
+                    for path, dirstat in threadpool.imap_unordered(_stat_dir, level):
+                        self.lastsyscallcount += 1
+                        cached = self._cache_lookup(path, dirstat)
+                        if cached is None:
+                            tolist.append(path)
+                            tocache[path] = (dirstat, None)
+                        else:
+                            dirs, files, missingfiles = cached
+                            nextlevel.extend(subdirs(path, dirs))
+                            if stats is not None:
+                                stats.counts['dirs'] += 1
+                                stats.counts['files'] += len(files)
+                            if ownfiles(path):
+                                yield path, self._displaypath(path), files, missingfiles
+                for result in threadpool.imap_unordered(listdir, tolist):
+                    root, dirs, files, syscalls = result[:4]
+                    self.lastsyscallcount += syscalls
+                    if stats is not None:
+                        stats.times['walk'] += result[4]
+                        stats.counts['dirs'] += 1
+                    nextlevel.extend(subdirs(root, dirs))
+                    if not ownfiles(root):
+                        tocache.pop(root, None)
+                        continue
+                    if root in tocache:
+                        tocache[root] = (tocache[root][0], dirs)
+                    args = (root, self._displaypath(root), files, verbose)
+                    pending.append(processpool.apply_async(_scan_dir_worker, (args,)))
+                    while len(pending) > maxpending or (pending and pending[0].ready()):
+                        yield finished(pending.popleft().get())
+                level = nextlevel
+            while pending:
+                yield finished(pending.popleft().get())
+            completed = True
+        finally:
+            if completed:
+                threadpool.close()
+                processpool.close()
+            else:
+                threadpool.terminate()
+                processpool.terminate()
+            threadpool.join()
+            processpool.join()
+            if self._cache is not None:
+                self._cache.commit()
+
+class _SequenceState(object):
+    '''
+    In-memory state of one file sequence, used by L{SequenceWatcher}.
+    
+    Keeps the present sequence numbers, each with the number of files 
+    having it (more than one for duplicates like C{a.5.exr} and 
+    C{a.0005.exr}), and the lowest and highest of them. Missing files 
+    are the numbers in between that aren't present, so adding or 
+    removing a file changes them by at most one range.
+    '''
+    __slots__ = ('prefix', 'padding', 'suffix', 'fileext', 'frames', 'lo', 'hi')
+    
+    def __init__(self, nameparts):
+        '''
+        @param nameparts: file name parts of a file from the 
+                          sequence (see L{FileSequenceChecker.splitfilename()}).
+        @type nameparts: L{FileParts}
+        '''
+        if nameparts['order'] == 'reverse':
+            self.prefix = nameparts.get('filename2', u'')
+            self.suffix = nameparts['filename']
         else:
-            if DEBUG or verbose > 0: 
-                print "Nothing missing."
-        elapsed = float(time.time() - start)
-        self.lastexectime = elapsed
-        return self._missing
+            self.prefix = nameparts['filename']
+            self.suffix = nameparts.get('filename2', u'')
+        self.padding = len(nameparts['seqnum'])
+        self.fileext = nameparts['fileext']
+        self.frames = {}    # sequence number -> number of files
+        self.lo = self.hi = None
+        
+    def gap(self, start, stop, end):
+        ''' Return a L{GapRange} from C{start} to C{stop}, cut off after C{end}, or C{None} if empty. '''
+        if end is not None and stop > end + 1:
+            stop = end + 1
+        if start >= stop:
+            return None
+        return GapRange(self.prefix, self.padding, self.suffix, self.fileext, start, stop)
+    
+    def gaps(self, end):
+        ''' Return all current L{GapRange}s, cut off after C{end}. '''
+        gaps = []
+        prev = None
+        for frame in sorted(self.frames):
+            if prev is not None and frame > prev + 1:
+                gap = self.gap(prev + 1, frame, end)
+                if gap is not None:
+                    gaps.append(gap)
+            prev = frame
+        return gaps
+    
+    def add(self, frame, end):
+        '''
+        Add sequence number C{frame}.
+        
+        @return: the changes to the missing files as list of 
+                 C{(sign, gap)} tuples, where C{sign} is C{+} 
+                 for new and C{-} for no longer missing files.
+        @rtype: C{list}
+        '''
+        if frame in self.frames:
+            self.frames[frame] += 1
+            return []
+        self.frames[frame] = 1
+        if self.lo is None:
+            self.lo = self.hi = frame
+            return []
+        if frame > self.hi:
+            sign, gap = '+', self.gap(self.hi + 1, frame, end)
+            self.hi = frame
+        elif frame < self.lo:
+            sign, gap = '+', self.gap(frame + 1, self.lo, end)
+            self.lo = frame
+        else:
+            sign, gap = '-', self.gap(frame, frame + 1, end)
+        if gap is None:
+            return []
+        return [(sign, gap)]
+    
+    def remove(self, frame, end):
+        '''
+        Remove sequence number C{frame}.
+        
+        @return: the changes to the missing files, like L{add()}.
+        @rtype: C{list}
+        '''
+        count = self.frames.get(frame)
+        if count is None:
+            return []
+        if count > 1:
+            # a duplicate is left, nothing goes missing
+            self.frames[frame] = count - 1
+            return []
+        del self.frames[frame]
+        if not self.frames:
+            self.lo = self.hi = None
+            return []
+        if frame == self.hi:
+            # the files between the new last file and the removed 
+            # one are no longer missing, the sequence just got shorter
+            hi = frame - 1
+            while hi not in self.frames:
+                hi -= 1
+            sign, gap = '-', self.gap(hi + 1, frame, end)
+            self.hi = hi
+        elif frame == self.lo:
+            lo = frame + 1
+            while lo not in self.frames:
+                lo += 1
+            sign, gap = '-', self.gap(frame + 1, lo, end)
+            self.lo = lo
+        else:
+            sign, gap = '+', self.gap(frame, frame + 1, end)
+        if gap is None:
+            return []
+        return [(sign, gap)]
+
+class _Inotify(object):
+    '''
+    Minimal C{ctypes} wrapper around the inotify API of Linux, 
+    reporting files and directories created, deleted and moved 
+    in watched directories.
+    '''
+    
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    
+    IN_ADDED = IN_CREATE | IN_MOVED_TO
+    IN_REMOVED = IN_DELETE | IN_MOVED_FROM
+    MASK = IN_ADDED | IN_REMOVED | IN_DELETE_SELF | IN_MOVE_SELF
+    
+    def __init__(self):
+        '''
+        @raise OSError: if inotify isn't available.
+        '''
+        super(_Inotify, self).__init__()
+        import ctypes
+        import ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            libc.inotify_init, libc.inotify_add_watch, libc.inotify_rm_watch # IGNORE:W0104
+        except (OSError, AttributeError):
+            raise OSError("inotify is not available")
+        self._ctypes = ctypes
+        self._libc = libc
+        self._encoding = sys.getfilesystemencoding() or 'utf-8'
+        self._paths = {}    # watch descriptor -> directory path
+        self._wds = {}      # directory path -> watch descriptor
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        
+    def add(self, path):
+        ''' Start watching the directory at C{path}. '''
+        wd = self._libc.inotify_add_watch(self.fd, path.encode(self._encoding), self.MASK)
+        if wd >= 0:
+            self._paths[wd] = path
+            self._wds[path] = wd
+            
+    def remove(self, path):
+        ''' Stop watching the directory at C{path}. '''
+        wd = self._wds.pop(path, None)
+        if wd is not None:
+            self._paths.pop(wd, None)
+            self._libc.inotify_rm_watch(self.fd, wd)
+            
+    def read(self, timeout):
+        '''
+        Wait up to C{timeout} seconds for events.
+        
+        @return: list of C{(directory path, name, mask)} tuples. 
+                 The directory path is C{None} if events were lost.
+        @rtype: C{list}
+        '''
+        ready = select.select([self.fd], [], [], timeout)[0]
+        if not ready:
+            return []
+        data = os.read(self.fd, 65536)
+        events = []
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, _cookie, length = struct.unpack_from('iIII', data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip('\0')
+            offset += 16 + length
+            if mask & self.IN_Q_OVERFLOW:
+                events.append((None, None, mask))
+                continue
+            path = self._paths.get(wd)
+            if path is None:
+                continue
+            if mask & self.IN_IGNORED:
+                self._paths.pop(wd, None)
+                self._wds.pop(path, None)
+                continue
+            events.append((path, name.decode(self._encoding, 'replace'), mask))
+        return events
+    
+    def close(self):
+        ''' Stop watching all directories. '''
+        os.close(self.fd)
+
+class SequenceWatcher(object):
+    '''
+    Watches directories and keeps the missing files of their file 
+    sequences up to date as files are added and removed, e.g. while 
+    a render is writing frames.
+    
+    Uses the settings (range, patterns, excludes, recursion) of a 
+    L{FileSequenceChecker}. Steps, expected frame ranges and size 
+    checks are not supported, since the missing files are kept as the 
+    holes between consecutive present files. The state of each file sequence is kept 
+    in memory, so each added or removed file changes the missing files 
+    by at most one L{GapRange}. Changes are picked up from inotify on 
+    Linux, otherwise by polling the modification times of the watched 
+    directories and listing the modified ones again.
+    
+    Changes are reported as C{(dir, sign, gap)} tuples, where C{sign} 
+    is C{+} if the files in C{gap} went missing and C{-} if they are 
+    no longer missing.
+    
+    @ivar checker: the checker providing the settings.
+    @type checker: L{FileSequenceChecker}
+    @ivar paths: the watched top directories.
+    @type paths: C{list}
+    @ivar interval: seconds to wait for changes per call to L{poll()}.
+    @type interval: C{float}
+    '''
+    
+    def __init__(self, checker, paths, interval=1.0, polling=False):
+        '''
+        @param checker: the checker providing the settings.
+        @type checker: L{FileSequenceChecker}
+        @param paths: a directory path or a list of directory paths.
+        @type paths: C{unicode} or C{list}
+        @param interval: seconds to wait for changes per call to L{poll()}.
+        @type interval: C{float}
+        @param polling: poll modification times even if inotify is available.
+        @type polling: C{bool}
+        @raise ValueError: if a path doesn't exist or isn't a directory, 
+                           or if C{checker} has a step other than 1, 
+                           expected frame ranges or size checks set.
+        '''
+        super(SequenceWatcher, self).__init__()
+        if checker._step not in (None, 1):
+            raise ValueError("E: watch mode doesn't support steps")
+        if checker._expectations:
+            raise ValueError("E: watch mode doesn't support expected frame ranges")
+        if checker._sizetolerance is not None:
+            raise ValueError("E: watch mode doesn't support size checks")
+        self.checker = checker
+        self.paths = checker._checkinpaths(paths)
+        self.interval = interval
+        self._names = {}        # dir path -> set of file names
+        self._subdirs = {}      # dir path -> set of sub dir paths
+        self._dirstats = {}     # dir path -> modification time and inode, for polling
+        self._sequences = {}    # dir path -> {sequence key: _SequenceState}
+        self._inotify = None
+        if not polling:
+            try:
+                self._inotify = _Inotify()
+            except OSError:
+                self._inotify = None
+                
+    def __repr__(self):
+        return "SequenceWatcher(%r, %r, interval=%s)" % (self.checker, self.paths, self.interval)
+    
+    def start(self):
+        '''
+        Scan the watched directories.
+        
+        @return: the currently missing files, as changes.
+        @rtype: C{list}
+        '''
+        changes = []
+        for path in self.paths:
+            if path not in self._names:
+                changes.extend(self._add_dir(path))
+        return changes
+    
+    def poll(self):
+        '''
+        Wait up to C{self.interval} seconds for changes and apply them.
+        
+        @return: the changes to the missing files.
+        @rtype: C{list}
+        '''
+        if self._inotify is None:
+            time.sleep(self.interval)
+            return self._refresh()
+        changes = []
+        for path, name, mask in self._inotify.read(self.interval):
+            if path is None:
+                # the kernel dropped events, compare with the file system instead
+                changes.extend(self._refresh(force=True))
+            elif mask & (_Inotify.IN_DELETE_SELF | _Inotify.IN_MOVE_SELF):
+                changes.extend(self._remove_dir(path))
+            elif mask & _Inotify.IN_ISDIR:
+                subdir = os.path.join(path, name)
+                if mask & _Inotify.IN_ADDED and self.checker.recursive \
+                   and self.checker._prune_dirs([subdir]):
+                    self._subdirs[path].add(subdir)
+                    changes.extend(self._add_dir(subdir))
+                elif mask & _Inotify.IN_REMOVED:
+                    changes.extend(self._remove_dir(subdir))
+            elif mask & _Inotify.IN_ADDED:
+                changes.extend(self._add_file(path, name))
+            elif mask & _Inotify.IN_REMOVED:
+                changes.extend(self._remove_file(path, name))
+        return changes
+    
+    def run(self, callback):
+        '''
+        Watch until interrupted, calling C{callback} with each 
+        C{(dir, sign, gap)} change, starting with the currently 
+        missing files.
+        '''
+        try:
+            for change in self.start():
+                callback(*change)
+            while True:
+                for change in self.poll():
+                    callback(*change)
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+                
+    def _changes(self, path, changes):
+        ''' Add the directory's display path to C{(sign, gap)} changes. '''
+        bdir = self.checker._displaypath(path)
+        return [(bdir, sign, gap) for sign, gap in changes]
+                
+    def _add_dir(self, path):
+        ''' Start watching the directory at C{path} and, if recursive, its sub directories. '''
+        if self._inotify is not None:
+            # watch before listing so that no file slips through
+            self._inotify.add(path)
+        dirstat = _stat_dir(path)[1]
+        root, dirs, files, _syscalls = _list_dir(path)
+        self._dirstats[root] = dirstat
+        self._names[root] = set(files)
+        self._subdirs[root] = set()
+        self._sequences[root] = sequences = {}
+        end = self.checker.end
+        changes = []
+        for nameparts in self.checker._prepare_files(root, files):
+            frame = int(nameparts['seqnum'], 10)
+            if self.checker.start and frame < self.checker.start:
+                continue
+            key = _sequence_key(nameparts)
+            state = sequences.get(key)
+            if state is None:
+                state = sequences[key] = _SequenceState(nameparts)
+            state.add(frame, end)
+        for state in sequences.itervalues():
+            changes.extend(('+', gap) for gap in state.gaps(end))
+        changes = self._changes(root, changes)
+        if self.checker.recursive:
+            for subdir in self.checker._prune_dirs(dirs):
+                self._subdirs[root].add(subdir)
+                changes.extend(self._add_dir(subdir))
+        return changes
+    
+    def _remove_dir(self, path):
+        ''' Stop watching the directory at C{path} and its sub directories. '''
+        if path not in self._names:
+            return []
+        if self._inotify is not None:
+            self._inotify.remove(path)
+        del self._names[path]
+        del self._dirstats[path]
+        changes = []
+        end = self.checker.end
+        for state in self._sequences.pop(path).itervalues():
+            changes.extend(('-', gap) for gap in state.gaps(end))
+        changes = self._changes(path, changes)
+        for subdir in self._subdirs.pop(path):
+            changes.extend(self._remove_dir(subdir))
+        for subdirs in self._subdirs.itervalues():
+            subdirs.discard(path)
+        return changes
+    
+    def _file_state(self, path, name, create):
+        ''' Return the sequence state and sequence number for a file name or C{None}. '''
+        nameparts = self.checker._prepare_files(path, [name])
+        if not nameparts:
+            return None
+        nameparts = nameparts[0]
+        frame = int(nameparts['seqnum'], 10)
+        if self.checker.start and frame < self.checker.start:
+            return None
+        sequences = self._sequences[path]
+        key = _sequence_key(nameparts)
+        state = sequences.get(key)
+        if state is None:
+            if not create:
+                return None
+            state = sequences[key] = _SequenceState(nameparts)
+        return state, frame
+    
+    def _add_file(self, path, name):
+        ''' Apply the addition of file C{name} to directory C{path}. '''
+        if path not in self._names or name in self._names[path]:
+            return []
+        self._names[path].add(name)
+        found = self._file_state(path, name, True)
+        if found is None:
+            return []
+        state, frame = found
+        return self._changes(path, state.add(frame, self.checker.end))
+    
+    def _remove_file(self, path, name):
+        ''' Apply the removal of file C{name} from directory C{path}. '''
+        if path not in self._names or name not in self._names[path]:
+            return []
+        self._names[path].discard(name)
+        found = self._file_state(path, name, False)
+        if found is None:
+            return []
+        state, frame = found
+        return self._changes(path, state.remove(frame, self.checker.end))
+    
+    def _refresh(self, force=False):
+        '''
+        List the watched directories modified since they were last 
+        listed (or all of them if C{force} is set) and apply the 
+        differences.
+        '''
+        changes = []
+        for path in list(self._names):
+            if path not in self._names:
+                # removed along with its parent
+                continue
+            dirstat = _stat_dir(path)[1]
+            if dirstat is None:
+                changes.extend(self._remove_dir(path))
+                continue
+            if not force and dirstat == self._dirstats[path] \
+               and time.time() - dirstat[0] >= ScanCache.MINAGE:
+                # unmodified and old enough to trust the modification time
+                continue
+            self._dirstats[path] = dirstat
+            _root, dirs, files, _syscalls = _list_dir(path)
+            names = self._names[path]
+            files = set(files)
+            for name in names - files:
+                changes.extend(self._remove_file(path, name))
+            for name in files - names:
+                changes.extend(self._add_file(path, name))
+            if self.checker.recursive:
+                dirs = set(self.checker._prune_dirs(dirs))
+                for subdir in self._subdirs[path] - dirs:
+                    changes.extend(self._remove_dir(subdir))
+                for subdir in dirs - self._subdirs[path]:
+                    self._subdirs[path].add(subdir)
+                    changes.extend(self._add_dir(subdir))
+        return changes
+
+def _make_record(bdir, sequence, padding, first, last, gaps, duplicates, badpadding, badsize=()):
+    '''
+    Build the output record of one file sequence, as generated by 
+    L{FileSequenceChecker.iter_sequences()}, for the writers of 
+    the C{--format} CLI option.
+    
+    @rtype: C{dict}
+    '''
+    return {
+        'dir': bdir,
+        'sequence': sequence,
+        'padding': padding,
+        'first': first,
+        'last': last,
+        'missing': [gap.rangestring for gap in gaps],
+        'count': sum(gap.size for gap in gaps),
+        'duplicates': duplicates,
+        'badpadding': badpadding,
+        'badsize': list(badsize)
+    }
+
+class _RecordWriter(object):
+    '''
+    Base class of the writers for the C{--format} CLI option.
+    
+    Writers get one record per file sequence with missing files 
+    (see L{_make_record()}) and write it to C{stream} right away, 
+    UTF-8 encoded.
+    '''
+    
+    def __init__(self, stream):
+        super(_RecordWriter, self).__init__()
+        self.stream = stream
+        
+    def write(self, record):
+        ''' Write the record of one file sequence. '''
+        raise NotImplementedError
+    
+    def close(self):
+        ''' Flush the output. '''
+        self.stream.flush()
+        
+class _JSONLinesWriter(_RecordWriter):
+    ''' Writes one JSON object per line. Can be read back with L{_read_records()}. '''
+    
+    def write(self, record):
+        self.stream.write(json.dumps(record, sort_keys=True) + '\n')
+        
+class _CSVWriter(_RecordWriter):
+    ''' Writes comma separated values with a header line, missing ranges separated by spaces. '''
+    
+    FIELDS = ['dir', 'sequence', 'padding', 'first', 'last', 'count', 'missing', 'duplicates', 'badpadding', 'badsize']
+    
+    def __init__(self, stream):
+        super(_CSVWriter, self).__init__(stream)
+        self.writer = csv.writer(stream)
+        self.writer.writerow(self.FIELDS)
+        
+    def write(self, record):
+        row = []
+        for field in self.FIELDS:
+            value = record.get(field, [])
+            if isinstance(value, list):
+                value = u' '.join(value)
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            row.append(value)
+        self.writer.writerow(row)
+        
+class _RangesWriter(_RecordWriter):
+    ''' Writes one human readable line per file sequence. '''
+    
+    def write(self, record):
+        line = u"%s [%s-%s]" % (os.path.join(record['dir'], record['sequence']), 
+                                record['first'], record['last'])
+        if record['missing']:
+            line += u" missing %s" % u",".join(record['missing'])
+        if record.get('duplicates'):
+            line += u" duplicates %s" % u",".join(record['duplicates'])
+        if record.get('badpadding'):
+            line += u" badpadding %s" % u",".join(record['badpadding'])
+        if record.get('badsize'):
+            line += u" badsize %s" % u",".join(record['badsize'])
+        self.stream.write((line + u"\n").encode('utf-8'))
+        
+def _read_records(stream):
+    '''
+    Read the records written by L{_JSONLinesWriter} from C{stream}, 
+    e.g. the partial results of sharded runs (see 
+    L{FileSequenceChecker.setshard()}).
+    
+    @return: generator of record dicts
+    @rtype: C{generator}
+    @raise ValueError: if a line isn't a valid record.
+    '''
+    for lineno, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            record['dir'], record['sequence'], record['missing'] # IGNORE:W0104
+        except (ValueError, KeyError, TypeError):
+            raise ValueError("E: line %i is not a JSON lines record: %s" % (lineno, line.strip()))
+        yield record
+        
+def _merge_records(records):
+    '''
+    Merge the records of several (partial) runs into one report: 
+    sorted by directory, keeping the order of the file sequences 
+    within a directory and dropping duplicates.
+    
+    @param records: iterable of record dicts
+    @rtype: C{list}
+    '''
+    seen = set()
+    merged = []
+    for record in records:
+        key = (record['dir'], record['sequence'])
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append(record)
+    # sort is stable, so sequences stay in the order they were processed
+    merged.sort(key=itemgetter('dir'))
+    return merged
+
+_WRITERS = {
+    'jsonl': _JSONLinesWriter,
+    'csv': _CSVWriter,
+    'ranges': _RangesWriter
+}
+
+_worker_checker = None # the FileSequenceChecker used by a worker process
+
+def _sequence_key(nameparts):
+    '''
+    Return the key identifying the file sequence of a file name parts record:
+    all name parts except the sequence number.
+    
+    @param nameparts: file name parts (see 
+                      L{FileSequenceChecker.splitfilename()}).
+    @type nameparts: L{FileParts}
+    @rtype: C{tuple}
+    '''
+    return (nameparts['filename'], nameparts.get('filename2', u''), 
+            nameparts['fileext'], nameparts['order'])
+
+def _iter_sequences(files):
+    '''
+    Generate the file sequences of a sorted file list, each as C{list} 
+    of L{FileParts} or L{_FrameRun}, see L{FileList.sequences}. Also 
+    takes a plain C{list} of L{FileParts}.
+    '''
+    if isinstance(files, FileList):
+        return iter(files.sequences)
+    return (list(sequence) for _key, sequence in groupby(files, _sequence_key))
+
+def _frame_run(sequence, frames, mindensity):
+    '''
+    Return a L{_FrameRun} for the sorted file name parts C{sequence} 
+    of one file sequence with the sequence numbers C{frames}, if its 
+    files only differ in their sequence numbers, padded to the padding 
+    of the file sequence (see L{_sequence_padding()}) and without 
+    duplicates, and if it has at least C{mindensity} files per frame 
+    of its span. Otherwise return C{sequence}.
+    
+    @rtype: L{_FrameRun} or C{list}
+    '''
+    if len(sequence) < mindensity * (frames[-1] - frames[0] + 1):
+        return sequence
+    padding = _sequence_padding(sequence)
+    hasfilename2 = 'filename2' in sequence[0]
+    prev = None
+    for nameparts, frame in zip(sequence, frames):
+        # file sizes can't be restored from the frames
+        if frame == prev or 'size' in nameparts or ('filename2' in nameparts) != hasfilename2 or \
+           nameparts['seqnum'] != u"%0*d" % (padding, frame):
+            return sequence
+        prev = frame
+    return _FrameRun(sequence[0], padding, FrameSet(frames))
+
+def _pack_files(files):
+    '''
+    Pack a sorted file list for storing in the L{ScanCache}.
+    
+    Regular file sequences (see L{FileList}) are stored as their 
+    common name parts and their L{FrameSet}, the others as their list 
+    of file name parts dicts (see L{FileParts.todict()}).
+    
+    @return: list of packed file sequences, see L{_unpack_files()}.
+    @rtype: C{list}
+    '''
+    packed = []
+    for sequence in _iter_sequences(files):
+        if isinstance(sequence, _FrameRun):
+            template = sequence.template
+            packed.append((template['filename'], template.get('filename2'), template['fileext'], 
+                           template['order'], sequence.padding, sequence.frames.tostring()))
+        else:
+            packed.append([nameparts.todict() for nameparts in sequence])
+    return packed
+
+def _unpack_files(packed):
+    '''
+    Restore a sorted file list packed by L{_pack_files()}.
+    
+    @rtype: L{FileList}
+    '''
+    sequences = []
+    for sequence in packed:
+        if isinstance(sequence, list):
+            sequences.append([FileParts.fromdict(nameparts) for nameparts in sequence])
+            continue
+        filename, filename2, fileext, order, padding, data = sequence
+        frames = FrameSet.fromstring(data)
+        template = FileParts(filename, u"%0*d" % (padding, frames.first), fileext, order, filename2)
+        sequences.append(_FrameRun(template, padding, frames))
+    return FileList(sequences)
+
+def _shard_of(name, count):
+    '''
+    Return the shard a sub directory C{name} belongs to out of C{count} 
+    shards. Uses CRC-32, which unlike C{hash()} is the same for all 
+    Python versions and platforms.
+    '''
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return (zlib.crc32(name) & 0xffffffff) % count
+
+def _detect_step(frames):
+    '''
+    Detect the step of a file sequence as the greatest common divisor 
+    of the differences between its sequence numbers, see 
+    L{FileSequenceChecker.setstep()}.
+    
+    @param frames: sorted sequence numbers of one file sequence
+    @type frames: C{list}
+    @return: the step, 1 for sequences with less than 3 distinct 
+             sequence numbers.
+    @rtype: C{int}
+    '''
+    step = 0
+    count = 0
+    prev = None
+    for iseqnum in frames:
+        if iseqnum == prev:
+            continue
+        if prev is not None:
+            step = gcd(step, iseqnum - prev)
+            if step == 1:
+                return 1
+        prev = iseqnum
+        count += 1
+    if count < 3:
+        return 1
+    return step
+
+BACKENDS = ('auto', 'python', 'numpy') #: engines for finding gaps, see findgaps()
+
+NUMPYMINFRAMES = 1000 #: the 'auto' backend uses NumPy for sequences with at least this many frames
+
+def findgaps(frames, start=0, end=0, step=1, backend='python'):
+    '''
+    Find the gaps in the sorted sequence numbers of one file sequence.
+    
+    This is the core of the gap detection. It only looks at the numbers, 
+    without any state kept between calls, so it can be used from any 
+    number of threads or processes at once.
+    
+    The C{backend} selects the engine: C{'python'} compares the numbers 
+    pair by pair in a loop, C{'numpy'} does so in one go on arrays (see 
+    L{_findgaps_numpy()}) and C{'auto'} uses NumPy for sequences with at 
+    least L{NUMPYMINFRAMES} frames, where it outweighs the cost of 
+    converting the numbers. Both fall back to C{'python'} if NumPy isn't 
+    available. All engines give the same results.
+    
+        >>> findgaps([1, 3, 4, 8])
+        [(2, 3), (5, 8)]
+        >>> findgaps([1, 3, 4, 8], end=6)
+        [(2, 3), (5, 7)]
+        >>> findgaps([101, 103, 109], step=2)
+        [(105, 109)]
+        >>> findgaps([1, 3, 4, 8, 9, 11], step=2)
+        [(5, 9)]
+    
+    @param frames: sorted sequence numbers. Duplicates and numbers 
+                   off the step grid, which starts at the first 
+                   sequence number, are skipped.
+    @type frames: C{list}
+    @param start: ignore sequence numbers less than this, C{0} for no limit.
+    @type start: C{int}
+    @param end: don't report missing sequence numbers greater than 
+                this, C{0} for no limit.
+    @type end: C{int}
+    @param step: difference between consecutive sequence numbers.
+    @type step: C{int}
+    @param backend: one of L{BACKENDS}.
+    @type backend: C{str}
+    @return: list of C{(start, stop)} tuples of missing sequence 
+             numbers, with C{stop} exclusive like with C{xrange}.
+    @rtype: C{list}
+    '''
+    if numpy is not None and backend != 'python':
+        if backend == 'numpy' or len(frames) >= NUMPYMINFRAMES:
+            return _findgaps_numpy(frames, start, end, step)
+    gaps = []
+    first = nextframe = None
+    for frame in frames:
+        if start and frame < start:
+            continue
+        if nextframe is None:
+            first = frame
+            nextframe = frame + step
+            if end and nextframe > end:
+                break
+            continue
+        if step != 1 and (frame - first) % step:
+            continue
+        if frame != nextframe:
+            stop = frame
+            if end and stop > end + 1:
+                # still report the missing files up to end 
+                stop = end + 1
+            if nextframe < stop:
+                gaps.append((nextframe, stop))
+            if end and frame > end:
+                break
+        nextframe = frame + step
+    return gaps
+
+def _findgaps_numpy(frames, start=0, end=0, step=1):
+    '''
+    NumPy variant of L{findgaps()}.
+    
+    Compares all sequence numbers on the step grid with their 
+    predecessor at once: a gap follows every number whose successor 
+    is more than C{step} greater, up to the successor or C{end}, 
+    whichever comes first.
+    '''
+    if not isinstance(frames, numpy.ndarray):
+        # quicker than numpy.asarray() for lists of Python ints
+        frames = numpy.fromiter(frames, numpy.int64, len(frames))
+    if start:
+        frames = frames[frames >= start]
+    if step != 1 and len(frames):
+        frames = frames[(frames - frames[0]) % step == 0]
+    if len(frames) < 2 or (end and frames[0] + step > end):
+        return []
+    starts = frames[:-1] + step
+    stops = frames[1:]
+    if end:
+        # nothing is missing after end
+        stops = numpy.minimum(stops, end + 1)
+    isgap = starts < stops
+    return zip(starts[isgap].tolist(), stops[isgap].tolist())
+
+def _affixes(nameparts):
+    ''' Return the file name parts before and after the sequence number of C{nameparts}. '''
+    if nameparts['order'] == 'reverse':
+        return nameparts.get('filename2', u''), nameparts['filename']
+    return nameparts['filename'], nameparts.get('filename2', u'')
+
+def _sequence_pattern(nameparts, padding=None):
+    '''
+    Return the pattern of the file sequence of C{nameparts}, like 
+    L{GapRange.sequence}, with C{padding} or else the width of its 
+    sequence number.
+    '''
+    prefix, suffix = _affixes(nameparts)
+    if padding is None:
+        padding = len(nameparts['seqnum'])
+    return u"%s%s%s%s" % (prefix, u"#" * padding, suffix, nameparts['fileext'])
+
+def _sequence_padding(sequence):
+    '''
+    Return the padding of a file sequence: the width of its longest 
+    zero-padded sequence number or, if there is none, the width of its 
+    lowest sequence number. Files whose sequence number isn't padded 
+    to this width are inconsistently padded (see L{_find_anomalies()}). 
+    Doesn't depend on the order of files with the same sequence number.
+    
+    @param sequence: sorted file name parts of one file sequence
+    @type sequence: C{list} or L{_FrameRun}
+    @rtype: C{int}
+    '''
+    if isinstance(sequence, _FrameRun):
+        return sequence.padding
+    padding = 0
+    for nameparts in sequence:
+        seqnum = nameparts['seqnum']
+        if len(seqnum) > padding and len(seqnum) > 1 and seqnum[0] == u'0':
+            padding = len(seqnum)
+    if padding:
+        return padding
+    return len(sequence[0]['seqnum'])
+
+def _joinfilename(nameparts):
+    ''' Join the parts of a file name split by L{FileSequenceChecker.splitfilename()}. '''
+    if nameparts['order'] == 'reverse':
+        return u"%s%s%s%s" % (nameparts.get('filename2', u''), nameparts['seqnum'], 
+                              nameparts['filename'], nameparts['fileext'])
+    return u"%s%s%s%s" % (nameparts['filename'], nameparts['seqnum'], 
+                          nameparts.get('filename2', u''), nameparts['fileext'])
+
+def _find_anomalies(files):
+    '''
+    Find duplicate and inconsistently padded files in the sorted file 
+    list of a directory (see L{FileSequenceChecker._prepare_files()}). 
+    
+    Duplicates are files of the same file sequence with the same sequence 
+    number, e.g. C{shot.1.exr} and C{shot.0001.exr}. Files whose sequence 
+    number isn't padded to the padding of their file sequence (see 
+    L{_sequence_padding()}) are inconsistently padded, e.g. C{shot.1.exr} 
+    next to C{shot.0002.exr}.
+    
+    Since the files are already grouped and sorted this takes one pass 
+    over each file sequence, no extra directory listing.
+    
+    @param files: sorted file name parts
+    @type files: C{list}
+    @return: dict of C{(padding, duplicates, badpadding)} tuples keyed 
+             by sequence key (see L{_sequence_key()}), with the lists of 
+             duplicate and inconsistently padded file names, for all file 
+             sequences with either.
+    @rtype: C{dict}
+    '''
+    anomalies = {}
+    for sequence in _iter_sequences(files):
+        if isinstance(sequence, _FrameRun):
+            # regular by definition
+            continue
+        key = _sequence_key(sequence[0])
+        padding = _sequence_padding(sequence)
+        duplicates = []
+        badpadding = []
+        prev = None
+        for nameparts in sequence:
+            seqnum = nameparts['seqnum']
+            iseqnum = int(seqnum, 10)
+            if prev is not None and iseqnum == prev[0]:
+                if not duplicates or duplicates[-1] is not prev[1]:
+                    duplicates.append(prev[1])
+                duplicates.append(nameparts)
+            if seqnum != u"%0.*d" % (padding, iseqnum):
+                badpadding.append(nameparts)
+            prev = (iseqnum, nameparts)
+        if duplicates or badpadding:
+            anomalies[key] = (padding, 
+                              [_joinfilename(nameparts) for nameparts in duplicates], 
+                              [_joinfilename(nameparts) for nameparts in badpadding])
+    return anomalies
+
+def _stat_size(path):
+    ''' Return the size of the file at C{path} or C{None} if it can't be C{stat}ed. '''
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+def _find_bad_sizes(files, tolerance):
+    '''
+    Find empty files and files whose size deviates from the median 
+    size of their file sequence by more than C{tolerance} (see 
+    L{FileSequenceChecker.setsizecheck()}), in the sorted file list 
+    of a directory with sizes.
+    
+    @return: dict of lists of C{(file name, size, median size)} 
+             tuples keyed by sequence key (see L{_sequence_key()}), 
+             for all file sequences.
+    @rtype: C{dict}
+    '''
+    badsizes = {}
+    for sequence in _iter_sequences(files):
+        if isinstance(sequence, _FrameRun):
+            # without sizes, see _frame_run()
+            continue
+        key = _sequence_key(sequence[0])
+        sequence = [nameparts for nameparts in sequence if nameparts.get('size') is not None]
+        if not sequence:
+            continue
+        sizes = sorted(nameparts['size'] for nameparts in sequence)
+        median = sizes[len(sizes) // 2]
+        low = median * (1.0 - tolerance)
+        high = median * (1.0 + tolerance)
+        badsizes[key] = [(_joinfilename(nameparts), nameparts['size'], median) for nameparts in sequence 
+                         if nameparts['size'] == 0 or not low <= nameparts['size'] <= high]
+    return badsizes
+
+def _init_worker(checker):
+    '''
+    Initializer for the worker processes of the parallel code path.
+    
+    Stores a copy of the L{FileSequenceChecker} doing the processing
+    so that its settings only need to be transferred once per process. 
+    '''
+    global _worker_checker # IGNORE:W0603
+    _worker_checker = checker
+    
+def _list_dir(path):
+    '''
+    List a single directory the same way C{os.walk} would.
+    
+    Uses C{scandir} (from the C{os} module or the C{scandir} package) if 
+    available, which gets file types from the directory listing itself
+    on most platforms, so that no file needs to be C{stat}ed. Otherwise 
+    falls back to C{os.listdir} and a C{stat} call per directory entry.
+    
+    @param path: path to the directory
+    @type path: C{unicode}
+    @return: C{path}, a list of sub directory paths to descend into 
+             (symbolic links excluded), a list of file names and the 
+             number of file system calls issued.
+    @rtype: C{tuple}
+    '''
+    dirs = []
+    files = []
+    syscalls = 1
+    if scandir is not None:
+        try:
+            for entry in scandir(path):
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        dirs.append(entry.path)
+                else:
+                    files.append(entry.name)
+        except OSError:
+            # os.walk silently skips directories it can't list
+            pass
+        return path, dirs, files, syscalls
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return path, dirs, files, syscalls
+    for name in names:
+        fullpath = os.path.join(path, name)
+        syscalls += 1
+        if os.path.isdir(fullpath):
+            syscalls += 1
+            if not os.path.islink(fullpath):
+                dirs.append(fullpath)
+        else:
+            files.append(name)
+    return path, dirs, files, syscalls
+
+def _stat_dir(path):
+    '''
+    Get the modification time and inode number of a directory.
+    
+    @param path: path to the directory
+    @type path: C{unicode}
+    @return: C{path} and a tuple of modification time and inode 
+             number, or C{None} if the directory can't be C{stat}ed.
+    @rtype: C{tuple}
+    '''
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None
+    return path, (st.st_mtime, st.st_ino)
+
+def _scan_dir_worker(args):
+    '''
+    Split, sort and compare the files of a single directory 
+    in a worker process.
+    
+    @param args: directory path, path to key the missing files by,
+                 file names and verbosity.
+    @type args: C{tuple}
+    @return: directory path, path the missing files are keyed by, 
+             sorted file name parts, list of missing files, the number 
+             of file system calls issued (e.g. C{stat}ing file sizes) 
+             and the L{ScanStats} of the directory if collecting stats.
+    @rtype: C{tuple}
+    '''
+    root, bdir, files, verbose = args
+    fsc = _worker_checker
+    fsc.lastsyscallcount = 0
+    stats = None
+    if fsc.laststats is not None:
+        stats = fsc.laststats = ScanStats()
+    sortedfiles = fsc._prepare_files(root, files, verbose)
+    missingfiles = fsc._compare_files(bdir, sortedfiles, verbose)
+    return root, bdir, sortedfiles, missingfiles, fsc.lastsyscallcount, stats
 
 
 def main(argv=None):  # IGNORE:C0111
@@ -1045,6 +3986,30 @@ USAGE
 ''' % (program_shortdesc, str(__date__))
 
     try:
+        if sys.argv[1:2] == ['merge']:
+            # merge subcommand: combine the partial results of runs with --shard
+            parser = ArgumentParser(prog="%s merge" % sys.argv[0].split(u"/")[-1], 
+                                    description="combine the JSON lines results (--format jsonl) of runs with --shard into one report, sorted by directory.")
+            parser.add_argument("--format", dest="format", choices=sorted(_WRITERS), help="output format [default: %(default)s]")
+            parser.add_argument(dest="partials", help="files with partial results, '-' reads from stdin", metavar="file", nargs='+')
+            parser.set_defaults(format='jsonl')
+            args = parser.parse_args(sys.argv[2:])
+            records = []
+            for partial in args.partials:
+                if partial == '-':
+                    records.extend(_read_records(sys.stdin))
+                    continue
+                partialfile = open(partial, 'rb')
+                try:
+                    records.extend(_read_records(partialfile))
+                finally:
+                    partialfile.close()
+            writer = _WRITERS[args.format](sys.stdout)
+            for record in _merge_records(records):
+                writer.write(record)
+            writer.close()
+            return 0
+        
         # Setup option parser
         parser = ArgumentParser(description=program_license, formatter_class=RawDescriptionHelpFormatter)
         parser.add_argument("-p", "--pattern", dest="splitpat", help="regex pattern used for splitting a filename into a name part and a sequence number part. Must contain two named groups: 'filename' and 'seqnum'. Can optionally contain a 'filename2' group for cases where the filename is split in half by the sequence number. Note: You should only need to override the defaults for special cases.", metavar="RE")
@@ -1053,13 +4018,28 @@ USAGE
         parser.add_argument("-v", "--verbose", dest="verbose", action="count", help="set verbosity level [default: %(default)s]")
         parser.add_argument("-f", "--from", dest="rangestart", help="only process files with sequence number greater than NUM  [default: %(default)s]", metavar="NUM")
         parser.add_argument("-t", "--to", dest="rangeend", help="only process files with sequence number less than or equal to NUM [default: %(default)s]", metavar="NUM")
-        parser.add_argument("-i", "--include", dest="include", help="only include paths matching this regex pattern. Note: exclude is given preference over include. [default: %(default)s]", metavar="RE" )
-        parser.add_argument("-e", "--exclude", dest="exclude", help="exclude paths matching this regex pattern. [default: %(default)s]", metavar="RE" )
+        parser.add_argument("-i", "--include", dest="include", help="only include paths matching this regex pattern. Patterns without a '/' are matched against file names only. Note: exclude is given preference over include. [default: %(default)s]", metavar="RE" )
+        parser.add_argument("-e", "--exclude", dest="exclude", help="exclude paths matching this regex pattern. Patterns without a '/' are matched against file names only. [default: %(default)s]", metavar="RE" )
+        parser.add_argument("--exclude-file", dest="fileexcludes", action="append", help="exclude files with this name, in addition to the platform's system files. Can be a glob pattern like '*.tmp'. Can be given multiple times. [default: %(default)s]", metavar="NAME" )
+        parser.add_argument("-x", "--exclude-dir", dest="direxclude", help="don't descend into sub directories matching this regex pattern, e.g. '/cache/'. Patterns without a '/' are matched against directory names only. [default: %(default)s]", metavar="RE" )
         parser.add_argument('-V', '--version', action='version', version=program_version_message)
+        parser.add_argument("-j", "--jobs", dest="jobs", type=int, help="scan sub directories in parallel using NUM worker threads and processes. Only used together with --recursive. [default: %(default)s]", metavar="NUM")
+        parser.add_argument("--stream", dest="stream", action="store_true", help="print missing files as soon as each directory is processed instead of collecting all results first. Keeps memory use bounded on big trees. [default: %(default)s]")
+        parser.add_argument("--format", dest="format", choices=['text'] + sorted(_WRITERS), help="output format. 'jsonl', 'csv' and 'ranges' write one record per file sequence with missing files, listing them as ranges like 0101-0250, as soon as each directory is processed. [default: %(default)s]")
+        parser.add_argument("--backend", dest="backend", choices=BACKENDS, default='auto', help="engine for finding the gaps in file sequences. 'numpy' is faster for very long sequences, 'auto' uses it for those if NumPy is installed [default: %(default)s]")
+        parser.add_argument("--step", dest="step", help="step between the sequence numbers of file sequences with only every Nth frame, e.g. 2 for sequences rendered on twos, or 'auto' to detect it per sequence from sequences with 3 or more files [default: %(default)s]", metavar="N|auto")
+        parser.add_argument("--check-size", dest="checksize", action="store_true", help="also flag empty files and files whose size deviates from the median size of their file sequence by more than --size-tolerance, e.g. truncated frames [default: %(default)s]")
+        parser.add_argument("--size-tolerance", dest="sizetolerance", type=float, default=0.5, help="deviation from the median size relative to the median for --check-size, e.g. 0.5 flags files smaller than half the median size [default: %(default)s]", metavar="TOL")
+        parser.add_argument("--expect", dest="expectations", help="check file sequences against the frame ranges in FILE, reporting missing files before the first and after the last file too. FILE has one sequence pattern (as in the output, e.g. 'shots/sh010/beauty.####.exr' or just 'beauty.####.exr') and frame range (e.g. '1001-1100' or '1001-1100x2') per line. [default: %(default)s]", metavar="FILE")
+        parser.add_argument("--shard", dest="shard", help="only process shard INDEX (0-based) of COUNT shards of each path, so that COUNT processes can process a tree independently. Sub directories are assigned to shards by a hash of their name. Use with --format jsonl and combine the results with '%(prog)s merge FILE...' [default: %(default)s]", metavar="INDEX/COUNT")
+        parser.add_argument("--cache", dest="cache", help="keep scan results in a cache database at PATH and only re-scan directories modified since the last run [default: %(default)s]", metavar="PATH")
+        parser.add_argument("--stats", dest="stats", action="store_true", help="print the time spent in each processing phase, file and directory counts and throughput to stderr when done [default: %(default)s]")
+        parser.add_argument("-w", "--watch", dest="watch", action="store_true", help="keep watching the paths and print changes to the missing files as files are added or removed, until interrupted with Ctrl-C [default: %(default)s]")
+        parser.add_argument("--interval", dest="interval", type=float, help="seconds between checks for changes in watch mode [default: %(default)s]", metavar="SEC")
         parser.add_argument('-s', '--strict', dest="strict", help="use re.match instead of re.search to match and split filenames [default: %(default)s]", action="store_true")
         parser.add_argument(dest="paths", help="paths to folder(s) with file sequence(s) [default: %(default)s]", metavar="path", nargs='+')
         
-        parser.set_defaults(verbose=0, strict=False)
+        parser.set_defaults(verbose=0, strict=False, stream=False, watch=False, interval=1.0, format='text')
         
         # Process options
         args = parser.parse_args()
@@ -1072,7 +4052,22 @@ USAGE
         recurse = args.recurse
         inpat = args.include
         expat = args.exclude
+        direxpat = args.direxclude
+        fileexcludes = args.fileexcludes
         strict = args.strict
+        jobs = args.jobs
+        stream = args.stream
+        outformat = args.format
+        shard = args.shard
+        expectations = args.expectations
+        step = args.step
+        backend = args.backend
+        checksize = args.checksize
+        sizetolerance = args.sizetolerance
+        cache = args.cache
+        showstats = args.stats
+        watch = args.watch
+        interval = args.interval
         argv0 = sys.argv[0].split(u"/")[-1]
         defaultencoding = sys.getdefaultencoding()
         
@@ -1084,6 +4079,43 @@ USAGE
                 print "Recursive mode off"
             if strict:
                 print "Using strict mode"
+            if jobs > 1:
+                print "Using %i parallel jobs" % jobs
+        
+        if jobs is not None and jobs < 0:
+            raise CLIError("number of jobs must be positive")
+        
+        if interval <= 0:
+            raise CLIError("watch interval must be positive")
+        
+        if watch and outformat != 'text':
+            raise CLIError("watch mode only supports the text format")
+        
+        if step is not None and step != 'auto':
+            try:
+                step = int(step, 10)
+            except ValueError:
+                raise CLIError("step must be a number or 'auto'")
+            if step < 1:
+                raise CLIError("step must be positive")
+        
+        if watch:
+            if step is not None and step != 1:
+                raise CLIError("watch mode doesn't support steps")
+            if expectations:
+                raise CLIError("watch mode doesn't support expected frame ranges")
+            if checksize:
+                raise CLIError("watch mode doesn't support size checks")
+        
+        if shard:
+            try:
+                shard = tuple(int(part, 10) for part in shard.split('/'))
+                if len(shard) != 2:
+                    raise ValueError
+            except ValueError:
+                raise CLIError("shard must be given as INDEX/COUNT, e.g. 0/4")
+            if watch:
+                raise CLIError("watch mode doesn't support shards")
         
         if inpat and expat and inpat == expat:
             raise CLIError("include and exclude pattern are equal! Nothing will be processed.")
@@ -1096,33 +4128,119 @@ USAGE
                             "%sdid you forget -p <regex>|--pattern=<regex>?" % ((len(argv0)+5) * " "))
         
         missing = {}
-
-        for inpath in paths:
+        streamfiles = 0
+        streamdirs = 0
+        
+        # one checker for all paths, so patterns are compiled once and
+        # the paths are scanned in one pass with merged results
+        if verbose > 0:
+            fsc = FileSequenceChecker(rangestart, rangeend, recurse, True, jobs, backend)
+        else:
+            fsc = FileSequenceChecker(rangestart, rangeend, recurse, workers=jobs, backend=backend)
+        if defaultencoding == 'ascii':
+            if splitpat and template:
+                fsc.setsplitpattern(unicode(splitpat, 'utf-8'), 
+                                    unicode(template, 'utf-8'))
+            if inpat:
+                fsc.setincludepattern(unicode(inpat, 'utf-8'))
+            if expat:
+                fsc.setexcludepattern(unicode(expat, 'utf-8'))
+            if direxpat:
+                fsc.setdirexcludepattern(unicode(direxpat, 'utf-8'))
+            if fileexcludes:
+                fsc.setfileexcludes([unicode(name, 'utf-8') for name in fileexcludes])
+        else:
+            if splitpat and template:
+                fsc.setsplitpattern(unicode(splitpat, defaultencoding), 
+                                    unicode(template, defaultencoding))
+            if inpat:
+                fsc.setincludepattern(unicode(inpat, defaultencoding))
+            if expat:
+                fsc.setexcludepattern(unicode(expat, defaultencoding))
+            if direxpat:
+                fsc.setdirexcludepattern(unicode(direxpat, defaultencoding))
+            if fileexcludes:
+                fsc.setfileexcludes([unicode(name, defaultencoding) for name in fileexcludes])
+        if cache:
+            fsc.setscancache(cache)
+        if shard:
+            fsc.setshard(shard)
+        if expectations:
+            fsc.setexpectations(expectations)
+        if step is not None:
+            fsc.setstep(step)
+        if checksize:
+            fsc.setsizecheck(sizetolerance)
+        if showstats:
+            fsc.setstats()
+        def printstats(outputtime, streaming=True):
+            stats = fsc.laststats
+            stats.times['output'] += outputtime
+            if not streaming:
+                # output only started once processing was done
+                stats.elapsed += outputtime
+            print >> sys.stderr, stats.report()
+        outputtime = 0.0
+        if outformat != 'text':
+            writer = _WRITERS[outformat](sys.stdout)
+            for record in fsc.iter_sequences(paths, strict, verbose):
+                outputstart = _monotonic()
+                writer.write(_make_record(*record))
+                outputtime += _monotonic() - outputstart
+            writer.close()
+            if showstats:
+                printstats(outputtime)
+            return 0
+        if stream:
+            lastdir = None
+            for containingdir, _sequence, gap in fsc.iter_missing(paths, strict, verbose):
+                outputstart = _monotonic()
+                if containingdir != lastdir:
+                    print "In %s:" % containingdir
+                    lastdir = containingdir
+                    streamdirs += 1
+                for missingfile in gap.filenames():
+                    print "  Missing %s" % missingfile
+                streamfiles += gap.size
+                sys.stdout.flush()
+                outputtime += _monotonic() - outputstart
+        elif not watch:
+            missing = fsc.processdir(paths, strict, verbose)
+        if watch:
+            def printchange(containingdir, sign, gap):
+                if gap.size == 1:
+                    filenames = gap.filename(gap.start)
+                else:
+                    filenames = u"%s (%s to %s)" % (gap.sequence, gap.start, gap.last)
+                if sign == '+':
+                    print "+ Missing %s" % os.path.join(containingdir, filenames)
+                else:
+                    print "- No longer missing %s" % os.path.join(containingdir, filenames)
+                sys.stdout.flush()
+            watcher = SequenceWatcher(fsc, paths, interval)
             if verbose > 0:
-                fsc = FileSequenceChecker(rangestart, rangeend, recurse, True)
-            else:
-                fsc = FileSequenceChecker(rangestart, rangeend, recurse)
-            if defaultencoding == 'ascii':
-                if splitpat and template:
-                    fsc.setsplitpattern(unicode(splitpat, 'utf-8'), 
-                                        unicode(template, 'utf-8'))
-                if inpat:
-                    fsc.setincludepattern(unicode(inpat, 'utf-8'))
-                if expat:
-                    fsc.setexcludepattern(unicode(expat, 'utf-8'))
+                if watcher._inotify is not None:
+                    print "Watching with inotify"
+                else:
+                    print "Watching by polling every %s s" % interval
+            watcher.run(printchange)
+        if stream:
+            if streamfiles > 0:
+                print "\n-------------"
+                print "Total missing: %i file%s in %i dir%s" % \
+                      (streamfiles, streamfiles != 1 and "s" or "", streamdirs, streamdirs != 1 and "s" or "")
             else:
-                if splitpat and template:
-                    fsc.setsplitpattern(unicode(splitpat, defaultencoding), 
-                                        unicode(template, defaultencoding))
-                if inpat:
-                    fsc.setincludepattern(unicode(inpat, defaultencoding))
-                if expat:
-                    fsc.setexcludepattern(unicode(expat, defaultencoding))
-            missing = fsc.processdir(inpath, strict, verbose)
+                print "Nothing missing"
+            print ""
+            print "Processed in %0.4f s" % fsc.lastexectime
+            if showstats:
+                printstats(outputtime)
+            return 0
         raise KeyboardInterrupt
     except KeyboardInterrupt:
         exectime = fsc.lastexectime
         if exectime > 0:
+            outputstart = _monotonic()
             if len(missing) > 0:
                 for containingdir, missingfiles in missing.items():
                     print "In %s:" % containingdir
@@ -1143,12 +4261,40 @@ USAGE
                 print "Nothing missing"
             else:
                 print "Nothing missing"
+            anomalydirs = sorted(set(fsc.duplicates) | set(fsc.badpadding) | set(fsc.badsizes))
+            if anomalydirs:
+                numduplicates = numbadpadding = numbadsizes = 0
+                print ""
+                for containingdir in anomalydirs:
+                    print "In %s:" % containingdir
+                    for duplicate in fsc.duplicates.get(containingdir, []):
+                        print "  Duplicate %s" % duplicate
+                        numduplicates += 1
+                    for badpadding in fsc.badpadding.get(containingdir, []):
+                        print "  Inconsistent padding %s" % badpadding
+                        numbadpadding += 1
+                    for badsize, size, median in fsc.badsizes.get(containingdir, []):
+                        print "  Bad size %s (%i bytes, median %i)" % (badsize, size, median)
+                        numbadsizes += 1
+                print "\n-------------"
+                if checksize:
+                    print "Total duplicates: %i, inconsistently padded: %i, bad size: %i" % \
+                          (numduplicates, numbadpadding, numbadsizes)
+                else:
+                    print "Total duplicates: %i, inconsistently padded: %i" % (numduplicates, numbadpadding)
             if fsc.totalprocessed == 1:
                 plurality = ""
             else:
                 plurality = "s"
             print ""
             print "Processed %i file%s in %0.4f s" % (fsc.totalprocessed, plurality, exectime)
+            if verbose > 0:
+                print "Issued %i file system calls" % fsc.lastsyscallcount
+                if fsc._cache is not None:
+                    print "Reused %i of %i cached dirs" % (fsc._cache.hits, fsc._cache.hits + fsc._cache.misses)
+            if showstats and fsc.laststats is not None:
+                sys.stdout.flush()
+                printstats(_monotonic() - outputstart, streaming=False)
         return 0
     except Exception, e:
         if DEBUG or False:
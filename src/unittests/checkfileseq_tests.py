@@ -9,8 +9,17 @@ Copyright (c) 2010 Berg Media. All rights reserved.
 
 import unittest
 import sys
+import os
+import time
+import shutil
+import tempfile
+import cPickle
 
-from checkfileseq import FileSequenceChecker
+from StringIO import StringIO
+from multiprocessing.pool import ThreadPool
+
+import checkfileseq
+from checkfileseq import findgaps, FileList, FileParts, FileSequenceChecker, FrameSet, GapRange, MissingFiles, ScanCache, ScanStats, ScanResult, SequenceWatcher
 
 reload(sys)
 sys.setdefaultencoding('ascii') # IGNORE:E1101 @UndefinedVariable
@@ -69,6 +78,23 @@ class TestFileSequenceCheckerFileExcludePattern(unittest.TestCase):
         self.fsc._prepare_dir_contents(DIRS['fileexcludes'])
         self.assertEqual(self.fsc._dircontents, self.result)
         
+    def testFileExcludeGlobs(self):
+        ''' test that glob patterns in fileexcludes are matched against file names. '''
+        self.fsc.setfileexcludes(['Exclude*', '*.db', 'desktop.ini'])
+        self.fsc._prepare_dir_contents(DIRS['fileexcludes'])
+        self.assertEqual(self.fsc._dircontents, self.result)
+        self.fsc.setfileexcludes(['*.06.png'], extend=False)
+        self.fsc._prepare_dir_contents(DIRS['fileexcludes'])
+        self.assertEqual(self.fsc._dircontents[DIRS['fileexcludes']], self.result[DIRS['fileexcludes']][:1])
+        
+    def testFileExcludesArePerInstance(self):
+        ''' test that setting fileexcludes doesn't affect other instances. '''
+        defaults = list(FileSequenceChecker.FILEEXCLUDES)
+        self.fsc.setfileexcludes(['ExcludeMe', '*.tmp'])
+        self.assertEqual(FileSequenceChecker.FILEEXCLUDES, defaults)
+        self.assertEqual(FileSequenceChecker()._fileexcludes, frozenset(defaults))
+        self.assertEqual(FileSequenceChecker()._fileexcludeglob, None)
+        
 class TestFileSequenceCheckerExcludePattern(unittest.TestCase):
     ''' test cases for the exclude pattern facility. '''
     
@@ -101,6 +127,40 @@ class TestFileSequenceCheckerExcludePattern(unittest.TestCase):
         self.fsc.setexcludepattern(ur'Write60')
         self.fsc._prepare_dir_contents(DIRS['reverse'])
         self.assertNotEqual(self.fsc._dircontents, self.result)
+        
+    def testExcludePatternWithPathSeparator(self):
+        ''' test that only patterns with a path separator are matched against the whole path '''
+        self.fsc.setexcludepattern(ur'reverse_order')
+        self.fsc._prepare_dir_contents(DIRS['reverse'])
+        self.assertEqual(len(self.fsc._dircontents[DIRS['reverse']]), 7)
+        self.fsc.setexcludepattern(ur'reverse_order/\d')
+        self.fsc._prepare_dir_contents(DIRS['reverse'])
+        self.assertEqual(len(self.fsc._dircontents[DIRS['reverse']]), 4)
+        for nameparts in self.result[DIRS['reverse']]:
+            self.assertTrue(nameparts in self.fsc._dircontents[DIRS['reverse']])
+        
+    def testInvalidExcludePattern(self):
+        ''' test that invalid patterns are rejected when they are set '''
+        self.assertRaises(ValueError, self.fsc.setexcludepattern, ur'(Write')
+        self.assertRaises(ValueError, self.fsc.setincludepattern, ur'[')
+        
+    def testDirExcludePattern(self):
+        ''' test that excluded directories aren't descended into '''
+        for workers in [None, 2]:
+            fsc = FileSequenceChecker(recursive=True, workers=workers)
+            fsc.setdirexcludepattern(ur'/(mixed|reverse)_order/')
+            fsc.processdir(u'data')
+            self.assertEqual(sorted(fsc._dircontents), 
+                             [u'data', DIRS['fileexcludes'], DIRS['normal'], DIRS['nothing']])
+        fsc = FileSequenceChecker(recursive=True)
+        fsc.setdirexcludepattern(ur'_order$')
+        fsc.processdir(u'data')
+        self.assertEqual(sorted(fsc._dircontents), [u'data', DIRS['fileexcludes'], DIRS['nothing']])
+        # given paths are never excluded
+        fsc = FileSequenceChecker(recursive=True)
+        fsc.setdirexcludepattern(ur'data/')
+        fsc.processdir(u'data')
+        self.assertEqual(fsc._dircontents.keys(), [u'data'])
 
 class TestFileSequenceCheckerIncludePattern(unittest.TestCase):
     ''' test cases for the include pattern facility '''
@@ -180,6 +240,24 @@ class TestFileSequenceCheckerSplitPattern(unittest.TestCase):
         self.fsc2.setsplitpattern(self.spat2, self.spat2template)
         self.assertEqual(self.fsc2._splitpat, self.spat2)
         
+    def testCustomSplitPatternIsPreAnalysed(self):
+        ''' test that setsplitpattern infers the order and compiles a custom pattern once '''
+        self.fsc1.setsplitpattern(self.spat1, self.spat1template)
+        self.assertEquals(self.fsc1._splitter.patterns[0][1], 'normal')
+        self.assertEquals(self.fsc1._splitter.groupnames, set(['filename', 'seqnum']))
+        self.assertEquals(self.fsc1._template, self.spat1template)
+        self.fsc2.setsplitpattern(self.spat2, self.spat2template)
+        self.assertEquals(self.fsc2._splitter.patterns[0][1], 'reverse')
+        self.assertRaises(ValueError, self.fsc1.setsplitpattern, ur'(?P<filename>(?P<seqnum>\d+)', self.spat2template)
+        
+    def testCustomSplitPatternOutput(self):
+        ''' test processing a directory with a custom split pattern '''
+        fsc = FileSequenceChecker()
+        fsc.setsplitpattern(ur'^(?P<filename>.+?\.)(?P<seqnum>\d+)$', ur'%(filename)s%(seqnum)s')
+        fsc.setincludepattern(ur'line')
+        output = fsc.processdir(DIRS['normal'])
+        self.assertEquals(output, {DIRS['normal']: [u'line.%03d.bmp' % i for i in range(4, 10)]})
+        
     def testReset(self):
         ''' test passing None to setsplitpat in order to reset its to the default state'''
         fsc = FileSequenceChecker()
@@ -193,12 +271,35 @@ class TestFileSequenceCheckerSplitPattern(unittest.TestCase):
         self.assertRaises(ValueError, self.fsc1.setsplitpattern, self.badspat2, self.spat2template)
         self.assertRaises(ValueError, self.fsc1.setsplitpattern, self.badspat1)
         
+    def testDictPatternIsRejected(self):
+        ''' test that a dict of split patterns raises TypeError and keeps the current patterns '''
+        fsc = FileSequenceChecker()
+        fsc.setsplitpattern(self.spat1, self.spat1template)
+        splitter = fsc._splitter
+        self.assertRaises(TypeError, fsc.setsplitpattern, {'normal': self.spat2})
+        self.assertEquals((fsc._splitpat, fsc._splitter), (self.spat1, splitter))
+        
     def testDefaultSplitPatternMatches(self):
         ''' test that the default split patterns actually match what they should '''
         for name in self.filenames:
             _fsc = FileSequenceChecker()
             result = _fsc.splitfilename(name)
             self.assertIsNotNone(result)
+        
+    def testCombinedSplitPatternEqualsCascade(self):
+        ''' test that the combined default split patterns match like trying each pattern in turn '''
+        def cascadesplit(name):
+            ''' split name trying each default pattern in turn '''
+            for d in FileSequenceChecker.SPLITPAT:
+                match = d['pattern'].match(name)
+                if match:
+                    return d['order'], match.groupdict()
+        names = [os.path.splitext(name)[0] for name in self.filenames]
+        for _dir in DIRS.values():
+            names.extend(os.path.splitext(name)[0] for name in os.listdir(_dir))
+        names.extend([u'v12', u'a1-', u'1', u'x', u'12ab34', u'a.b.c'])
+        for name in names:
+            self.assertEquals(self.fsc1._splitter.match(name), cascadesplit(name))
 
 
 class TestFileSequenceCheckerOutput(unittest.TestCase):
@@ -482,6 +583,805 @@ class TestFileSequenceCheckerOutput(unittest.TestCase):
         self.assertIsNotNone(fsc[self.dirs['mixed']])
         
 
+class TestFileSequenceCheckerGrouping(unittest.TestCase):
+    ''' test cases for grouping a directory's files into file sequences '''
+    
+    def setUp(self):
+        self.fsc = FileSequenceChecker()
+        self.files = [self.fsc.splitfilename(name) for name in [
+            u'shot.0003.jpg', u'shot.0010.exr', u'shot.0002.exr', 
+            u'shot.0001.jpg', u'shot.0004.exr', u'shot.9.exr'
+        ]]
+        
+    def testGroupFiles(self):
+        ''' test that files are grouped by sequence and sorted by int value of their sequence numbers '''
+        grouped = self.fsc._group_files(self.files)
+        self.assertEquals([f['seqnum'] + f['fileext'] for f in grouped], 
+                          [u'0002.exr', u'0004.exr', u'9.exr', u'0010.exr', u'0001.jpg', u'0003.jpg'])
+        
+    def testSequencesWithSameNameAreComparedSeparately(self):
+        ''' test that sequences only differing by extension don't produce missing files for each other '''
+        missing = self.fsc._compare_files(u'shots', self.fsc._group_files(self.files))
+        self.assertEquals(missing, [u'shot.0003.exr', u'shot.0005.exr', u'shot.0006.exr', 
+                                    u'shot.0007.exr', u'shot.0008.exr', u'shot.0002.jpg'])
+        
+    def testGroupedFilesShareStrings(self):
+        ''' test that the files of a sequence share their file name strings after grouping '''
+        grouped = self.fsc._group_files(self.files)
+        exrs = [f for f in grouped if f['fileext'] == u'.exr']
+        self.assertEquals(len(set(id(f.filename) for f in exrs)), 1)
+        self.assertEquals(len(set(id(f.fileext) for f in exrs)), 1)
+        self.assertNotEqual(id(exrs[0].fileext), id(grouped[-1].fileext))
+        
+    def testRegularSequencesAreStoredAsFrameSets(self):
+        ''' test that only irregular file sequences keep a record per file '''
+        names = [u'reg.%04d.exr' % i for i in [1, 2, 4, 5, 9, 1000]] + \
+                [u'pad.1.exr', u'pad.0002.exr'] + \
+                [u'dup.001.exr', u'dup.01.exr'] + \
+                [u'sparse.1.exr', u'sparse.5000.exr'] + \
+                [u'nopad.%i.exr' % i for i in [8, 9, 10, 11, 13]]
+        grouped = self.fsc._group_files([self.fsc.splitfilename(name) for name in reversed(names)])
+        self.assertTrue(isinstance(grouped, FileList))
+        self.assertEquals([(type(sequence) is list, len(sequence)) for sequence in grouped.sequences], 
+                          [(True, 2), (False, 5), (True, 2), (False, 6), (True, 2)])
+        self.assertEquals(len(grouped), len(names))
+        self.assertEquals(sorted(checkfileseq._joinfilename(nameparts) for nameparts in grouped), sorted(names))
+        self.assertEquals([grouped[2]['seqnum'], grouped[6]['seqnum'], grouped[-3]['seqnum']], 
+                          [u'8', u'13', u'1000'])
+        self.assertEquals([nameparts['seqnum'] for nameparts in grouped[9:13]], [u'0001', u'0002', u'0004', u'0005'])
+        self.assertEquals(grouped, list(grouped))
+        self.assertRaises(IndexError, grouped.__getitem__, len(names))
+        for protocol in (0, 2):
+            self.assertEquals(cPickle.loads(cPickle.dumps(grouped, protocol)), grouped)
+        missing = self.fsc._compare_files(u'shots', grouped)
+        self.assertEquals([f for f in missing if f.startswith(u'reg.')][:3], [u'reg.0003.exr', u'reg.0006.exr', u'reg.0007.exr'])
+        self.assertEquals([f for f in missing if f.startswith(u'nopad.')], [u'nopad.12.exr'])
+
+
+class TestFileParts(unittest.TestCase):
+    ''' test cases for the slotted file name parts record '''
+    
+    def setUp(self):
+        self.nameparts = FileSequenceChecker().splitfilename(u'v12_Write.png')
+        self.expected = {'filename': u'_Write', 'filename2': u'v', 'seqnum': u'12', 
+                         'fileext': u'.png', 'order': 'reverse'}
+        
+    def testBehavesLikeDict(self):
+        ''' test item access, membership, keys and comparing to dicts '''
+        self.assertTrue(isinstance(self.nameparts, FileParts))
+        self.assertEquals(self.nameparts, self.expected)
+        self.assertEquals(self.expected, self.nameparts)
+        self.assertEquals(sorted(self.nameparts), sorted(self.expected))
+        self.assertEquals(self.nameparts['seqnum'], u'12')
+        self.assertFalse('size' in self.nameparts)
+        self.assertRaises(KeyError, lambda: self.nameparts['size'])
+        self.assertEquals(self.nameparts.get('size', 7), 7)
+        self.nameparts['size'] = 0
+        self.assertEquals(self.nameparts.todict(), dict(self.expected, size=0))
+        self.assertNotEqual(self.nameparts, self.expected)
+        self.assertRaises(KeyError, self.nameparts.__setitem__, 'other', 1)
+        self.assertFalse(hasattr(self.nameparts, '__dict__'))
+        
+    def testConversions(self):
+        ''' test converting to dicts and pickling, which worker processes rely on '''
+        self.nameparts['size'] = 0
+        for protocol in (0, 2):
+            copy = cPickle.loads(cPickle.dumps(self.nameparts, protocol))
+            self.assertEquals(copy.todict(), self.nameparts.todict())
+        self.assertEquals(FileParts.fromdict(self.nameparts.todict()), self.nameparts)
+        self.assertEquals(checkfileseq._unpack_files(checkfileseq._pack_files([self.nameparts])), 
+                          [self.nameparts])
+
+
+class TestMissingFiles(unittest.TestCase):
+    ''' test cases for the range encoded missing files '''
+    
+    def setUp(self):
+        self.missing = MissingFiles([
+            GapRange(u'Name20.', 2, u'', u'.png', 2, 6),
+            GapRange(u'v', 1, u'_Write', u'.png', 13, 15)
+        ])
+        self.expected = [
+            u'Name20.02.png', 
+            u'Name20.03.png', 
+            u'Name20.04.png', 
+            u'Name20.05.png', 
+            u'v13_Write.png', 
+            u'v14_Write.png'
+        ]
+    
+    def testBehavesLikeList(self):
+        ''' test iterating, indexing and comparing missing files '''
+        self.assertEquals(self.missing, self.expected)
+        self.assertEquals(list(self.missing), self.expected)
+        self.assertEquals(len(self.missing), len(self.expected))
+        self.assertEquals(self.missing[0], self.expected[0])
+        self.assertEquals(self.missing[4], self.expected[4])
+        self.assertEquals(self.missing[-1], self.expected[-1])
+        self.assertRaises(IndexError, self.missing.__getitem__, 6)
+        self.assertNotEqual(self.missing, self.expected[:-1])
+        
+    def testSlicing(self):
+        ''' test that slices are lists like those of the missing file names list '''
+        for index in [slice(None), slice(1, 5), slice(3, None), slice(None, -2), slice(-3, -1), 
+                      slice(None, None, 2), slice(1, 100, 3), slice(None, None, -1), slice(4, 0, -2), slice(5, 2)]:
+            self.assertEquals(self.missing[index], self.expected[index])
+        self.assertEquals(self.missing[1:3], [u'Name20.03.png', u'Name20.04.png'])
+        missing = MissingFiles([GapRange(u'shot.', 7, u'', u'.exr', 1, 2000001)])
+        self.assertEquals(missing[:2], [u'shot.0000001.exr', u'shot.0000002.exr'])
+        
+    def testHugeGapIsNotExpanded(self):
+        ''' test that the length of a huge gap is computed without constructing file names '''
+        missing = MissingFiles([GapRange(u'shot.', 7, u'', u'.exr', 1, 2000001)])
+        self.assertEquals(len(missing), 2000000)
+        self.assertEquals(missing[-1], u'shot.2000000.exr')
+
+
+class TestFindGaps(unittest.TestCase):
+    ''' test cases for the stateless gap detection core '''
+    
+    def testGaps(self):
+        ''' test gaps with and without range restriction and step '''
+        self.assertEquals(findgaps([]), [])
+        self.assertEquals(findgaps([5]), [])
+        self.assertEquals(findgaps([1, 2, 3]), [])
+        self.assertEquals(findgaps([1, 3, 3, 4, 8]), [(2, 3), (5, 8)])
+        self.assertEquals(findgaps([1, 3, 4, 8], start=4), [(5, 8)])
+        self.assertEquals(findgaps([1, 3, 4, 8], end=6), [(2, 3), (5, 7)])
+        self.assertEquals(findgaps([7, 8, 9], end=7), [])
+        self.assertEquals(findgaps([1, 3, 9, 10, 11], step=2), [(5, 9)])
+        
+    def testOffGridAndDuplicateFrames(self):
+        ''' test that frames off the step grid of the first frame and duplicates don't move the grid '''
+        self.assertEquals(findgaps([1, 3, 4, 8, 9, 11], step=2), [(5, 9)])
+        self.assertEquals(findgaps([1, 3, 5, 6, 9, 11, 13, 17], step=2), [(7, 9), (15, 17)])
+        self.assertEquals(findgaps([1, 3, 3, 4, 4, 9, 9], step=2), [(5, 9)])
+        self.assertEquals(findgaps([2, 4, 5, 8, 10], start=4, step=3), [(7, 10)])
+        for backend in checkfileseq.BACKENDS:
+            self.assertEquals(findgaps([1, 3, 5, 6, 9, 11, 13, 17], 0, 14, 2, backend), [(7, 9)])
+            self.assertEquals(findgaps([1, 3, 3, 4, 4, 9, 9], 0, 0, 2, backend), [(5, 9)])
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for frame in [1, 3, 5, 6, 9, 11, 13, 17]:
+                open(os.path.join(tmpdir, u's.%04d.exr' % frame), 'w').close()
+            fsc = FileSequenceChecker()
+            fsc.setstep(2)
+            self.assertEquals(fsc.processdir(tmpdir)[tmpdir], [u's.0007.exr', u's.0015.exr'])
+        finally:
+            shutil.rmtree(tmpdir)
+        
+    def testBackendsAgree(self):
+        ''' test that all backends find the same gaps, falling back to Python without NumPy '''
+        cases = [([], 0, 0, 1), ([5], 0, 0, 1), ([1, 3, 3, 4, 8], 0, 0, 1), ([1, 3, 4, 8], 4, 0, 1), 
+                 ([1, 3, 4, 8], 0, 6, 1), ([7, 8, 9], 0, 7, 1), ([1, 3, 9, 10, 11], 0, 0, 2), 
+                 ([0, 2, 3, 5, 6, 12, 15, 40], 3, 20, 3), (range(1, 3000, 3), 0, 0, 1), 
+                 ([1, 3, 4, 8, 9, 11], 0, 0, 2), ([1, 3, 3, 4, 4, 9, 9], 0, 10, 2)]
+        for frames, start, end, step in cases:
+            expected = findgaps(frames, start, end, step, 'python')
+            for backend in checkfileseq.BACKENDS:
+                self.assertEquals(findgaps(frames, start, end, step, backend), expected)
+        for backend in checkfileseq.BACKENDS:
+            fsc = FileSequenceChecker(recursive=True, backend=backend)
+            self.assertEquals(fsc.processdir(u'data'), FileSequenceChecker(recursive=True).processdir(u'data'))
+            
+    @unittest.skipIf(checkfileseq.numpy is None, 'NumPy not available')
+    def testNumPyBackend(self):
+        ''' test that the NumPy backend returns Python ints and takes arrays '''
+        frames = checkfileseq.numpy.array([1, 2, 5, 9])
+        gaps = checkfileseq._findgaps_numpy(frames)
+        self.assertEquals(gaps, [(3, 5), (6, 9)])
+        self.assertEquals([type(number) for gap in gaps for number in gap], [int] * 4)
+        
+    def testConcurrentDirectories(self):
+        ''' test that one checker can compare several directories at once '''
+        fsc = FileSequenceChecker(recursive=True)
+        expected = fsc.processdir(u'data')
+        pool = ThreadPool(4)
+        try:
+            dirs = sorted(fsc._dircontents.items()) * 10
+            results = pool.map(lambda (adir, files): (adir, fsc._compare_files(adir, files)), dirs)
+        finally:
+            pool.close()
+        for adir, missingfiles in results:
+            self.assertEquals(missingfiles, expected.get(adir))
+
+
+class TestFrameSet(unittest.TestCase):
+    ''' test cases for the bitmap of frame numbers '''
+    
+    def setUp(self):
+        self.frames = [3, 1, 2, 9, 10, 11, 12, 13, 14, 15, 16, 17, 40, 40, 41, 1000]
+        self.frameset = FrameSet(self.frames)
+    
+    def testBehavesLikeSet(self):
+        ''' test iterating, counting, membership and adding '''
+        self.assertEquals(list(self.frameset), sorted(set(self.frames)))
+        self.assertEquals(len(self.frameset), len(set(self.frames)))
+        self.assertEquals((self.frameset.first, self.frameset.last), (1, 1000))
+        self.assertTrue(40 in self.frameset)
+        self.assertFalse(39 in self.frameset)
+        self.assertFalse(-5 in self.frameset)
+        frameset = FrameSet()
+        self.assertEquals((len(frameset), frameset.first, frameset.last, frameset.gaps()), (0, None, None, []))
+        for frame in reversed(self.frames):
+            frameset.add(frame)
+        self.assertEquals(frameset, self.frameset)
+        self.assertEquals(len(self.frameset._bits), 1000 // 8 + 1, 'memory should be bounded by the span')
+        
+    def testGapsEqualFindGaps(self):
+        ''' test that gaps are the same as those findgaps() finds '''
+        frames = sorted(self.frames)
+        for start, end, step in [(0, 0, 1), (2, 0, 1), (0, 16, 1), (10, 100, 1), (0, 0, 2)]:
+            self.assertEquals(self.frameset.gaps(start, end, step), findgaps(frames, start, end, step))
+        dense = FrameSet(frame for frame in xrange(100000) if frame % 9999)
+        self.assertEquals(dense.gaps(), findgaps(list(dense)))
+        
+    def testMissing(self):
+        ''' test missing frames of an expected range '''
+        self.assertEquals(self.frameset.missing(0, 20), [(0, 1), (4, 9), (18, 21)])
+        self.assertEquals(self.frameset.missing(1, 17, 2), [(5, 9)])
+        self.assertEquals(FrameSet().missing(5, 6), [(5, 7)])
+        self.assertEquals(self.frameset.missing(-5, 19, 3), [(-5, 1), (4, 10), (19, 20)])
+        self.assertEquals(self.frameset.missing(-9, -1, 4), [(-9, 0)])
+        self.assertEquals(self.frameset.missing(995, 1010, 5), [(995, 1000), (1005, 1011)])
+        self.assertEquals(FrameSet().missing(1, 7, 3), [(1, 8)])
+        for first, last, step in [(0, 50, 2), (3, 41, 7), (-10, 1100, 9), (12, 11, 2)]:
+            expected = [frame for frame in xrange(first, last + 1, step) if frame not in self.frameset]
+            self.assertEquals([frame for start, stop in self.frameset.missing(first, last, step) 
+                               for frame in xrange(start, stop, step)], expected)
+        
+    def testUnionAndSerialization(self):
+        ''' test merging frame sets and converting them to strings and back '''
+        other = FrameSet([0, 4, 5, 6, 7, 8, 2000])
+        union = self.frameset | other
+        self.assertEquals(list(union), sorted(set(self.frames) | set(other)))
+        self.assertEquals(list(self.frameset), sorted(set(self.frames)), 'operands should stay untouched')
+        self.frameset.update(FrameSet())
+        self.assertEquals(FrameSet.fromstring(union.tostring()), union)
+        self.assertEquals(FrameSet.fromstring(FrameSet().tostring()), FrameSet())
+        
+    def testMergedAcrossDirectories(self):
+        ''' test that file sequences with the same pattern in different directories are merged '''
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for subdir, frames in [(u'a', [1, 2, 3]), (u'b', [4, 6]), (u'c', [7])]:
+                os.mkdir(os.path.join(tmpdir, subdir))
+                for frame in frames:
+                    open(os.path.join(tmpdir, subdir, u'shot.%04d.exr' % frame), 'w').close()
+            framesets = FileSequenceChecker(recursive=True).processdir(tmpdir).framesets()
+            self.assertEquals(framesets.keys(), [u'shot.####.exr'])
+            self.assertEquals(framesets[u'shot.####.exr'].gaps(), [(5, 6)])
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class TestFileSequenceCheckerStreaming(unittest.TestCase):
+    ''' test cases for the streaming iter_missing() API '''
+    
+    def testStreamedOutputEqualsProcessdirOutput(self):
+        ''' test that iter_missing yields the same missing files as processdir '''
+        for kwargs in [{}, {'start': 0, 'end': 10}, {'workers': 2}]:
+            fsc = FileSequenceChecker(recursive=True, **kwargs)
+            streamed = {}
+            for _dir, sequence, gap in fsc.iter_missing(u'data'):
+                self.assertEquals(sequence, gap.sequence)
+                streamed.setdefault(_dir, []).extend(gap.filenames())
+            self.assertEquals(fsc.totalfiles, 0, 'iter_missing should not store results')
+            self.assertEquals(FileSequenceChecker(recursive=True, **kwargs).processdir(u'data'), streamed)
+            
+    def testSequenceDescription(self):
+        ''' test the sequence description yielded along with each gap '''
+        fsc = FileSequenceChecker()
+        fsc.processdir(DIRS['reverse'])
+        sequences = [sequence for _dir, sequence, _gap in fsc.iter_missing(DIRS['reverse'])]
+        self.assertEquals(sequences, [u'# Write30.png', u'# Write30.png', u'v##_Write.png', u'r###_Write30.png'])
+        self.assertEquals(fsc.totalfiles, 9, 'streaming should leave results of processdir untouched')
+        
+    def testSequenceRecords(self):
+        ''' test that iter_sequences groups the gaps of iter_missing by file sequence '''
+        fsc = FileSequenceChecker(recursive=True)
+        gaps = [gap for _dir, _sequence, gap in fsc.iter_missing(u'data')]
+        records = list(fsc.iter_sequences(u'data'))
+        self.assertEquals([gap for record in records for gap in record[5]], gaps)
+        records = list(fsc.iter_sequences(DIRS['reverse']))
+        self.assertEquals([record[:5] for record in records], 
+                          [(DIRS['reverse'], u'# Write30.png', 1, 1, 6), 
+                           (DIRS['reverse'], u'v##_Write.png', 2, 12, 15), 
+                           (DIRS['reverse'], u'r###_Write30.png', 3, 100, 105)])
+        self.assertEquals([gap.rangestring for gap in records[0][5]], [u'2', u'4-5'])
+        self.assertEquals([gap.rangestring for gap in records[2][5]], [u'101-104'])
+        
+    def testAnomalies(self):
+        ''' test that duplicate and inconsistently padded files are reported '''
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for filename in [u'shot.0001.exr', u'shot.1.exr', u'shot.0002.exr', u'shot.03.exr', 
+                             u'shot.0005.exr', u'shot.10000.exr', u'Write30 9.png', u'Write30 10.png']:
+                open(os.path.join(tmpdir, filename), 'w').close()
+            fsc = FileSequenceChecker()
+            fsc.processdir(tmpdir)
+            self.assertEquals(fsc.duplicates, {tmpdir: [u'shot.0001.exr', u'shot.1.exr']})
+            self.assertEquals(fsc.badpadding, {tmpdir: [u'shot.1.exr', u'shot.03.exr']})
+            records = list(FileSequenceChecker().iter_sequences(tmpdir))
+            self.assertEquals(len(records), 1)
+            self.assertEquals(records[0][1:5], (u'shot.####.exr', 4, 1, 10000))
+            self.assertEquals(records[0][6:], ([u'shot.0001.exr', u'shot.1.exr'], [u'shot.1.exr', u'shot.03.exr'], []))
+        finally:
+            shutil.rmtree(tmpdir)
+        
+    def testBadSizes(self):
+        ''' test that empty and truncated files are reported when checking sizes '''
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(tmpdir, u'sub'))
+            sizes = {u'shot.0001.exr': 1000, u'shot.0002.exr': 1010, u'shot.0003.exr': 0, 
+                     u'shot.0004.exr': 990, u'shot.0005.exr': 200, u'shot.0006.exr': 1000}
+            for filename, size in sizes.items():
+                for subdir in [u'', u'sub']:
+                    outfile = open(os.path.join(tmpdir, subdir, filename), 'wb')
+                    outfile.write('x' * size)
+                    outfile.close()
+            fsc = FileSequenceChecker()
+            fsc.processdir(tmpdir)
+            self.assertEquals(fsc.badsizes, {})
+            expected = [(u'shot.0003.exr', 0, 1000), (u'shot.0005.exr', 200, 1000)]
+            for workers in [None, 2]:
+                fsc = FileSequenceChecker(recursive=True, workers=workers)
+                fsc.setsizecheck()
+                fsc.processdir(tmpdir)
+                self.assertEquals(fsc.badsizes, {tmpdir: expected, os.path.join(tmpdir, u'sub'): expected})
+            fsc.setsizecheck(0.1)
+            records = list(fsc.iter_sequences(tmpdir))
+            self.assertEquals([record[1:5] + record[6:] for record in records], 
+                              [(u'shot.####.exr', 4, 1, 6, [], [], [u'shot.0003.exr', u'shot.0005.exr'])] * 2)
+            fsc.setsizecheck(None)
+            self.assertEquals(list(fsc.iter_sequences(tmpdir)), [])
+            self.assertRaises(ValueError, fsc.setsizecheck, -1)
+        finally:
+            shutil.rmtree(tmpdir)
+        
+    def testSteppedGapRange(self):
+        ''' test gap ranges with a step other than 1 '''
+        gap = GapRange(u'shot.', 4, u'', u'.exr', 101, 108, 2)
+        self.assertEquals((gap.size, gap.last, gap.rangestring), (4, 107, u'0101-0107x2'))
+        self.assertEquals(MissingFiles([gap])[-1], u'shot.0107.exr')
+        
+    def testRecordWriters(self):
+        ''' test the output of the writers for the --format option '''
+        gaps = [GapRange(u'shot.', 4, u'', u'.exr', 101, 251), GapRange(u'shot.', 4, u'', u'.exr', 300, 301)]
+        expected = {
+            'jsonl': '{"badpadding": [], "badsize": [], "count": 151, "dir": "a", "duplicates": ["shot.0007.exr", "shot.007.exr"], '
+                     '"first": 1, "last": 400, "missing": ["0101-0250", "0300"], "padding": 4, "sequence": "shot.####.exr"}\n',
+            'csv': 'dir,sequence,padding,first,last,count,missing,duplicates,badpadding,badsize\r\n'
+                   'a,shot.####.exr,4,1,400,151,0101-0250 0300,shot.0007.exr shot.007.exr,,\r\n',
+            'ranges': 'a/shot.####.exr [1-400] missing 0101-0250,0300 duplicates shot.0007.exr,shot.007.exr\n'
+        }
+        for outformat, output in expected.items():
+            stream = StringIO()
+            writer = checkfileseq._WRITERS[outformat](stream)
+            writer.write(checkfileseq._make_record(u'a', gaps[0].sequence, 4, 1, 400, gaps, 
+                                                   [u'shot.0007.exr', u'shot.007.exr'], []))
+            writer.close()
+            self.assertEquals(stream.getvalue(), output)
+
+
+class TestFileSequenceCheckerMultiplePaths(unittest.TestCase):
+    ''' test cases for processing several paths in one pass '''
+    
+    def testResultsAreMerged(self):
+        ''' test that the results of all paths are merged '''
+        for workers in [None, 2]:
+            fsc = FileSequenceChecker(workers=workers)
+            missing = fsc.processdir([DIRS['normal'], DIRS['reverse']])
+            expected = FileSequenceChecker().processdir(DIRS['normal'])
+            expected.update(FileSequenceChecker().processdir(DIRS['reverse']))
+            self.assertEquals(missing, expected)
+            self.assertEquals(sorted(fsc._dircontents), sorted([DIRS['normal'], DIRS['reverse']]))
+        
+    def testOverlappingPathsAreScannedOnce(self):
+        ''' test that duplicate and nested paths are only scanned once '''
+        for workers in [None, 2]:
+            expected = FileSequenceChecker(recursive=True)
+            expected.processdir(u'data')
+            fsc = FileSequenceChecker(recursive=True, workers=workers)
+            fsc.processdir([DIRS['normal'], u'data', u'data/', DIRS['mixed']])
+            self.assertEquals(fsc._dircontents, expected._dircontents)
+            self.assertEquals(fsc.totalprocessed, expected.totalprocessed)
+        fsc = FileSequenceChecker()
+        self.assertEquals(fsc._checkinpaths([u'data', DIRS['normal'], u'data/']), [u'data', DIRS['normal']])
+        
+
+class TestFileSequenceCheckerExpectations(unittest.TestCase):
+    ''' test cases for checking file sequences against expected frame ranges '''
+    
+    def testLeadingAndTrailingGaps(self):
+        ''' test that files missing before the first and after the last file are reported '''
+        fsc = FileSequenceChecker()
+        fsc.setexpectations({u'r###_Write30.png': (98, 107)})
+        missing = fsc.processdir(DIRS['reverse'])
+        self.assertEquals([gap.rangestring for gap in missing[DIRS['reverse']].gaps if gap.prefix == u'r'], 
+                          [u'098-099', u'101-104', u'106-107'])
+        
+    def testSteppedExpectation(self):
+        ''' test that only frames on the step grid are expected '''
+        fsc = FileSequenceChecker()
+        fsc.setexpectations({u'v##_Write.png': (9, 21, 3)})
+        missing = fsc.processdir(DIRS['reverse'])
+        gaps = [gap for gap in missing[DIRS['reverse']].gaps if gap.prefix == u'v']
+        self.assertEquals([gap.rangestring for gap in gaps], [u'09', u'18-21x3'])
+        self.assertEquals([f for gap in gaps for f in gap.filenames()], 
+                          [u'v09_Write.png', u'v18_Write.png', u'v21_Write.png'])
+        
+    def testDirectorySpecificExpectations(self):
+        ''' test that expectations with a directory path take precedence '''
+        fsc = FileSequenceChecker(recursive=True)
+        fsc.setexpectations({u'# Write30.png': (1, 6), 
+                             os.path.join(DIRS['mixed'], u'# Write30.png'): (1, 3)})
+        missing = fsc.processdir(u'data')
+        self.assertEquals([f for f in missing[DIRS['mixed']] if f.endswith(u' Write30.png')], [u'2 Write30.png'])
+        self.assertEquals([f for f in missing[DIRS['reverse']] if f.endswith(u' Write30.png')], 
+                          [u'2 Write30.png', u'4 Write30.png', u'5 Write30.png'])
+        
+    def testExpectationsFile(self):
+        ''' test reading expectations from a file '''
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, 'line.###.bmp 1-12\n\n# Write30.png 1-6x1\n')
+            os.close(fd)
+            fsc = FileSequenceChecker()
+            fsc.setexpectations(path)
+            self.assertEquals(fsc._expectations, {u'line.###.bmp': (1, 12, 1), u'# Write30.png': (1, 6, 1)})
+            missing = fsc.processdir(DIRS['normal'])
+            self.assertEquals([f for f in missing[DIRS['normal']] if f.startswith(u'line')], 
+                              [u'line.001.bmp'] + [u'line.%03d.bmp' % i for i in range(4, 10) + [11, 12]])
+            open(path, 'w').write('line.###.bmp 12-1\n')
+            self.assertRaises(ValueError, fsc.setexpectations, path)
+        finally:
+            os.remove(path)
+            
+    def testMixedPadding(self):
+        ''' test that missing files and expectations use the padding of the sequence, not of its first file '''
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for name in [u'shot.1.exr', u'shot.02.exr', u'shot.0002.exr', u'shot.0005.exr', 
+                         u'beauty.1.exr', u'beauty.1001.exr', u'beauty.1003.exr']:
+                open(os.path.join(tmpdir, name), 'w').close()
+            fsc = FileSequenceChecker()
+            missing = fsc.processdir(tmpdir)
+            self.assertEquals([f for f in missing[tmpdir] if f.startswith(u'shot')], 
+                              [u'shot.0003.exr', u'shot.0004.exr'])
+            self.assertEquals(sorted(fsc.badpadding[tmpdir]), [u'shot.02.exr', u'shot.1.exr'])
+            sequences = dict((sequence, padding) for _dir, sequence, padding, _first, _last, _gaps, _dups, 
+                             _badpadding, _badsize in fsc.iter_sequences(tmpdir))
+            self.assertEquals(sequences[u'shot.####.exr'], 4)
+            fsc.setexpectations({u'beauty.####.exr': (1001, 1004)})
+            self.assertEquals(list(fsc.processdir(tmpdir)[tmpdir])[:2], [u'beauty.1002.exr', u'beauty.1004.exr'])
+        finally:
+            shutil.rmtree(tmpdir)
+            
+
+class TestFileSequenceCheckerStep(unittest.TestCase):
+    ''' test cases for file sequences with only every Nth frame '''
+    
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for i in [1, 3, 5, 9, 11]:
+            open(os.path.join(self.tmpdir, u'twos.%04d.exr' % i), 'w').close()
+        for i in [10, 40]:
+            open(os.path.join(self.tmpdir, u'pair.%04d.exr' % i), 'w').close()
+            
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        
+    def missing(self, fsc):
+        return list(fsc.processdir(self.tmpdir)[self.tmpdir])
+        
+    def testNoStep(self):
+        ''' test that without a step every missing number is reported '''
+        self.assertEquals(len(self.missing(FileSequenceChecker())), 29 + 6)
+        
+    def testFixedStep(self):
+        ''' test that a fixed step applies to all sequences '''
+        fsc = FileSequenceChecker()
+        fsc.setstep(2)
+        missing = self.missing(fsc)
+        self.assertEquals(missing[-1], u'twos.0007.exr')
+        self.assertEquals(len(missing), 14 + 1)
+        fsc = FileSequenceChecker(end=8)
+        fsc.setstep(2)
+        self.assertEquals(self.missing(fsc), [u'twos.0007.exr'])
+        
+    def testAutoStep(self):
+        ''' test that the step is detected per sequence from 3 or more files '''
+        fsc = FileSequenceChecker()
+        fsc.setstep('auto')
+        missing = fsc.processdir(self.tmpdir)[self.tmpdir]
+        self.assertEquals([(gap.prefix, gap.rangestring) for gap in missing.gaps], 
+                          [(u'pair.', u'0011-0039'), (u'twos.', u'0007')])
+        
+    def testInvalidStep(self):
+        ''' test that invalid steps are rejected '''
+        fsc = FileSequenceChecker()
+        for step in [0, -2, 'twos', 1.5]:
+            self.assertRaises(ValueError, fsc.setstep, step)
+            
+
+class TestFileSequenceCheckerSharding(unittest.TestCase):
+    ''' test cases for processing a tree in shards and merging the results '''
+    
+    def testShardsCoverTreeOnce(self):
+        ''' test that together the shards process every directory exactly once '''
+        full = FileSequenceChecker(recursive=True)
+        full.processdir(u'data')
+        for workers in [None, 2]:
+            dircontents = {}
+            missing = {}
+            for index in range(3):
+                fsc = FileSequenceChecker(recursive=True, workers=workers)
+                fsc.setshard((index, 3))
+                fsc.processdir(u'data')
+                self.assertFalse(set(dircontents) & set(fsc._dircontents))
+                dircontents.update(fsc._dircontents)
+                missing.update(fsc._missing)
+            self.assertEquals(dircontents, full._dircontents)
+            self.assertEquals(missing, full._missing)
+            
+    def testMergedShardsEqualFullRun(self):
+        ''' test that merging the partial results of all shards gives the full report '''
+        def jsonl(fsc):
+            stream = StringIO()
+            writer = checkfileseq._JSONLinesWriter(stream)
+            for record in fsc.iter_sequences(u'data'):
+                writer.write(checkfileseq._make_record(*record))
+            stream.seek(0)
+            return stream
+        partials = []
+        for index in range(4):
+            fsc = FileSequenceChecker(recursive=True)
+            fsc.setshard((index, 4))
+            partials.extend(checkfileseq._read_records(jsonl(fsc)))
+        full = list(checkfileseq._read_records(jsonl(FileSequenceChecker(recursive=True))))
+        self.assertEquals(checkfileseq._merge_records(partials), checkfileseq._merge_records(full))
+        self.assertEquals(len(checkfileseq._merge_records(partials + full)), len(full))
+        
+    def testInvalidShards(self):
+        ''' test that invalid shards are rejected '''
+        fsc = FileSequenceChecker()
+        for shard in [(3, 3), (-1, 2), (0, 0), ('0', 2)]:
+            self.assertRaises(ValueError, fsc.setshard, shard)
+        self.assertRaises(ValueError, list, checkfileseq._read_records(StringIO('{"dir": "a"}\n')))
+        
+
+class TestFileSequenceCheckerParallel(unittest.TestCase):
+    ''' test cases for the parallel directory scanning code path '''
+    
+    def testParallelOutputEqualsSerialOutput(self):
+        ''' test that scanning with workers gives the same result as scanning serially '''
+        serial = FileSequenceChecker(recursive=True)
+        parallel = FileSequenceChecker(recursive=True, workers=3)
+        self.assertEquals(parallel.processdir(u'data'), serial.processdir(u'data'))
+        self.assertEquals(parallel._dircontents, serial._dircontents)
+        self.assertEquals(parallel.totalprocessed, serial.totalprocessed)
+        
+    def testParallelRestrictedOutputEqualsSerialOutput(self):
+        ''' test that parallel scanning respects the range restriction like the serial code path '''
+        serial = FileSequenceChecker(0, 10, recursive=True)
+        parallel = FileSequenceChecker(0, 10, recursive=True, workers=2)
+        self.assertEquals(parallel.processdir(u'data'), serial.processdir(u'data'))
+        
+    def testParallelSyscallCountEqualsSerialCount(self):
+        ''' test that the stat calls issued by worker processes are counted '''
+        serial = FileSequenceChecker(recursive=True)
+        parallel = FileSequenceChecker(recursive=True, workers=3)
+        for fsc in (serial, parallel):
+            fsc.setsizecheck(0.5)
+            fsc.processdir(u'data')
+        self.assert_(serial.lastsyscallcount > serial.totalprocessed)
+        self.assertEquals(parallel.lastsyscallcount, serial.lastsyscallcount)
+        self.assertEquals(parallel.lastresult.syscallcount, serial.lastsyscallcount)
+        
+
+class TestScanStats(unittest.TestCase):
+    ''' test cases for collecting per-phase timings and counts '''
+    
+    def testStatsAreOffByDefault(self):
+        ''' test that no stats are collected unless enabled '''
+        fsc = FileSequenceChecker(recursive=True)
+        fsc.processdir(u'data')
+        self.assertEquals(fsc.laststats, None)
+        fsc.setstats()
+        fsc.processdir(u'data')
+        self.assert_(isinstance(fsc.laststats, ScanStats))
+        fsc.setstats(False)
+        fsc.processdir(u'data')
+        self.assertEquals(fsc.laststats, None)
+        
+    def testCounts(self):
+        ''' test that serial and parallel scanning count the same and each run starts over '''
+        counts = []
+        for workers in [None, 2]:
+            fsc = FileSequenceChecker(recursive=True, workers=workers)
+            fsc.setfileexcludes([u'thumbs.db', u'desktop.ini'])
+            fsc.setstats()
+            for _i in xrange(2):
+                fsc.processdir(u'data')
+            stats = fsc.laststats
+            self.assertEquals(stats.counts['dirs'], len(fsc._dircontents))
+            self.assertEquals(stats.counts['files'] - stats.counts['excluded'] - stats.counts['unsplittable'], 
+                              fsc.totalprocessed)
+            self.assert_(stats.counts['excluded'] > 0)
+            self.assert_(min(stats.times.values()) >= 0)
+            self.assertEquals(stats.elapsed, fsc.lastexectime)
+            counts.append(stats.counts)
+        self.assertEquals(counts[0], counts[1])
+        list(fsc.iter_sequences(DIRS['reverse']))
+        self.assertEquals(fsc.laststats.counts['sequences'], 3)
+        
+    def testReport(self):
+        ''' test that the report lists all phases and counts '''
+        stats = ScanStats()
+        other = ScanStats()
+        other.times['split'] = 0.5
+        other.counts['files'] = 100
+        stats.update(other)
+        stats.update(other)
+        stats.elapsed = 2.0
+        self.assertEquals(stats.throughput, 100.0)
+        report = stats.report()
+        for line in [u'split          1.0000   50.0%', u'files: 200', u'throughput: 100.0 files/s']:
+            self.assert_(line in report, line)
+        
+
+class TestScanCache(unittest.TestCase):
+    ''' test cases for reusing scan results from a persistent cache '''
+    
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.seqdir = os.path.join(self.tmpdir, u'shot')
+        os.mkdir(self.seqdir)
+        for i in [1, 2, 5]:
+            open(os.path.join(self.seqdir, u'shot.%04d.exr' % i), 'w').close()
+        self.touch(self.seqdir, 1000)
+        self.touch(self.tmpdir, 1000)
+        fd, self.cachepath = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        os.remove(self.cachepath)
+        
+    def touch(self, path, age):
+        ''' set the modification time of path to age seconds ago '''
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        
+    def testUnmodifiedDirectoriesAreReused(self):
+        ''' test that a second scan reuses the results of unmodified directories '''
+        expected = {self.seqdir: [u'shot.0003.exr', u'shot.0004.exr']}
+        fsc = FileSequenceChecker(recursive=True)
+        fsc.setscancache(self.cachepath)
+        self.assertEquals(fsc.processdir(self.seqdir), expected)
+        self.assertEquals(fsc._cache.hits, 0)
+        fsc2 = FileSequenceChecker(recursive=True)
+        fsc2.setscancache(ScanCache(self.cachepath))
+        self.assertEquals(fsc2.processdir(self.seqdir), expected)
+        self.assertEquals(fsc2._cache.hits, 1)
+        self.assertEquals(fsc2.totalprocessed, 3)
+        
+    def testModifiedDirectoriesAreRescanned(self):
+        ''' test that directories are scanned again once they are modified '''
+        for workers in [None, 2]:
+            fsc = FileSequenceChecker(recursive=True, workers=workers)
+            fsc.setscancache(self.cachepath)
+            fsc.processdir(self.tmpdir)
+            open(os.path.join(self.seqdir, u'shot.0003.exr'), 'w').close()
+            self.touch(self.seqdir, 500 + (workers or 0))
+            fsc2 = FileSequenceChecker(recursive=True, workers=workers)
+            fsc2.setscancache(self.cachepath)
+            self.assertEquals(fsc2.processdir(self.tmpdir), {self.seqdir: [u'shot.0004.exr']})
+            self.assertEquals(fsc2._cache.hits, 1, 'only the unmodified top dir should be reused')
+            os.remove(os.path.join(self.seqdir, u'shot.0003.exr'))
+            self.touch(self.seqdir, 1000)
+            
+    def testCachedContentsEqualScannedContents(self):
+        ''' test that file lists come back from the cache unchanged, whether stored as frame sets or not '''
+        datadir = os.path.join(self.tmpdir, u'data')
+        shutil.copytree(u'data', datadir)
+        for root, _dirs, _files in os.walk(datadir):
+            self.touch(root, 1000)
+        fsc = FileSequenceChecker(recursive=True)
+        fsc.setscancache(self.cachepath)
+        expected = fsc.processdir(datadir)
+        fsc2 = FileSequenceChecker(recursive=True)
+        fsc2.setscancache(self.cachepath)
+        self.assertEquals(fsc2.processdir(datadir), expected)
+        self.assertEquals(fsc2._cache.hits, len(expected.dircontents))
+        self.assertEquals(fsc2._dircontents, expected.dircontents)
+        packed = checkfileseq._pack_files(expected.dircontents[datadir + u'/reverse_order'])
+        self.assertEquals([isinstance(sequence, tuple) for sequence in packed], [True, True, True])
+        
+    def testSettingsArePartOfTheKey(self):
+        ''' test that cached results aren't used for scans with different settings '''
+        fsc = FileSequenceChecker()
+        fsc.setscancache(self.cachepath)
+        fsc.processdir(self.seqdir)
+        fsc2 = FileSequenceChecker(0, 3)
+        fsc2.setscancache(self.cachepath)
+        self.assertEquals(fsc2.processdir(self.seqdir), {self.seqdir: [u'shot.0003.exr']})
+        self.assertEquals(fsc2._cache.hits, 0)
+
+
+class TestSequenceWatcher(unittest.TestCase):
+    ''' test cases for incrementally updated missing files in watch mode '''
+    
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for i in [1, 2, 6]:
+            self.add(u'shot.%04d.exr' % i)
+        self.watcher = SequenceWatcher(FileSequenceChecker(recursive=True), self.tmpdir, 0, polling=True)
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        
+    def add(self, filename):
+        open(os.path.join(self.tmpdir, filename), 'w').close()
+        
+    def changes(self, changes):
+        ''' convert changes to sign and file names '''
+        return [(sign, list(gap.filenames())) for _dir, sign, gap in changes]
+    
+    def testUnsupportedSettings(self):
+        ''' test that settings the in-memory sequence state can't follow are rejected '''
+        for setting, value in [('setstep', 2), ('setstep', 'auto'), ('setsizecheck', 0.5), 
+                               ('setexpectations', {u'shot.####.exr': (1, 10, 1)})]:
+            fsc = FileSequenceChecker()
+            getattr(fsc, setting)(value)
+            self.assertRaises(ValueError, SequenceWatcher, fsc, self.tmpdir, 0, True)
+        fsc = FileSequenceChecker()
+        fsc.setstep(1)
+        SequenceWatcher(fsc, self.tmpdir, 0, polling=True)
+        
+    def testStartReportsMissingFiles(self):
+        ''' test that starting reports the currently missing files '''
+        self.assertEquals(self.changes(self.watcher.start()), 
+                          [('+', [u'shot.0003.exr', u'shot.0004.exr', u'shot.0005.exr'])])
+        
+    def testAddedFilesAreReportedAsDeltas(self):
+        ''' test that only the changes caused by added and removed files are reported '''
+        self.watcher.start()
+        self.add(u'shot.0004.exr')
+        self.add(u'shot.0008.exr')
+        self.assertEquals(sorted(self.changes(self.watcher.poll())), 
+                          [('+', [u'shot.0007.exr']), ('-', [u'shot.0004.exr'])])
+        self.assertEquals(self.watcher.poll(), [])
+        os.remove(os.path.join(self.tmpdir, u'shot.0008.exr'))
+        self.assertEquals(self.changes(self.watcher.poll()), [('-', [u'shot.0007.exr'])])
+        os.remove(os.path.join(self.tmpdir, u'shot.0002.exr'))
+        self.assertEquals(self.changes(self.watcher.poll()), [('+', [u'shot.0002.exr'])])
+        
+    def testRemovingOneOfTwoDuplicates(self):
+        ''' test that a frame only goes missing when all of its duplicate files are removed '''
+        self.add(u'shot.2.exr')
+        self.watcher.start()
+        os.remove(os.path.join(self.tmpdir, u'shot.2.exr'))
+        self.assertEquals(self.watcher.poll(), [])
+        self.add(u'shot.2.exr')
+        self.assertEquals(self.watcher.poll(), [])
+        os.remove(os.path.join(self.tmpdir, u'shot.0002.exr'))
+        self.assertEquals(self.watcher.poll(), [])
+        os.remove(os.path.join(self.tmpdir, u'shot.2.exr'))
+        self.assertEquals(self.changes(self.watcher.poll()), [('+', [u'shot.0002.exr'])])
+        
+    def testNewSubDirectoriesAreWatched(self):
+        ''' test that sub directories created while watching are picked up '''
+        self.watcher.start()
+        subdir = os.path.join(self.tmpdir, u'sub')
+        os.mkdir(subdir)
+        for i in [1, 3]:
+            self.add(os.path.join(u'sub', u'frame_%02d.png' % i))
+        self.assertEquals([(bdir, sign, list(gap.filenames())) for bdir, sign, gap in self.watcher.poll()], 
+                          [(subdir, '+', [u'frame_02.png'])])
+        
 class TestFileSequenceCheckerCreation(unittest.TestCase):
     ''' test cases for FileSequenceChecer creation with default and non-default arguments '''
     
@@ -524,6 +1424,16 @@ class TestFileSequenceCheckerBogusCreation(unittest.TestCase):
         ''' test creation with invalid recursive values '''
         self.assertRaises(ValueError, FileSequenceChecker, recursive=None)
         self.assertRaises(ValueError, FileSequenceChecker, recursive=dict())
+        
+    def testInvalidWorkersValues(self):
+        ''' test creation with invalid workers values '''
+        self.assertRaises(ValueError, FileSequenceChecker, workers=-2)
+        self.assertRaises(ValueError, FileSequenceChecker, workers='4')
+        
+    def testInvalidBackendValues(self):
+        ''' test creation with invalid backend values '''
+        self.assertRaises(ValueError, FileSequenceChecker, backend='fortran')
+        self.assertRaises(ValueError, FileSequenceChecker, backend=None)
 
 class TestFileSequenceCheckerState(unittest.TestCase):
     ''' test cases for testing internal state '''
@@ -539,8 +1449,52 @@ class TestFileSequenceCheckerState(unittest.TestCase):
         self.assertTrue(fsc, 'fsc should now equal True because len(fsc) will return != 0 at this point')
         self.assertEquals(fsc.totalfiles, 9)
         self.assertEquals(fsc.totaldirs, 1)
+        self.assert_('missing = 1 dir(s)/9 file(s)' in str(fsc))
         self.assertEquals(len(fsc[self.dirs['reverse']]), fsc.totalfiles)
         
+    def testSyscallCount(self):
+        ''' test that no more than one stat call per directory entry is issued '''
+        fsc = FileSequenceChecker()
+        self.assertEquals(fsc.lastsyscallcount, 0)
+        fsc.processdir(self.dirs['reverse'])
+        numentries = len(os.listdir(self.dirs['reverse']))
+        # exists + isdir for the inpath, one listing and at most one stat per entry 
+        self.assertTrue(0 < fsc.lastsyscallcount <= 3 + numentries)
+        fsc.processdir(self.dirs['reverse'])
+        self.assertTrue(0 < fsc.lastsyscallcount <= 3 + numentries, 'count should be per run')
+        
+    def testResultsArePerRun(self):
+        ''' test that each processdir call returns its own results and nothing piles up in the checker '''
+        fsc = FileSequenceChecker(recursive=True)
+        first = fsc.processdir(u'data')
+        self.assert_(isinstance(first, ScanResult))
+        self.assert_(fsc.lastresult is first)
+        totalprocessed = fsc.totalprocessed
+        self.assertEquals(first.totalprocessed, totalprocessed)
+        self.assertEquals((first.totalfiles, first.totaldirs), (fsc.totalfiles, fsc.totaldirs))
+        self.assertEquals(first.exectime, fsc.lastexectime)
+        second = fsc.processdir(u'data')
+        self.assertFalse(second is first)
+        self.assertEquals(second, first)
+        self.assertEquals(fsc.totalprocessed, totalprocessed, 'totalprocessed should be per run')
+        third = fsc.processdir(self.dirs['reverse'])
+        self.assertEquals(third.keys(), [self.dirs['reverse']])
+        self.assertEquals(fsc.totaldirs, 1)
+        self.assertEquals(fsc._dircontents.keys(), [self.dirs['reverse']])
+        self.assertEquals(first.totalprocessed, totalprocessed, 'earlier results should stay untouched')
+        
+    def testPicklingDropsResults(self):
+        ''' test that results of earlier runs aren't pickled along with the checker, e.g. for worker processes '''
+        fsc = FileSequenceChecker(recursive=True)
+        fsc.processdir(u'data')
+        copy = cPickle.loads(cPickle.dumps(fsc, cPickle.HIGHEST_PROTOCOL))
+        self.assert_(copy.lastresult is None)
+        self.assertEquals(copy._missing, {})
+        self.assertEquals(copy._dircontents, {})
+        self.assertEquals(copy._duplicates, {})
+        self.assert_(fsc.lastresult is not None and fsc._dircontents, 'the original should be untouched')
+        self.assertEquals(copy.processdir(u'data'), fsc.lastresult)
+        
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file